@@ -57,8 +57,6 @@ with open(dag_fname, 'w') as dag_f:
             memreq = '16GB'
         elif '_180d' in wxcd_var:
             memreq = '16GB'
-        elif '_365d' in wxcd_var:
-            memreq = '32GB'
         else:
             memreq = '8GB'
         for year in years:
@@ -42,7 +42,7 @@ md_files = ['README.md']
 main_dirs = ['data', 'docs', 'htcondor', 'source', 'tools']
 #
 scripts = ['process_NCEI_00.py', 'process_NCEI_01.py',
-           'process_NCEI_02a.py', 'process_NCEI_02b.py',
+           'process_NCEI_02a.py', 'process_NCEI_02b.py', 'process_NCEI_03.py',
            'process_NCEI_03_chill_d.py', 'process_NCEI_03_chill_dd.py',
            'process_NCEI_03_grow_dd.py', 'process_NCEI_03_grow_dd_base0.py',
            'process_NCEI_03_prcp_03d.py', 'process_NCEI_03_prcp_07d.py',
@@ -72,15 +72,17 @@ scripts = ['process_NCEI_00.py', 'process_NCEI_01.py',
            'process_NCEI_12.py', 'process_NCEI_13.py', 'process_NCEI_14.py',
            'process_NCEI_15.py']
 #
-modules = ['Date_Convert.py', 'Interpolation.py', 'Plots.py',
-           'process_NCEI_03_aux.py', 'Read_Header_Files.py', 'Stats.py',
-           'Teleconnections.py', 'UTM_Geo_Convert.py']
+modules = ['Date_Convert.py', 'Grid_Store.py', 'Interpolation.py', 'Plots.py',
+           'process_NCEI_00_aux.py', 'process_NCEI_03_aux.py',
+           'Provenance.py', 'Read_Header_Files.py', 'Stats.py',
+           'Storage_Policy.py', 'Teleconnections.py', 'UTM_Geo_Convert.py']
 #
 htcondor = ['process_NCEI_00.sh', 'process_NCEI_00.sub',
             'process_NCEI_01.sh', 'process_NCEI_01.sub',
             'process_NCEI_02a.sh', 'process_NCEI_02a.sub',
             'process_NCEI_02b.sh', 'process_NCEI_02b.sub',
-            'process_NCEI_02b_dag.sub', 'process_NCEI_03_chill_d.sh',
+            'process_NCEI_02b_dag.sub', 'process_NCEI_03.sh',
+            'process_NCEI_03.sub', 'process_NCEI_03_chill_d.sh',
             'process_NCEI_03_chill_dd.sh', 'process_NCEI_03_dag_gen.py',
             'process_NCEI_03_generic.sub', 'process_NCEI_03_grow_dd.sh',
             'process_NCEI_03_grow_dd_base0.sh', 'process_NCEI_03_prcp_03d.sh',
@@ -115,8 +117,8 @@ htcondor = ['process_NCEI_00.sh', 'process_NCEI_00.sub',
 #
 dependencies = ['os', 'sys', 'datetime', 'glob', 'numpy', 'pandas', 'h5py',
                 'matplotlib', 'matplotlib.pyplot', 'gdal', 'osgeo.osr',
-                'scipy.interpolate', 'scipy.ndimage', 'scipy.stats',
-                'mpl_toolkits', 'mpl_toolkits.basemap', 'pickle']
+                'scipy.interpolate', 'scipy.ndimage', 'scipy.spatial',
+                'scipy.stats', 'mpl_toolkits', 'mpl_toolkits.basemap', 'pickle']
 #
 gz_data_files = ['EPA_L4_Ecoregions_WLS_UTM15N.bil.gz',
                  'NCEI_WLS_19830101-20151031.csv.gz',
@@ -140,7 +142,8 @@ data_files = ['EPA_L4_Ecoregions_WLS_polygonIDs.txt',
 doc_files = ['How_to_get_NCEI_GHCND_data.txt',
              'NCEI_GHCND_documentation.pdf']
 #
-tools = ['query_NCEI_grids.py', 'orientation_maps.py']
+tools = ['query_NCEI_grids.py', 'orientation_maps.py',
+         'benchmark_storage.py', 'compact_NCEI_grids.py']
 #
 add_dirs = ['analyses', 'grids', 'images']
 #
@@ -332,6 +335,14 @@ except ImportError:
     message('- essential python dependency \'scipy.ndimage\' is not available')
     err += 1
 #
+try:
+    import scipy.spatial
+    message('- python dependency \'scipy.spatial\' is available')
+except ImportError:
+    message('- essential python dependency \'scipy.spatial\' is not \
+            available')
+    err += 1
+#
 try:
     import scipy.stats
     message('- python dependency \'scipy.stats\' is available')
@@ -0,0 +1,207 @@
+"""
+Python module 'Grid_Store.py'
+by Matthew Garcia, PhD student
+Dept. of Forest and Wildlife Ecology
+University of Wisconsin - Madison
+matt.e.garcia@gmail.com
+
+Copyright (C) 2015-2016 by Matthew Garcia
+Licensed Gnu GPL v3; see 'LICENSE_GnuGPLv3.txt' for complete terms
+Send questions, bug reports, any related requests to matt.e.garcia@gmail.com
+See also 'README.md', 'DISCLAIMER.txt', 'CITATION.txt', 'ACKNOWLEDGEMENTS.txt'
+Treat others as you would be treated. Pay it forward. Valar dohaeris.
+
+PURPOSE: Annual grid store, holding each daily grid variable of one year as
+         a chunked (ndays, nrows, ncols) dataset with a date index, in place
+         of one daily grid file per date; and a compatibility reader that
+         gives the same per-date view of either layout
+
+DEPENDENCIES: h5py, numpy
+              'Storage_Policy' and 'Provenance' modules have their own
+                requirements
+
+USAGE: insert 'from Grid_Store import *' line near head of script, then
+       (for example)
+        grids = read_day_grids(path, 19840321, ['chill_d', 'grow_dd'])
+        stns = read_day_stns(path, 19840321, ['chill_d_stns'])
+
+NOTES: The annual store 'grids/[YYYY]_NCEI_grid_store.h5' has the grid
+       definition ('grid/') and station identifiers ('stn_id') once, the
+       date index 'dates', one dataset per grid variable (row i of each is
+       the grid for dates[i], NaN if not written), and each date's station
+       lists in 'stns/[YYYYMMDD]/'
+       The grid variables are chunked one date per chunk (the 'map' layout
+       of Storage_Policy, since every stage reads or writes whole daily
+       grids) unless NCEI_STORAGE_LAYOUT=series is set, and may be stored
+       as scaled int16 (NCEI_STORAGE_QUANTIZE=1); the readers return float32
+       grids either way
+       Without a store for a year, the readers use the daily files
+       'grids/[YYYYMMDD]_NCEI_grids_2.h5'
+
+INPUT: grids and station lists provided by calling script
+
+OUTPUT: grids and station lists returned to calling script
+"""
+
+
+import os
+import glob
+import h5py as hdf
+import numpy as np
+from Storage_Policy import create_grid, encode_grid, decode_grid
+from Provenance import set_provenance
+
+
+# annual grid stores opened for reading, by file name, with their date
+# index (or None where a year has no store)
+open_stores = {}
+
+
+def grid_store_fname(path, year):
+    return '%s/%d_NCEI_grid_store.h5' % (path, year)
+
+
+def grid_store_init(h5file, h5dayfile):
+    """
+    establishes an annual grid store in (open, empty) h5file with the grid
+    definition and station identifiers of a daily grid file
+    """
+    set_provenance(h5file, 'daily grids by date')
+    h5dayfile.copy('grid', h5file)
+    if 'stns/stn_id' in h5dayfile:
+        h5file.create_dataset('stn_id', data=np.copy(h5dayfile['stns/stn_id']))
+    h5file.create_dataset('dates', shape=(0,), maxshape=(None,),
+                          dtype=np.int64)
+    return
+
+
+def grid_store_index(h5file, date):
+    """
+    returns the row of date in the store's date index, adding the date to
+    the end of the index if it is new
+    """
+    dates = h5file['dates']
+    rows = np.where(dates[:] == date)[0]
+    if len(rows) > 0:
+        return int(rows[0])
+    ndates = dates.shape[0]
+    dates.resize((ndates + 1,))
+    dates[ndates] = date
+    return ndates
+
+
+def grid_store_write(h5file, date, grids, stns):
+    """
+    writes one date's grids (dict of name: 2D array) and station lists
+    (dict of name: list) to the store
+    """
+    i = grid_store_index(h5file, date)
+    for name in sorted(grids.keys()):
+        if name not in h5file:
+            nrows, ncols = np.shape(grids[name])
+            create_grid(h5file, name, shape=(0, nrows, ncols),
+                        maxshape=(None, nrows, ncols))
+        dset = h5file[name]
+        if dset.shape[0] <= i:
+            dset.resize(i + 1, axis=0)
+        dset[i, :, :] = encode_grid(dset, grids[name])
+    for name in sorted(stns.keys()):
+        datapath = 'stns/%d/%s' % (date, name)
+        if datapath in h5file:
+            del h5file[datapath]
+        h5file.create_dataset(datapath, data=stns[name])
+    set_provenance(h5file, 'daily grids for %d' % date)
+    return
+
+
+def open_grid_store(path, year):
+    """
+    returns the open annual grid store for year and its date index (kept
+    open for later calls), or None if there is no store for that year
+    """
+    fname = grid_store_fname(path, year)
+    if fname not in open_stores:
+        if os.path.isfile(fname):
+            h5file = hdf.File(fname, 'r')
+            open_stores[fname] = (h5file, np.copy(h5file['dates']))
+        else:
+            open_stores[fname] = None
+    return open_stores[fname]
+
+
+def close_grid_stores():
+    for fname in open_stores.keys():
+        if open_stores[fname] is not None:
+            open_stores[fname][0].close()
+        del open_stores[fname]
+    return
+
+
+def grid_store_row(store, date):
+    rows = np.where(store[1] == date)[0]
+    if len(rows) == 0:
+        raise KeyError('no grids for %d in %s' % (date, store[0].filename))
+    return int(rows[0])
+
+
+def read_day_grids(path, date, names, cell=0):
+    """
+    returns a dict of the named grids for one date (or, with cell given as
+    (row, col), of their values in that grid cell) from the annual grid
+    store if there is one, otherwise from the daily grid file
+    """
+    grids = {}
+    store = open_grid_store(path, date // 10000)
+    if store is not None:
+        i = grid_store_row(store, date)
+        for name in names:
+            dset = store[0][name]
+            if cell:
+                grids[name] = decode_grid(dset, dset[i, cell[0], cell[1]])
+            else:
+                grids[name] = decode_grid(dset, dset[i, :, :])
+    else:
+        with hdf.File('%s/%d_NCEI_grids_2.h5' % (path, date), 'r') as h5file:
+            for name in names:
+                dset = h5file[name]
+                if cell:
+                    grids[name] = decode_grid(dset, dset[cell[0], cell[1]])
+                else:
+                    grids[name] = decode_grid(dset, np.copy(dset))
+    return grids
+
+
+def read_day_stns(path, date, names):
+    """
+    returns a dict of the named station lists for one date, from the annual
+    grid store if there is one, otherwise from the daily grid file
+    """
+    stns = {}
+    store = open_grid_store(path, date // 10000)
+    if store is not None:
+        grid_store_row(store, date)
+        for name in names:
+            stns[name] = np.copy(store[0]['stns/%d/%s' % (date, name)])
+    else:
+        with hdf.File('%s/%d_NCEI_grids_2.h5' % (path, date), 'r') as h5file:
+            for name in names:
+                stns[name] = np.copy(h5file['stns/%s' % name])
+    return stns
+
+
+def have_day_grids(path, date):
+    store = open_grid_store(path, date // 10000)
+    if store is not None:
+        return date in store[1]
+    return os.path.isfile('%s/%d_NCEI_grids_2.h5' % (path, date))
+
+
+def find_grid_files(path):
+    """
+    returns the annual grid stores and daily grid files in path, either of
+    which has the grid definition ('grid/')
+    """
+    return sorted(glob.glob('%s/*_NCEI_grid_store.h5' % path)) + \
+        sorted(glob.glob('%s/*_NCEI_grids_2.h5' % path))
+
+# end Grid_Store.py
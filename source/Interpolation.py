@@ -27,8 +27,9 @@ OUTPUT: grids returned to calling script
 """
 
 
+import hashlib
 import numpy
-from scipy import interpolate
+from scipy import interpolate, linalg, sparse, spatial
 
 
 def distance_matrix_idw(x0, y0, x1, y1):
@@ -53,6 +54,145 @@ def simple_idw(x, y, z, xi, yi, exp):
     return zi
 
 
+def kdw_weights(x, y, xi, yi, exp, k=12, radius=0, nchunk=65536):
+    """
+    sparse (target points x stations) inverse-distance weights limited to
+    the k nearest stations (within radius, if given) of each target point,
+    found via a k-d tree
+    - target points are processed nchunk at a time, so memory use does not
+      grow with the size of the target grid
+    - a target point at a station location takes that station's value
+    - a target point with no station within radius takes the value of its
+      nearest station
+    """
+    tree = spatial.cKDTree(numpy.vstack((x, y)).T.astype(numpy.float64))
+    nstns = len(x)
+    k = min(k, nstns)
+    if radius > 0:
+        bound = radius
+    else:
+        bound = numpy.inf
+    w_data = []
+    w_cols = []
+    for i0 in range(0, len(xi), nchunk):
+        i1 = min(i0 + nchunk, len(xi))
+        pts = numpy.vstack((xi[i0:i1], yi[i0:i1])).T.astype(numpy.float64)
+        dist, idx = tree.query(pts, k=k, distance_upper_bound=bound)
+        if k == 1:
+            dist = dist.reshape(-1, 1)
+            idx = idx.reshape(-1, 1)
+        valid = numpy.isfinite(dist)
+        idx = numpy.where(valid, idx, 0)
+        # weights are 1 / distance^exp for neighbors found
+        with numpy.errstate(divide='ignore'):
+            weights = numpy.where(valid, 1.0 / dist**exp, 0.0)
+        # target points at a station location
+        exact = dist[:, 0] == 0.0
+        weights[exact, :] = 0.0
+        weights[exact, 0] = 1.0
+        # target points with no station within radius
+        empty = ~valid[:, 0]
+        if numpy.any(empty):
+            idx[empty, 0] = tree.query(pts[empty], k=1)[1]
+            weights[empty, 0] = 1.0
+        # normalize weights
+        weights /= weights.sum(axis=1).reshape(-1, 1)
+        w_data.append(weights)
+        w_cols.append(idx)
+    w_data = numpy.concatenate(w_data, axis=0)
+    w_cols = numpy.concatenate(w_cols, axis=0)
+    indptr = numpy.arange(0, w_data.size + 1, k)
+    weights = sparse.csr_matrix((w_data.ravel(), w_cols.ravel(), indptr),
+                                shape=(len(xi), nstns))
+    weights.eliminate_zeros()
+    return weights
+
+
+def kdtree_idw(x, y, z, xi, yi, exp, k=12, radius=0, nchunk=65536):
+    weights = kdw_weights(x, y, xi, yi, exp, k, radius, nchunk)
+    zi = weights.dot(numpy.asarray(z, dtype=numpy.float64))
+    return zi
+
+
+def grid_hash(xi, yi):
+    """
+    identifies a target grid by its point coordinates
+    """
+    xi = numpy.ascontiguousarray(xi, dtype=numpy.float64)
+    yi = numpy.ascontiguousarray(yi, dtype=numpy.float64)
+    grid_id = hashlib.sha1(str(xi.shape).encode())
+    grid_id.update(xi.tobytes())
+    grid_id.update(yi.tobytes())
+    return grid_id.hexdigest()[:16]
+
+
+def stn_set_order(stns, x, y):
+    """
+    sorts a station set by station id, easting, and northing, and
+    identifies it by a hash of that sorted (id, easting, northing) list
+    returns the sort order and the hash
+    """
+    order = numpy.lexsort((y, x, stns))
+    stn_id = hashlib.sha1(numpy.asarray(stns)[order].astype('S').tobytes())
+    stn_id.update(numpy.asarray(x, dtype=numpy.float64)[order].tobytes())
+    stn_id.update(numpy.asarray(y, dtype=numpy.float64)[order].tobytes())
+    return order, stn_id.hexdigest()
+
+
+def operator_read(h5file, gname):
+    """
+    extracts a stored interpolation operator (all datasets in group gname)
+    from an open HDF5 weights file, or returns 0 if it is not stored
+    """
+    if not h5file or gname not in h5file:
+        return 0
+    op = {}
+    for key in h5file[gname].keys():
+        op[key] = numpy.copy(h5file['%s/%s' % (gname, key)])
+    return op
+
+
+def operator_write(h5file, gname, op):
+    """
+    saves an interpolation operator (dict of arrays) as group gname in an
+    open HDF5 weights file
+    """
+    if not h5file:
+        return
+    if gname in h5file:
+        del h5file[gname]
+    for key in op.keys():
+        h5file.create_dataset('%s/%s' % (gname, key), data=op[key],
+                              compression='gzip')
+    return
+
+
+def cached_kdw(stns, x, y, z, xi, yi, exp, h5file, grid_id, k=12, radius=0):
+    """
+    KDW interpolation (as kdtree_idw) as one sparse matrix-vector product,
+    with the sparse weights for each station set stored in (and reused
+    from) an open HDF5 weights file under 'kdw/[grid_id]/[parameters]/
+    [station set hash]'
+    - z may be (stations x m) for m value sets on the same stations, in
+      which case the result is (target points x m)
+    """
+    order, stn_id = stn_set_order(stns, x, y)
+    gname = 'kdw/%s/exp%d_k%d_r%d/%s' % (grid_id, exp, k, radius, stn_id)
+    op = operator_read(h5file, gname)
+    if op:
+        weights = sparse.csr_matrix((op['data'], op['indices'], op['indptr']),
+                                    shape=tuple(op['shape']))
+    else:
+        weights = kdw_weights(numpy.asarray(x)[order],
+                              numpy.asarray(y)[order], xi, yi, exp, k, radius)
+        operator_write(h5file, gname,
+                       {'data': weights.data, 'indices': weights.indices,
+                        'indptr': weights.indptr,
+                        'shape': numpy.array(weights.shape)})
+    zi = weights.dot(numpy.asarray(z, dtype=numpy.float64)[order])
+    return zi
+
+
 def scipy_griddata(x, y, z, xi, yi, grid_method='cubic'):
     zi = interpolate.griddata((x, y), z, (xi, yi), method=grid_method)
     return zi
@@ -64,12 +204,108 @@ def scipy_bspline(x, y, z, xi, yi):
     return zi
 
 
-def scipy_rbf(x, y, z, xi, yi):
+def scipy_rbf(x, y, z, xi, yi, ntile=16384):
+    """
+    multiquadric RBF fitted once to the stations, then evaluated over the
+    target points ntile at a time into a float32 output of the same shape
+    as xi, so peak memory is about ntile x stations rather than the full
+    grid x stations
+    """
     interp = interpolate.Rbf(x, y, z, epsilon=2)
-    zi = interp(xi, yi)
+    zi = numpy.empty(numpy.shape(xi), dtype=numpy.float32)
+    xi_flat = numpy.ravel(xi)
+    yi_flat = numpy.ravel(yi)
+    zi_flat = zi.reshape(-1)
+    for i0 in range(0, len(xi_flat), ntile):
+        i1 = min(i0 + ntile, len(xi_flat))
+        zi_flat[i0:i1] = interp(xi_flat[i0:i1], yi_flat[i0:i1])
     return zi
 
 
+def multiquadric(r, epsilon=2):
+    return numpy.sqrt((r / epsilon)**2 + 1)
+
+
+def rbf_cache_init(max_entries=4, max_kernel_bytes=2**30, h5file=0,
+                   grid_id=''):
+    """
+    establishes a cache of RBF station configurations for cached_rbf, for
+    use with one target grid; the oldest configuration is dropped beyond
+    max_entries, and grid-evaluation kernels are kept only while their
+    total size stays within max_kernel_bytes
+    - if an open HDF5 weights file is given, factorizations are also stored
+      there under 'rbf/[grid_id]/[station set hash]' and reused from there
+    """
+    return {'keys': [], 'entries': {}, 'max_entries': max_entries,
+            'max_kernel_bytes': max_kernel_bytes, 'kernel_bytes': 0,
+            'h5file': h5file, 'grid_id': grid_id,
+            'hits': 0, 'loaded': 0, 'misses': 0}
+
+
+def cached_rbf(stns, x, y, z, xi, yi, cache, ntile=16384):
+    """
+    multiquadric RBF (as scipy_rbf) that reuses the LU factorization of the
+    system matrix, and the grid-evaluation kernel if it fits in the cache,
+    for any later call with the same station configuration (sorted station
+    ids with their eastings and northings), so that a repeated
+    configuration costs one back-substitution and one matrix-vector product
+    (only the factorization is kept in a weights file; the kernel is
+    rebuilt from the station and grid coordinates)
+    - z may hold one value per station, or be (stations x m) for m value
+      sets (e.g. days) on the same stations, solved together
+    - returns a float32 grid of the same shape as xi, or for 2D z a float32
+      block of m such grids
+    """
+    order, key = stn_set_order(stns, x, y)
+    x = numpy.asarray(x, dtype=numpy.float64)[order]
+    y = numpy.asarray(y, dtype=numpy.float64)[order]
+    z = numpy.asarray(z, dtype=numpy.float64)[order]
+    if key in cache['entries']:
+        cache['hits'] += 1
+        entry = cache['entries'][key]
+    else:
+        stn_pts = numpy.vstack((x, y)).T
+        gname = 'rbf/%s/%s' % (cache['grid_id'], key)
+        op = operator_read(cache['h5file'], gname)
+        if op:
+            cache['loaded'] += 1
+        else:
+            cache['misses'] += 1
+            op = {}
+            op['lu'], op['piv'] = linalg.lu_factor(
+                multiquadric(spatial.distance.cdist(stn_pts, stn_pts)))
+            operator_write(cache['h5file'], gname, op)
+        entry = {'stn_pts': stn_pts, 'lu': (op['lu'], op['piv'])}
+        kernel_bytes = numpy.size(xi) * len(z) * 8
+        if cache['kernel_bytes'] + kernel_bytes <= cache['max_kernel_bytes']:
+            grid_pts = numpy.vstack((numpy.ravel(xi), numpy.ravel(yi))).T
+            entry['kernel'] = multiquadric(
+                spatial.distance.cdist(grid_pts, stn_pts))
+            cache['kernel_bytes'] += kernel_bytes
+        cache['keys'].append(key)
+        cache['entries'][key] = entry
+        if len(cache['keys']) > cache['max_entries']:
+            old_entry = cache['entries'].pop(cache['keys'].pop(0))
+            if 'kernel' in old_entry:
+                cache['kernel_bytes'] -= old_entry['kernel'].nbytes
+    nodes = linalg.lu_solve(entry['lu'], z.reshape(len(z), -1))
+    nsets = nodes.shape[1]
+    zi = numpy.empty((nsets, numpy.size(xi)), dtype=numpy.float32)
+    if 'kernel' in entry:
+        zi[:, :] = numpy.dot(entry['kernel'], nodes).T
+    else:
+        xi_flat = numpy.ravel(xi)
+        yi_flat = numpy.ravel(yi)
+        for i0 in range(0, len(xi_flat), ntile):
+            i1 = min(i0 + ntile, len(xi_flat))
+            grid_pts = numpy.vstack((xi_flat[i0:i1], yi_flat[i0:i1])).T
+            zi[:, i0:i1] = numpy.dot(multiquadric(
+                spatial.distance.cdist(grid_pts, entry['stn_pts'])), nodes).T
+    if z.ndim == 1:
+        return zi.reshape(numpy.shape(xi))
+    return zi.reshape((nsets,) + numpy.shape(xi))
+
+
 def bilinear(x0, dx, y0, dy, z, ix, iy):
     ix = numpy.asarray(ix)
     iy = numpy.asarray(iy)
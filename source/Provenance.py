@@ -0,0 +1,102 @@
+"""
+Python module 'Provenance.py'
+by Matthew Garcia, PhD student
+Dept. of Forest and Wildlife Ecology
+University of Wisconsin - Madison
+matt.e.garcia@gmail.com
+
+Copyright (C) 2015-2016 by Matthew Garcia
+Licensed Gnu GPL v3; see 'LICENSE_GnuGPLv3.txt' for complete terms
+Send questions, bug reports, any related requests to matt.e.garcia@gmail.com
+See also 'README.md', 'DISCLAIMER.txt', 'CITATION.txt', 'ACKNOWLEDGEMENTS.txt'
+Treat others as you would be treated. Pay it forward. Valar dohaeris.
+
+PURPOSE: Processing provenance of the '.h5' grid files, kept as attributes
+         of their 'meta' group and updated in place
+
+DEPENDENCIES: h5py, numpy
+
+USAGE: insert 'from Provenance import set_provenance' near head of script,
+       then (for example)
+        set_provenance(h5file, 'process_NCEI_03.py',
+                       {'indicators': 'chill_d,grow_dd'})
+
+NOTES: The attributes are 'filename', 'created', 'by' (set once), and
+       'last_updated', 'last_step', and 'software_version' (set at every
+       call), plus '[step]_parameters' for each step called with parameters
+       Each attribute is a fixed-length string (text_sizes, longer text is
+       cut short) in the group's object header, so an update overwrites it
+       in place; the 'meta/last_updated' and 'meta/at' datasets of earlier
+       versions were deleted and recreated at every update, leaving free
+       space in the file that HDF5 does not reuse after it is closed
+       (tools/compact_NCEI_grids.py recovers that space in existing files)
+       At the first update of an older file, its 'meta/filename', 'created',
+       and 'by' datasets give the attributes their values, and its
+       'meta/last_updated' and 'meta/at' datasets are removed
+
+INPUT: open '.h5' file, step name, and parameters from calling script
+
+OUTPUT: provenance attributes of the file's 'meta' group
+"""
+
+
+import datetime
+import numpy as np
+
+
+software_version = '2016.1'
+provenance_by = 'M. Garcia, UWisconsin-Madison FWE'
+# [characters] fixed length of each provenance attribute
+text_sizes = {'filename': 256, 'created': 32, 'by': 64, 'last_updated': 32,
+              'last_step': 64, 'software_version': 16, 'parameters': 512}
+
+
+def set_text_attr(attrs, name, text, size):
+    """
+    writes a fixed-length string attribute, in place if it already exists
+    """
+    value = np.string_(str(text)[:size])
+    if name in attrs:
+        attrs.modify(name, value)
+    else:
+        attrs.create(name, value, dtype='S%d' % size)
+    return
+
+
+def get_provenance(h5file):
+    """
+    returns a dict of the provenance attributes of an open '.h5' file
+    """
+    if 'meta' not in h5file:
+        return {}
+    meta_attrs = h5file['meta'].attrs
+    return dict([(name, str(meta_attrs[name])) for name in meta_attrs])
+
+
+def set_provenance(h5file, step, params=0):
+    """
+    records a processing step (with an optional dict of its parameters) in
+    the provenance attributes of an open '.h5' file
+    """
+    meta = h5file.require_group('meta')
+    now = datetime.datetime.now().isoformat()
+    for name, text in [('filename', h5file.filename), ('created', now),
+                       ('by', provenance_by)]:
+        if name not in meta.attrs:
+            if name in meta:
+                text = meta[name][()]
+            set_text_attr(meta.attrs, name, text, text_sizes[name])
+    for name, text in [('last_updated', now), ('last_step', step),
+                       ('software_version', software_version)]:
+        set_text_attr(meta.attrs, name, text, text_sizes[name])
+    if params:
+        param_str = ', '.join(['%s=%s' % (key, str(params[key]))
+                               for key in sorted(params.keys())])
+        set_text_attr(meta.attrs, '%s_parameters' % step, param_str,
+                      text_sizes['parameters'])
+    for name in ['last_updated', 'at']:
+        if name in meta:
+            del meta[name]
+    return
+
+# end Provenance.py
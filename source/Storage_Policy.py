@@ -0,0 +1,255 @@
+"""
+Python module 'Storage_Policy.py'
+by Matthew Garcia, PhD student
+Dept. of Forest and Wildlife Ecology
+University of Wisconsin - Madison
+matt.e.garcia@gmail.com
+
+Copyright (C) 2015-2016 by Matthew Garcia
+Licensed Gnu GPL v3; see 'LICENSE_GnuGPLv3.txt' for complete terms
+Send questions, bug reports, any related requests to matt.e.garcia@gmail.com
+See also 'README.md', 'DISCLAIMER.txt', 'CITATION.txt', 'ACKNOWLEDGEMENTS.txt'
+Treat others as you would be treated. Pay it forward. Valar dohaeris.
+
+PURPOSE: Compression codec, chunk layout, and (optional) scaled-integer
+         quantization of the grid datasets written by the processing
+         scripts, set in one place
+
+DEPENDENCIES: numpy
+              hdf5plugin (optional, for the Blosc codecs)
+
+USAGE: insert 'from Storage_Policy import grid_kwargs' near head of script,
+       then (for example)
+        h5file.create_dataset(gvar, data=gdata, dtype=np.float32,
+                              **grid_kwargs(np.shape(gdata)))
+       or, for the daily and accumulated grids that may be quantized,
+        create_grid(h5file, 'grid_tmax', grid_tmax)
+        grid_tmax = read_grid(h5file['grid_tmax'])
+
+NOTES: Codecs: 'gzip' (h5py's default level 4, the default policy and the
+       format of all earlier output), 'gzip-1' to 'gzip-9', 'lzf' (with
+       byte-shuffle), 'none', and with the hdf5plugin module 'blosc-lz4',
+       'blosc-lz4hc', and 'blosc-zstd' (with byte-shuffle)
+       Layouts: 'map' (one whole grid, up to 512 x 512 cells, per chunk;
+       fastest for reading whole daily grids, the default) or 'series'
+       (32 days of 64 x 64 cells per chunk; fastest for reading the time
+       series of single cells)
+       The environment variables NCEI_STORAGE_CODEC and NCEI_STORAGE_LAYOUT
+       override the defaults for all scripts, e.g. for one HTCondor job
+       Any codec reads back with the h5py of any machine that has its filter
+       (for the Blosc codecs, with hdf5plugin imported)
+       Use tools/benchmark_storage.py to compare codecs and layouts on a
+       sample of your own grids
+       With NCEI_STORAGE_QUANTIZE=1, the daily grids and accumulated
+       indicators listed in quantized_grids are stored as int16 with the
+       CF attributes scale_factor, add_offset, and _FillValue (for NaN), at
+       half the size of float32; read_grid() and decode_grid() return them
+       as float32 (the unpacked value is stored * scale_factor + add_offset)
+       whether or not they were quantized, so files of both kinds can be
+       mixed; the largest quantization error is scale_factor / 2 (and
+       values beyond the stored range are clipped to it):
+        grid_prcp, prcp_*_sum [cm]      0.005  (range -327.67 to 327.67)
+        grid_tmax/tmin/tavg [deg C]     0.005  (range -327.67 to 327.67)
+        t*_*d_avg [deg C]               0.005  (range -327.67 to 327.67)
+        grid_vpd, vpd_*d_avg [Pa]       0.1    (range -6553.4 to 6553.4)
+        *_frz_days, chill_d [days]      0.005  (range -27.67 to 627.67)
+        grow_dd, grow_dd_base0, and
+        chill_dd [deg C days]           0.05   (range -276.7 to 6276.7)
+       Variances and the year-end rolling accounting variables are always
+       float32
+
+INPUT: dataset shape provided by calling script
+
+OUTPUT: create_dataset() keyword arguments returned to calling script
+"""
+
+
+import os
+import fnmatch
+import numpy as np
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+
+default_codec = 'gzip'
+default_layout = 'map'
+map_tile = 512  # [cells] largest chunk side for the 'map' layout
+series_days = 32  # [days] chunk length for the 'series' layout
+series_tile = 64  # [cells] chunk side for the 'series' layout
+default_quantize = '0'
+int16_fill = -32768
+
+# (name pattern, scale_factor, add_offset) of the grids that are stored as
+# scaled int16 when quantization is on; the first matching pattern is used
+quantized_grids = [
+    ('grid_prcp', 0.01, 0.0),
+    ('prcp_*_sum', 0.01, 0.0),
+    ('grid_t*', 0.01, 0.0),
+    ('t*_*d_avg', 0.01, 0.0),
+    ('grid_vpd', 0.2, 0.0),
+    ('vpd_*d_avg', 0.2, 0.0),
+    ('*_frz_days', 0.01, 300.0),
+    ('chill_d', 0.01, 300.0),
+    ('*_dd*', 0.1, 3000.0)]
+
+
+def storage_codecs():
+    """
+    returns the names of the codecs available here
+    """
+    codecs = ['none', 'gzip'] + ['gzip-%d' % level for level in range(1, 10)]
+    codecs.append('lzf')
+    if hdf5plugin is not None:
+        codecs += ['blosc-lz4', 'blosc-lz4hc', 'blosc-zstd']
+    return codecs
+
+
+def compression_kwargs(codec=0):
+    """
+    returns the create_dataset() keyword arguments for a codec (by default,
+    that of the storage policy)
+    """
+    if codec == 0:
+        codec = os.environ.get('NCEI_STORAGE_CODEC', default_codec)
+    if codec == 'none':
+        return {}
+    elif codec == 'gzip':
+        return {'compression': 'gzip'}
+    elif codec.startswith('gzip-'):
+        return {'compression': 'gzip', 'compression_opts': int(codec[5:])}
+    elif codec == 'lzf':
+        return {'compression': 'lzf', 'shuffle': True}
+    elif codec.startswith('blosc-'):
+        if hdf5plugin is None:
+            raise ImportError('storage codec %s requires hdf5plugin' % codec)
+        return dict(hdf5plugin.Blosc(cname=codec[6:], clevel=5,
+                                     shuffle=hdf5plugin.Blosc.SHUFFLE))
+    raise ValueError('unknown storage codec %s' % codec)
+
+
+def map_chunks(shape):
+    """
+    chunk shape holding one whole grid (up to map_tile cells on a side)
+    """
+    lead = (1,) * (len(shape) - 2)
+    return lead + (min(shape[-2], map_tile), min(shape[-1], map_tile))
+
+
+def series_chunks(shape):
+    """
+    chunk shape holding series_days of a series_tile x series_tile block
+    """
+    lead = tuple([min(n, series_days) for n in shape[:-2]])
+    return lead + (min(shape[-2], series_tile), min(shape[-1], series_tile))
+
+
+def grid_kwargs(shape, layout=0, codec=0):
+    """
+    returns the create_dataset() keyword arguments (compression and chunk
+    shape) for a grid or grid datacube of the given shape; chunking of 1D
+    datasets is left to h5py
+    """
+    if layout == 0:
+        layout = os.environ.get('NCEI_STORAGE_LAYOUT', default_layout)
+    kwargs = compression_kwargs(codec)
+    if len(shape) >= 2 and np.prod(shape) > 0:
+        if layout == 'series' and len(shape) > 2:
+            kwargs['chunks'] = series_chunks(shape)
+        else:
+            kwargs['chunks'] = map_chunks(shape)
+    return kwargs
+
+
+def storage_settings():
+    """
+    returns a dict of the storage policy in effect, for provenance records
+    """
+    return {'codec': os.environ.get('NCEI_STORAGE_CODEC', default_codec),
+            'layout': os.environ.get('NCEI_STORAGE_LAYOUT', default_layout),
+            'quantize': os.environ.get('NCEI_STORAGE_QUANTIZE',
+                                       default_quantize)}
+
+
+def grid_scaling(name):
+    """
+    returns (scale_factor, add_offset) of a grid stored as scaled int16
+    under the storage policy, or None for a float32 grid
+    """
+    if os.environ.get('NCEI_STORAGE_QUANTIZE', default_quantize) == '0':
+        return None
+    for pattern, scale, offset in quantized_grids:
+        if fnmatch.fnmatchcase(name, pattern):
+            return scale, offset
+    return None
+
+
+def create_grid(h5file, name, data=None, shape=0, maxshape=None, layout=0,
+                codec=0):
+    """
+    creates a grid or grid datacube dataset (with data, or empty with shape
+    and maxshape for later writes with encode_grid()) under the storage
+    policy: float32, or scaled int16 for quantized grids
+    """
+    if data is not None:
+        shape = np.shape(data)
+    if maxshape is None:
+        chunk_shape = shape
+    else:
+        chunk_shape = [366 if n is None else n for n in maxshape]
+    kwargs = grid_kwargs(chunk_shape, layout, codec)
+    scaling = grid_scaling(name)
+    if scaling is None:
+        dset = h5file.create_dataset(name, shape=shape, maxshape=maxshape,
+                                     dtype=np.float32, fillvalue=np.nan,
+                                     **kwargs)
+    else:
+        dset = h5file.create_dataset(name, shape=shape, maxshape=maxshape,
+                                     dtype=np.int16, fillvalue=int16_fill,
+                                     **kwargs)
+        dset.attrs['scale_factor'] = np.float32(scaling[0])
+        dset.attrs['add_offset'] = np.float32(scaling[1])
+        dset.attrs['_FillValue'] = np.int16(int16_fill)
+    if data is not None and np.prod(shape) > 0:
+        dset[...] = encode_grid(dset, data)
+    return dset
+
+
+def encode_grid(dset, values):
+    """
+    returns values packed for writing to dset (unchanged unless dset is
+    quantized)
+    """
+    if 'scale_factor' not in dset.attrs:
+        return values
+    values = np.asarray(values, dtype=np.float64)
+    packed = np.round((values - dset.attrs['add_offset']) /
+                      dset.attrs['scale_factor'])
+    # clip to the valid range first, so that no value is packed as the
+    # _FillValue and read back as NaN
+    packed = np.clip(packed, int16_fill + 1, 32767)
+    packed = np.where(np.isnan(values), int16_fill, packed)
+    return packed.astype(np.int16)
+
+
+def decode_grid(dset, values):
+    """
+    returns values read from dset as float32 (unpacked if dset is
+    quantized, with NaN in place of _FillValue)
+    """
+    if 'scale_factor' not in dset.attrs:
+        return values
+    values = np.asarray(values)
+    unpacked = values * dset.attrs['scale_factor'] + dset.attrs['add_offset']
+    return np.where(values == int16_fill, np.nan,
+                    unpacked).astype(np.float32)[()]
+
+
+def read_grid(dset):
+    """
+    returns the whole contents of a grid dataset as float32
+    """
+    return decode_grid(dset, dset[...])
+
+# end Storage_Policy.py
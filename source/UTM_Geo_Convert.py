@@ -16,13 +16,19 @@ Treat others as you would be treated. Pay it forward. Valar dohaeris.
 PURPOSE: Conversion between UTM and geographic coordinates, or from one UTM
          zone to another
 
-DEPENDENCIES: osgeo.osr (uses gdal)
+DEPENDENCIES: osgeo.osr (uses gdal), numpy
 
 USAGE: insert 'from UTM_Geo_Convert import *' near head of script, then
        (for example)
         UTM_coords = geographic_to_utm(stn_lon, stn_lat, UTMzone)
         stn_easting = int(round(UTM_coords[1],0))
         stn_northing = int(round(UTM_coords[2],0))
+       or, for arrays of many points at once,
+        stn_eastings, stn_northings = \
+            geographic_to_utm_array(stn_lons, stn_lats, UTMzone)
+
+NOTES: Coordinate transformations are built once per UTM zone/hemisphere
+       and direction, then reused for all later conversions
 
 INPUT: coordinates provided by calling script
 
@@ -30,9 +36,14 @@ OUTPUT: coordinates returned to calling script
 """
 
 
+import numpy as np
 from osgeo import osr  # uses GDAL via osr-to-python bindings
 
 
+# coordinate transformations already built, keyed by (zone, northern, to_utm)
+utm_transforms = {}
+
+
 def get_utm_zone(lon):
     """ get proper UTM zone based on longitude """
     zone = int(1 + (lon + 180.0) / 6.0)
@@ -47,21 +58,38 @@ def is_northern(lat):
         return 1
 
 
+def get_utm_transform(zone, northern, to_utm):
+    """
+    get the (cached) transformation between geographic coordinates and the
+    given UTM zone/hemisphere, in the direction indicated
+    """
+    key = (int(zone), int(northern), bool(to_utm))
+    if key not in utm_transforms:
+        utm_coordinate_system = osr.SpatialReference()
+        # Set unprojected geographic coordinate system
+        utm_coordinate_system.SetWellKnownGeogCS("WGS84")
+        utm_coordinate_system.SetUTM(int(zone), int(northern))
+        # Clone ONLY the unprojected geographic coordinate system
+        geog_coordinate_system = utm_coordinate_system.CloneGeogCS()
+        # Create transform component with (<from>, <to>)
+        if to_utm:
+            utm_transforms[key] = \
+                osr.CoordinateTransformation(geog_coordinate_system,
+                                             utm_coordinate_system)
+        else:
+            utm_transforms[key] = \
+                osr.CoordinateTransformation(utm_coordinate_system,
+                                             geog_coordinate_system)
+    return utm_transforms[key]
+
+
 def utm_to_geographic(easting, northing, zone):
     """
     convert from UTM coordinates (zone, easting, northing)
             to geographic coordinates (longitude, latitude)
     """
-    utm_coordinate_system = osr.SpatialReference()
-    # Set unprojected geographic coordinate system
-    utm_coordinate_system.SetWellKnownGeogCS("WGS84")
-    utm_coordinate_system.SetUTM(int(zone), int(is_northern(northing)))
-    # Clone ONLY the unprojected geographic coordinate system
-    geog_coordinate_system = utm_coordinate_system.CloneGeogCS()
-    # Create transform component with (<from>, <to>)
     utm_to_geog_transform = \
-        osr.CoordinateTransformation(utm_coordinate_system,
-                                     geog_coordinate_system)
+        get_utm_transform(zone, is_northern(northing), False)
     # Note returned 'alt' (altitude) is currently unused, thus '_'
     lon, lat, _ = utm_to_geog_transform.TransformPoint(easting, northing, 0)
     return lon, lat
@@ -72,25 +100,40 @@ def geographic_to_utm(lon, lat, zonepref=-1):
     convert from geographic coordinates (longitude, latitude)
             to UTM coordinates (zone, easting, northing)
     """
-    utm_coordinate_system = osr.SpatialReference()
-    # Set unprojected geographic coordinate system
-    utm_coordinate_system.SetWellKnownGeogCS("WGS84")
     if zonepref != -1:
         zone = zonepref
     else:
         zone = get_utm_zone(lon)
-    utm_coordinate_system.SetUTM(int(zone), int(is_northern(lat)))
-    # Clone ONLY the unprojected geographic coordinate system
-    geog_coordinate_system = utm_coordinate_system.CloneGeogCS()
-    # Create transform component with (<from>, <to>)
-    geog_to_utm_transform = \
-        osr.CoordinateTransformation(geog_coordinate_system,
-                                     utm_coordinate_system)
+    geog_to_utm_transform = get_utm_transform(zone, is_northern(lat), True)
     # Note returned 'alt' (altitude) is currently unused, thus '_'
     easting, northing, _ = geog_to_utm_transform.TransformPoint(lon, lat, 0)
     return zone, easting, northing
 
 
+def geographic_to_utm_array(lons, lats, zone):
+    """
+    convert arrays of geographic coordinates (longitudes, latitudes)
+            to arrays of UTM coordinates (eastings, northings) in one zone
+    """
+    lons = np.asarray(lons, dtype=np.float64).ravel()
+    lats = np.asarray(lats, dtype=np.float64).ravel()
+    eastings = np.zeros(len(lons), dtype=np.float64)
+    northings = np.zeros(len(lats), dtype=np.float64)
+    northern = lats >= 0.0
+    for hemisphere in [1, 0]:
+        idxs = np.where(northern == hemisphere)[0]
+        if len(idxs) == 0:
+            continue
+        geog_to_utm_transform = get_utm_transform(zone, hemisphere, True)
+        # Note returned 'alt' (altitude) is currently unused
+        coords = geog_to_utm_transform.TransformPoints(
+            zip(lons[idxs].tolist(), lats[idxs].tolist()))
+        coords = np.array(coords, dtype=np.float64).reshape(-1, 3)
+        eastings[idxs] = coords[:, 0]
+        northings[idxs] = coords[:, 1]
+    return eastings, northings
+
+
 def utm_to_utm(easting_in, northing_in, zone_in, zone_out):
     """
     convert from UTM coordinates (zone_in, easting, northing)
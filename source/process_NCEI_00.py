@@ -14,16 +14,32 @@ Treat others as you would be treated. Pay it forward. Valar dohaeris.
 PURPOSE: QA/QC of daily meteorological station data in NOAA/NCEI datasets
 
 DEPENDENCIES: h5py, numpy, pandas
+              'process_NCEI_00_aux' module has its own requirements
 
 USAGE: '$ python process_NCEI_00.py NCEI_WLS_20000101-20101231.csv ./data'
+       '$ python process_NCEI_00.py NCEI_WLS_20000101-20101231.csv ./data 1'
+       '$ python process_NCEI_00.py NCEI_WLS_20000101-20101231.csv
+        ./data 0 5000000'
 
 INPUT: Station meteorological data from NOAA/NCEI in '.csv' format (one file)
 
-NOTE: The labels in <metvals> (line 104) are the minimum information that you
-      should request from the NCEI data server. Check your '.csv' file header
-      line to make sure these columns are present. Additional columns will be
-      removed (inside this routine, not from your original data csv file) to
+NOTE: The labels in <metvals> (in 'process_NCEI_00_aux.py') are the minimum
+      information that you should request from the NCEI data server. Check
+      your '.csv' file header line to make sure these columns are present.
+      Additional columns are not read (your original data csv file is not
+      changed), and the columns are read in chunks with explicit types to
       reduce memory footprint.
+      <1> (optional, default 0) is the flag to keep a columnar '.h5' copy of
+      the input dataset ('[input name]_ingest.h5'), made once (in chunks, so
+      the '.csv' may be larger than memory) and then loaded in seconds by
+      later runs, for as long as the '.csv' file is not changed.
+      <5000000> (optional, default 0) is the maximum number of data rows
+      held in memory at a time; with a number > 0 (streaming mode), a first
+      pass over the station/precipitation columns gives the per-station
+      totals for the per-station checks, a second pass partitions the rows
+      by date range into a temporary '[input name]_bins.h5' file, and each
+      date range is then cleaned on its own and appended to the cleaned
+      '.csv' file, which is then in date (not station) order.
 
 OUTPUT: One '.csv' file with the 'cleaned' version of the input dataset
         One '.csv' file with an accounting of the 'errors' cleaned,
@@ -38,11 +54,17 @@ TODO: add more data cleaning functionality, e.g. wild P reports
 """
 
 
+import os
 import sys
 import datetime
 import h5py as hdf
 import numpy as np
 import pandas as pd
+from process_NCEI_00_aux import metvals, get_ncei_columns, read_ncei_csv, \
+    read_ncei_chunks, ncei_csv_to_h5, ncei_chunks_to_h5, read_ncei_h5, \
+    read_ncei_h5_chunks, ncei_h5_is_current, get_date_bins, qc_rules, \
+    qc_mask, qc_apply, qc_flags_handled, qc_rule_columns, \
+    qc_station_columns, qc_station_totals, ncei_missing
 
 
 def message(char_string):
@@ -54,36 +76,168 @@ def message(char_string):
     return
 
 
-def find_outliers(dset, stnlist, idxlist, nsigma):
+def report_counts(stn_counts, date_counts):
     """
-    Simplified (simplistic?) implementation of Chauvenet's criterion for
-    outlier detection
-    Reference: https://en.wikipedia.org/wiki/Chauvenet%27s_criterion
-    Primary assumption: normally distributed data (may not be correct!)
-    nsigma >= 1.96 --> p < 0.05  --> 95% chance of data being an outlier
-              2.58 --> p < 0.01  --> 99%
-              2.81 --> p < 0.005 --> 99.5%
-              3.27 --> p < 0.001 --> 99.9%
+    prints a summary of the numbers of data rows by station and by date,
+    given Series of those counts indexed by station and by date
     """
-    outlier_stns = []
-    outlier_idxs = []
-    nobs = len(dset)
-    dset_mean = np.mean(dset)
-    dset_std = np.std(dset)
-    dset_z = (dset - dset_mean) / dset_std
-    for j in range(nobs):
-        if abs(dset_z[j]) > nsigma:
-            outlier_stns.append(stnlist[j])
-            outlier_idxs.append(int(idxlist[j]))
-    return outlier_stns, outlier_idxs
+    stn_counts = stn_counts[stn_counts > 0]
+    date_counts = date_counts[date_counts > 0]
+    #
+    # dataset summary by stations
+    message('- %d unique stations' % len(stn_counts))
+    min_dates = min(stn_counts)
+    n_min_dates = sum(stn_counts == min_dates)
+    message('-- minimum %d date entries for %d stations' %
+            (min_dates, n_min_dates))
+    max_dates = max(stn_counts)
+    n_max_dates = sum(stn_counts == max_dates)
+    message('-- maximum %d date entries for %d stations' %
+            (max_dates, n_max_dates))
+    avg_dates = np.mean(stn_counts)
+    message('-- average %.1f date entries per station' % avg_dates)
+    med_dates = np.median(stn_counts)
+    message('-- median %d date entries per station' % med_dates)
+    #
+    # dataset summary by dates
+    dates = sorted(date_counts.index)
+    message('- %d unique dates from %s to %s' %
+            (len(dates), str(dates[0]), str(dates[-1])))
+    min_stns = min(date_counts)
+    n_min_stns = sum(date_counts == min_stns)
+    message('-- minimum %d station entries for %d dates' %
+            (min_stns, n_min_stns))
+    max_stns = max(date_counts)
+    n_max_stns = sum(date_counts == max_stns)
+    message('-- maximum %d station entries for %d dates' %
+            (max_stns, n_max_stns))
+    avg_stns = np.mean(date_counts)
+    message('-- average %.1f station entries per date' % avg_stns)
+    med_stns = np.median(date_counts)
+    message('-- median %d station entries per date' % med_stns)
+    return
+
+
+def add_counts(counts, values):
+    """
+    adds the numbers of rows with each distinct value in a column (chunk) to
+    a Series of running counts (None to start)
+    """
+    new_counts = values.value_counts()
+    new_counts = new_counts[new_counts > 0]
+    new_counts.index = np.array(new_counts.index)
+    if counts is None:
+        return new_counts
+    return counts.add(new_counts, fill_value=0).astype(int)
+
+
+def report_flags(flag_values):
+    """
+    reports the data flags found, and those without any adjustment rule,
+    given a dict of the distinct values found in each flag column
+    """
+    for flag_col in flag_cols:
+        flags = list(sorted(flag_values[flag_col]))
+        message('found %d unique %sS: %s' % (len(flags), flag_col,
+                                             str(flags)))
+        handled = qc_flags_handled(flag_col)
+        if handled != 'all':
+            for flag in flags:
+                if flag != ' ' and flag not in handled:
+                    message('- NOTE: %s %s found, no data adjustments were \
+                            made' % (flag_col, flag))
+    message(' ')
+    return
 
-outlier_threshold = 3.27
+
+def apply_qc_rules(stndata_df, stn_id, stn_codes, stnerr_counts,
+                   station_totals=None):
+    """
+    applies the QA/QC rules (see process_NCEI_00_aux.py) pass by pass,
+    adding the counts of affected rows by station index <stn_codes> (into
+    the <stn_id> list) to <stnerr_counts> (a dict of arrays by error column),
+    and returns the adjusted DataFrame and the number of data value
+    operations
+    """
+    nstns = len(stn_id)
+    noperations = 0
+    qc_passes = sorted(set([rule['pass'] for rule in qc_rules]))
+    for qc_pass in qc_passes:
+        rules = [rule for rule in qc_rules if rule['pass'] == qc_pass]
+        message('QA/QC pass %d of %d (%d rules)' %
+                (qc_pass, len(qc_passes), len(rules)))
+        masks = [qc_mask(stndata_df, rule, station_totals) for rule in rules]
+        for rule, mask in zip(rules, masks):
+            nrows = np.sum(mask)
+            if nrows == 0:
+                continue
+            stndata_df = qc_apply(stndata_df, rule, mask)
+            message('- %s for %d observations' % (rule['msg'], nrows))
+            noperations += nrows
+            if rule['report'] == 'date':
+                date_counts = stndata_df.loc[mask, 'DATE'].value_counts()
+                for date in sorted(date_counts.index):
+                    message('-- date %d: %d' % (date, date_counts[date]))
+            if rule['errcol'] is not None:
+                stn_counts = np.bincount(stn_codes[mask], minlength=nstns)
+                if rule['errcol'] in stnerr_counts:
+                    stnerr_counts[rule['errcol']] += stn_counts
+                else:
+                    stnerr_counts[rule['errcol']] = stn_counts
+                err_stns = np.where(stn_counts > 0)[0]
+                message('-- accounting %s for %d stations' %
+                        (rule['errcol'], len(err_stns)))
+                if rule['report'] == 'station':
+                    for i in err_stns:
+                        message('-- station %s: %d' %
+                                (stn_id[i], stn_counts[i]))
+        message(' ')
+    return stndata_df, noperations
+
+
+def known_location_chunks(chunks, flag_values):
+    """
+    generator of data chunks without their unknown-location rows, adding the
+    flag values found along the way to <flag_values> (a dict of sets)
+    """
+    for chunk in chunks:
+        chunk = chunk[chunk['LATITUDE'].notnull() &
+                      chunk['LONGITUDE'].notnull()]
+        for flag_col in flag_cols:
+            flag_values[flag_col] |= set(chunk[flag_col].unique())
+        yield chunk
+
+
+def get_no_data(stndata_df):
+    """
+    returns a boolean mask of the rows with no useful meteorological data
+    """
+    return np.array((stndata_df['PRCP'] == ncei_missing) &
+                    (stndata_df['TMAX'] == ncei_missing) &
+                    (stndata_df['TMIN'] == ncei_missing))
+
+
+flag_cols = ['PRCP_M_FLAG', 'PRCP_Q_FLAG', 'TMAX_M_FLAG', 'TMAX_Q_FLAG',
+             'TMIN_M_FLAG', 'TMIN_Q_FLAG']
+stnerr_cols = ['PRCP_T_ADJ', 'PRCP_M_ERR', 'PRCP_Q_ERR', 'PRCP_ZERO_ERR',
+               'TMAX_M_ERR', 'TMAX_Q_ERR', 'TMIN_M_ERR', 'TMIN_Q_ERR',
+               'T_REV_ERR', 'TMAX_OUTLIER', 'TMIN_OUTLIER']
 #
 message(' ')
 message('process_NCEI_00.py started at %s' %
         datetime.datetime.now().isoformat())
 message(' ')
 #
+if len(sys.argv) < 5:
+    chunk_rows = 0
+else:
+    chunk_rows = int(sys.argv[4])
+#
+if len(sys.argv) < 4:
+    use_ingest_file = 0
+else:
+    use_ingest_file = int(sys.argv[3])
+#
 if len(sys.argv) < 3:
     message('input warning: no data directory path indicated, using ./data')
     path = './data'
@@ -99,539 +253,330 @@ cleaneddatafile = '%s_cleaned.csv' % NCEIfname[:-4]
 errorsdatafile = '%s_errors.csv' % NCEIfname[:-4]
 stnmetadatafile = '%s_stnmeta.csv' % NCEIfname[:-4]
 h5outfname = '%s_processed.h5' % NCEIfname[:-4]
+ingestfname = '%s_ingest.h5' % NCEIfname[:-4]
+binsfname = '%s_bins.h5' % NCEIfname[:-4]
 #
 message('reading input data file %s' % NCEIfname)
-stndata_df = pd.read_csv(NCEIfname, low_memory=False)
-ndatarows, ndatacols = np.shape(stndata_df)
-message('- read %d total data rows with %d columns' % (ndatarows, ndatacols))
-#
-metvals = ['STATION', 'STATION_NAME', 'ELEVATION', 'LATITUDE', 'LONGITUDE',
-           'DATE', 'PRCP', 'PRCP_M_FLAG', 'PRCP_Q_FLAG', 'TMAX', 'TMAX_M_FLAG',
-           'TMAX_Q_FLAG', 'TMIN', 'TMIN_M_FLAG', 'TMIN_Q_FLAG']
-idxs = list(stndata_df.columns.values)
-for i, var in enumerate(idxs):
-    if var == 'PRCP':
-        if 'Measurement Flag' in idxs[i + 1]:
-            idxs[i + 1] = 'PRCP_M_FLAG'
-        if 'Quality Flag' in idxs[i + 2]:
-            idxs[i + 2] = 'PRCP_Q_FLAG'
-    if var == 'TMAX':
-        if 'Measurement Flag' in idxs[i + 1]:
-            idxs[i + 1] = 'TMAX_M_FLAG'
-        if 'Quality Flag' in idxs[i + 2]:
-            idxs[i + 2] = 'TMAX_Q_FLAG'
-    if var == 'TMIN':
-        if 'Measurement Flag' in idxs[i + 1]:
-            idxs[i + 1] = 'TMIN_M_FLAG'
-        if 'Quality Flag' in idxs[i + 2]:
-            idxs[i + 2] = 'TMIN_Q_FLAG'
-stndata_df.columns = idxs
-idxs = list(stndata_df.columns.values)
-idxs_extras = list(set(idxs) - set(metvals))
-idxs_missing = list(set(metvals) - (set(idxs) - set(idxs_extras)))
-if len(idxs_missing) > 0:
-    message('NOTE: 1+ necessary data columns is absent from your dataset')
-    message('      columns needed: %s' % str(metvals))
-    message('      columns missing: %s' % str(idxs_missing))
-    sys.exit(1)
-#
-for idx in idxs:
-    if idx not in metvals:
-        stndata_df = stndata_df.drop(idx, axis=1)
-ndatarows, ndatacols = np.shape(stndata_df)
-message('-- reduced to %d columns' % ndatacols)
-#
-# sort by station and date, assign index values, and add matching IDX column
-stndata_df = stndata_df.sort_values(by=['STATION', 'DATE'])
-stndata_df.index = pd.Index(np.arange(ndatarows))
-stndata_df['IDX'] = np.arange(ndatarows)
-message('-- assigned index and added index column')
-message(' ')
-#
-message('original input dataset has:')
-ndatarows, ndatacols = np.shape(stndata_df)
-message('- %d total data rows' % ndatarows)
-#
-# dataset summary by stations
-stns_all = stndata_df['STATION']
-stn_id = list(sorted(stns_all.unique()))
-message('- %d unique stations' % len(stn_id))
-stn_counts = pd.value_counts(stns_all, sort=True)
-min_dates = min(stn_counts)
-n_min_dates = sum(stn_counts == min_dates)
-message('-- minimum %d date entries for %d stations' %
-        (min_dates, n_min_dates))
-max_dates = max(stn_counts)
-n_max_dates = sum(stn_counts == max_dates)
-message('-- maximum %d date entries for %d stations' %
-        (max_dates, n_max_dates))
-avg_dates = np.mean(stn_counts)
-message('-- average %.1f date entries per station' % avg_dates)
-med_dates = np.median(stn_counts)
-message('-- median %d date entries per station' % med_dates)
-#
-# dataset summary by dates
-dates_all = stndata_df['DATE']
-dates = list(sorted(dates_all.unique()))
-message('- %d unique dates from %s to %s' %
-        (len(dates), str(dates[0]), str(dates[-1])))
-date_counts = pd.value_counts(dates_all, sort=True)
-min_stns = min(date_counts)
-n_min_stns = sum(date_counts == min_stns)
-message('-- minimum %d station entries for %d dates' % (min_stns, n_min_stns))
-max_stns = max(date_counts)
-n_max_stns = sum(date_counts == max_stns)
-message('-- maximum %d station entries for %d dates' % (max_stns, n_max_stns))
-avg_stns = np.mean(date_counts)
-message('-- average %.1f station entries per date' % avg_stns)
-med_stns = np.median(date_counts)
-message('-- median %d station entries per date' % med_stns)
-message(' ')
-#
-message('cleaning input dataset')
-message(' ')
+ingest_is_current = use_ingest_file and \
+    ncei_h5_is_current(NCEIfname, ingestfname)
+if ingest_is_current:
+    message('- using columnar copy %s' % ingestfname)
+else:
+    idxs = get_ncei_columns(NCEIfname)
+    message('- found %d columns' % len(idxs))
+    idxs_missing = list(set(metvals) - set(idxs))
+    if len(idxs_missing) > 0:
+        message('NOTE: 1+ necessary data columns is absent from your dataset')
+        message('      columns needed: %s' % str(metvals))
+        message('      columns missing: %s' % str(idxs_missing))
+        sys.exit(1)
+    if use_ingest_file:
+        message('- making columnar copy %s' % ingestfname)
+        ncei_csv_to_h5(NCEIfname, ingestfname, idxs)
+        ingest_is_current = True
 noperations = 0
 #
-# drop entries with no location information
-unk_lats_idxs = list(stndata_df.ix[stndata_df['LATITUDE'] == 'unknown', 'IDX'])
-unk_lats_stns = list(stndata_df.ix[stndata_df['LATITUDE'] ==
-                                   'unknown', 'STATION'].unique())
-message('found %d records at %d stations with unknown latitude' %
-        (len(unk_lats_idxs), len(unk_lats_stns)))
-unk_lons_idxs = list(stndata_df.ix[stndata_df['LONGITUDE'] ==
-                                   'unknown', 'IDX'])
-unk_lons_stns = list(stndata_df.ix[stndata_df['LONGITUDE'] ==
-                                   'unknown', 'STATION'].unique())
-message('found %d records at %d stations with unknown longitude' %
-        (len(unk_lons_idxs), len(unk_lons_stns)))
-# set union, either lat or lon is missing
-unk_locs_idxs = list(set(unk_lats_idxs) | set(unk_lons_idxs))
-if len(unk_locs_idxs) > 0:
-    stndata_df = stndata_df.drop(unk_locs_idxs)
-message('dropped %d total records for lack of location information' %
-        len(unk_locs_idxs))
-noperations += len(unk_locs_idxs)
-#
-# re-index
-stndata_df = stndata_df.drop('IDX', axis=1)
-stndata_df = stndata_df.sort_values(by=['STATION', 'DATE'])
-ndatarows, ndatacols = np.shape(stndata_df)
-stns_all = stndata_df['STATION']
-stn_id = list(sorted(stns_all.unique()))
-dates_all = stndata_df['DATE']
-dates = list(sorted(dates_all.unique()))
-stndata_df.index = pd.Index(np.arange(ndatarows))
-stndata_df['IDX'] = np.arange(ndatarows)
-message('re-indexed remaining data records')
-message(' ')
-#
-# *actual* null value is -9999, not 9999 as listed in the GHCND documentation
-# find and adjust any 9999 observation values to -9999
-prcp_null_idx = list(stndata_df.ix[stndata_df['PRCP'] == 9999, 'IDX'])
-if len(prcp_null_idx) > 0:
-    stndata_df.set_value((prcp_null_idx), 'PRCP', -9999)
-    message('PRCP = 9999 set to PRCP = -9999 for %d observations' %
-            len(prcp_null_idx))
-    noperations += len(prcp_null_idx)
-tmax_null_idx = list(stndata_df.ix[stndata_df['TMAX'] == 9999, 'IDX'])
-if len(tmax_null_idx) > 0:
-    stndata_df.set_value((tmax_null_idx), 'TMAX', -9999)
-    message('TMAX = 9999 set to TMAX = -9999 for %d observations' %
-            len(tmax_null_idx))
-    noperations += len(tmax_null_idx)
-tmin_null_idx = list(stndata_df.ix[stndata_df['TMIN'] == 9999, 'IDX'])
-if len(tmin_null_idx) > 0:
-    stndata_df.set_value((tmin_null_idx), 'TMIN', -9999)
-    message('TMIN = 9999 set to TMIN = -9999 for %d observations' %
-            len(tmin_null_idx))
-    noperations += len(tmin_null_idx)
-#
-# set up DataFrame for error accounting and reporting
-stnerr_df = pd.DataFrame(np.zeros((len(stn_id), 13)).astype(int),
-                         index=np.arange(len(stn_id)),
-                         columns=['STATION', 'IDX', 'PRCP_T_ADJ', 'PRCP_M_ERR',
-                                  'PRCP_Q_ERR', 'PRCP_ZERO_ERR', 'TMAX_M_ERR',
-                                  'TMAX_Q_ERR', 'TMIN_M_ERR', 'TMIN_Q_ERR',
-                                  'T_REV_ERR', 'TMAX_OUTLIER', 'TMIN_OUTLIER'])
-stnerr_df['STATION'] = stn_id
-stnerr_df['IDX'] = np.arange(len(stn_id))
-message('established error accounting table')
-message(' ')
-#
-# process PRCP measurement flags
-# - flags 'B' and 'D' are ok
-# - flag 'T' means that a value of 0 *should* be 1 (= 0.1 mm ==> 0.01 cm)
-# - flag 'P' means that value *should* be missing (-9999 instead of 0)
-prcp_flags_all = stndata_df['PRCP_M_FLAG']
-prcp_flags = list(sorted(prcp_flags_all.unique()))
-message('found %d unique PRCP_M_FLAGS: %s' %
-        (len(prcp_flags), str(prcp_flags)))
-if len(prcp_flags) > 1:
-    if 'B' in prcp_flags:
-        message('- NOTE: PRCP flag B found, no data adjustments were made')
-    if 'D' in prcp_flags:
-        message('- NOTE: PRCP flag D found, no data adjustments were made')
-    if 'T' in prcp_flags:
-        prcp_t_idx = list(stndata_df.ix[stndata_df['PRCP_M_FLAG'] ==
-                                        'T', 'IDX'])
-        stndata_df.set_value((prcp_t_idx), 'PRCP', 1)
-        message('- trace PRCP --> PRCP = 1 (= 0.01 cm) for %d observations' %
-                len(prcp_t_idx))
-        noperations += len(prcp_t_idx)
-        prcp_t_stns_all = stndata_df.ix[stndata_df['PRCP_M_FLAG'] ==
-                                        'T', 'STATION']
-        prcp_t_stns = list(prcp_t_stns_all.unique())
-        message('-- accounting PRCP adjustments for %d stations' %
-                len(prcp_t_stns))
-        for stn in prcp_t_stns:
-            stnerr_idx = stnerr_df.ix[stnerr_df['STATION'] == stn, 'IDX']
-            stnerr_count = sum(prcp_t_stns_all == stn)
-            stnerr_df.set_value((stnerr_idx), 'PRCP_T_ADJ', stnerr_count)
-    if 'P' in prcp_flags:
-        prcp_m_idx = list(stndata_df.ix[stndata_df['PRCP_M_FLAG'] ==
-                                        'P', 'IDX'])
-        stndata_df.set_value((prcp_m_idx), 'PRCP', -9999)
-        message('- presumed PRCP = 0 --> PRCP = -9999 for %d observations' %
-                len(prcp_m_idx))
-        noperations += len(prcp_m_idx)
-        prcp_m_stns_all = stndata_df.ix[stndata_df['PRCP_M_FLAG'] ==
-                                        'P', 'STATION']
-        prcp_m_stns = list(prcp_m_stns_all.unique())
-        message('-- accounting PRCP adjustments for %d stations' %
-                len(prcp_m_stns))
-        for stn in prcp_m_stns:
-            stnerr_idx = stnerr_df.ix[stnerr_df['STATION'] == stn, 'IDX']
-            stnerr_count = sum(prcp_m_stns_all == stn)
-            stnerr_df.set_value((stnerr_idx), 'PRCP_M_ERR', stnerr_count)
-    if len(prcp_flags) > 5:
-        message('- NOTE: PRCP flag other than B/D/T/P was found, \
-                but no data adjustments were made')
-message(' ')
-#
-# process PRCP quality flags
-# - anything but a blank here means that the observation failed one of
-#   NOAA/NCEI's own QA checks
-prcp_flags_all = stndata_df['PRCP_Q_FLAG']
-prcp_flags = list(sorted(prcp_flags_all.unique()))
-message('found %d unique PRCP_Q_FLAGS: %s' %
-        (len(prcp_flags), str(prcp_flags)))
-if len(prcp_flags) > 1:
-    prcp_q_idx = list(stndata_df.ix[stndata_df['PRCP_Q_FLAG'] != ' ', 'IDX'])
-    stndata_df.set_value((prcp_q_idx), 'PRCP', -9999)
-    message('- QA-failed PRCP set to PRCP = -9999 for %d observations' %
-            len(prcp_q_idx))
-    noperations += len(prcp_q_idx)
-    prcp_q_stns_all = stndata_df.ix[stndata_df['PRCP_Q_FLAG'] !=
-                                    ' ', 'STATION']
-    prcp_q_stns = list(prcp_q_stns_all.unique())
-    message('-- accounting QA-based PRCP adjustments for %d stations' %
-            len(prcp_q_stns))
-    for stn in prcp_q_stns:
-        stnerr_idx = stnerr_df.ix[stnerr_df['STATION'] == stn, 'IDX']
-        stnerr_count = sum(prcp_q_stns_all == stn)
-        stnerr_df.set_value((stnerr_idx), 'PRCP_Q_ERR', stnerr_count)
-message(' ')
-#
-# process TMAX measurement flags
-# - flag 'L' means that the observation may have been recorded some time later
-#   than the actual TMAX occurrence
-tmax_flags_all = stndata_df['TMAX_M_FLAG']
-tmax_flags = list(sorted(tmax_flags_all.unique()))
-message('found %d unique TMAX_M_FLAGS: %s' %
-        (len(tmax_flags), str(tmax_flags)))
-if len(tmax_flags) > 1:
-    if 'L' in tmax_flags:
-        tmax_m_idx = list(stndata_df.ix[stndata_df['TMAX_M_FLAG'] ==
-                                        'L', 'IDX'])
-        stndata_df.set_value((tmax_m_idx), 'TMAX', -9999)
-        message('- lagged TMAX set to TMAX = -9999 for %d observations' %
-                len(tmax_m_idx))
-        noperations += len(tmax_m_idx)
-        tmax_m_stns_all = stndata_df.ix[stndata_df['TMAX_M_FLAG'] ==
-                                        'L', 'STATION']
-        tmax_m_stns = list(tmax_m_stns_all.unique())
-        message('-- accounting TMAX adjustments for %d stations' %
-                len(tmax_m_stns))
-        for stn in tmax_m_stns:
-            stnerr_idx = stnerr_df.ix[stnerr_df['STATION'] == stn, 'IDX']
-            stnerr_count = sum(tmax_m_stns_all == stn)
-            stnerr_df.set_value((stnerr_idx), 'TMAX_M_ERR', stnerr_count)
-    if (len(tmax_flags) > 2) or ('L' not in tmax_flags):
-        message('- NOTE: a TMAX flag other than L was found, but no data \
-                adjustments were made')
-message(' ')
-#
-# process TMAX quality flags
-# - anything but a blank here means that the observation failed one of
-#   NOAA/NCEI's own QA checks
-tmax_flags_all = stndata_df['TMAX_Q_FLAG']
-tmax_flags = list(sorted(tmax_flags_all.unique()))
-n_tmax_flags = len(tmax_flags)
-message('found %d unique TMAX_Q_FLAGS: %s' % (n_tmax_flags, str(tmax_flags)))
-if n_tmax_flags > 1:
-    tmax_q_idx = list(stndata_df.ix[stndata_df['TMAX_Q_FLAG'] != ' ', 'IDX'])
-    stndata_df.set_value((tmax_q_idx), 'TMAX', -9999)
-    message('- QA-failed TMAX set to TMAX = -9999 for %d observations' %
-            len(tmax_q_idx))
-    noperations += len(tmax_q_idx)
-    tmax_q_stns_all = stndata_df.ix[stndata_df['TMAX_Q_FLAG'] !=
-                                    ' ', 'STATION']
-    tmax_q_stns = list(tmax_q_stns_all.unique())
-    message('-- accounting QA-based TMAX adjustments for %d stations' %
-            len(tmax_q_stns))
-    for stn in tmax_q_stns:
-        stnerr_idx = stnerr_df.ix[stnerr_df['STATION'] == stn, 'IDX']
-        stnerr_count = sum(tmax_q_stns_all == stn)
-        stnerr_df.set_value((stnerr_idx), 'TMAX_Q_ERR', stnerr_count)
-message(' ')
-#
-# process TMIN measurement flags
-# - flag 'L' means that the observation may have been recorded some time later
-#   than the actual TMIN occurrence
-tmin_flags_all = stndata_df['TMIN_M_FLAG']
-tmin_flags = list(sorted(tmin_flags_all.unique()))
-n_tmin_flags = len(tmin_flags)
-message('found %d unique TMIN_M_FLAGS: %s' % (n_tmin_flags, str(tmin_flags)))
-if n_tmin_flags > 1:
-    if 'L' in tmin_flags:
-        tmin_m_idx = list(stndata_df.ix[stndata_df['TMIN_M_FLAG'] ==
-                                        'L', 'IDX'])
-        stndata_df.set_value((tmin_m_idx), 'TMIN', -9999)
-        message('- lagged TMIN set to TMIN = -9999 for %d observations' %
-                len(tmin_m_idx))
-        noperations += len(tmin_m_idx)
-        tmin_m_stns_all = stndata_df.ix[stndata_df['TMIN_M_FLAG'] ==
-                                        'L', 'STATION']
-        tmin_m_stns = list(tmin_m_stns_all.unique())
-        message('-- accounting TMIN adjustments for %d stations' %
-                len(tmin_m_stns))
-        for stn in tmin_m_stns:
-            stnerr_idx = stnerr_df.ix[stnerr_df['STATION'] == stn, 'IDX']
-            stnerr_count = sum(tmin_m_stns_all == stn)
-            stnerr_df.set_value((stnerr_idx), 'TMIN_M_ERR', stnerr_count)
-    if (n_tmin_flags > 2) or ('L' not in tmin_flags):
-        message('- NOTE: a TMIN flag other than L was found, but no data \
-                adjustments were made')
-message(' ')
-#
-# process TMIN quality flags
-# - anything but a blank here means that the observation failed one of
-# NOAA/NCEI's own QA checks
-tmin_flags_all = stndata_df['TMIN_Q_FLAG']
-tmin_flags = list(sorted(tmin_flags_all.unique()))
-n_tmin_flags = len(tmin_flags)
-message('found %d unique TMIN_Q_FLAGS: %s' % (n_tmin_flags, str(tmin_flags)))
-if n_tmin_flags > 1:
-    tmin_q_idx = stndata_df.ix[stndata_df['TMIN_Q_FLAG'] != ' ', 'IDX']
-    stndata_df.set_value((tmin_q_idx), 'TMIN', -9999)
-    message('- QA-failed TMIN set to TMIN = -9999 for %d observations' %
-            len(tmin_q_idx))
-    noperations += len(tmin_q_idx)
-    tmin_q_stns_all = stndata_df.ix[stndata_df['TMIN_Q_FLAG'] !=
-                                    ' ', 'STATION']
-    tmin_q_stns = list(tmin_q_stns_all.unique())
-    message('-- accounting QA-based TMIN adjustments for %d stations' %
-            len(tmin_q_stns))
-    for stn in tmin_q_stns:
-        stnerr_idx = stnerr_df.ix[stnerr_df['STATION'] == stn, 'IDX']
-        stnerr_count = sum(tmin_q_stns_all == stn)
-        stnerr_df.set_value((stnerr_idx), 'TMIN_Q_ERR', stnerr_count)
-message(' ')
-#
-# find stations with potentially erroneous P values
-# (evaluation criterion: all of that station's P values = 0)
-# (outlier detection of extreme values not yet implemented)
-message('checking PRCP values for %d individual stations' % len(stn_id))
-for stn in stn_id:
-    stn_df = stndata_df[stndata_df['STATION'] == stn]
-    stn_idxs = list(stn_df['IDX'])
-    stn_df = stn_df[stn_df['PRCP'] != -9999]
-    stn_prcp = np.array(stn_df['PRCP'])
-    if sum(stn_prcp) <= 0:
-        message('- station %s may have erroneous PRCP data, setting all %d of \
-                its PRCP values to -9999' % (stn, len(stn_idxs)))
-        stndata_df.set_value((stn_idxs), 'PRCP', -9999)
-        noperations += len(stn_idxs)
-        stnerr_idx = stnerr_df.ix[stnerr_df['STATION'] == stn, 'IDX']
-        stnerr_df.set_value((stnerr_idx), 'PRCP_ZERO_ERR', len(stn_idxs))
+if chunk_rows == 0:
+    if ingest_is_current:
+        stndata_df = read_ncei_h5(ingestfname)
     else:
-        message('- station %s PRCP data seem OK (no check for extreme values \
-                yet)' % stn)
-message(' ')
-#
-# find entries with potentially erroneous locations/values
-# (evaluation criteria: reversed Tmax and Tmin values)
-# (                     outlier detection of extreme T values)
-message('checking PRCP/TMAX/TMIN values for %d individual dates' % len(dates))
-for date in dates:
-    date_df = stndata_df[stndata_df['DATE'] == date]
-    stn_vals = list(date_df['STATION'])
-    lats_vals = list(date_df['LATITUDE'])
-    lons_vals = list(date_df['LONGITUDE'])
-    prcp_vals = np.array(date_df['PRCP'])
-    tmax_vals = np.array(date_df['TMAX'])
-    tmin_vals = np.array(date_df['TMIN'])
-    idx_vals = list(date_df['IDX'])
+        stndata_df = read_ncei_csv(NCEIfname, idxs)
+    ndatarows, ndatacols = np.shape(stndata_df)
+    message('- read %d total data rows with %d columns' %
+            (ndatarows, ndatacols))
     #
-    # find transposed Tmax/Tmin values
-    # (only works if valid values are present for both)
-    nvals = len(idx_vals)
-    transposed = 0
-    for i in range(nvals):
-        if (tmax_vals[i] != -9999) and (tmin_vals[i] != -9999):
-            if tmin_vals[i] > tmax_vals[i]:
-                stndata_df.set_value((int(idx_vals[i])), 'TMAX', tmin_vals[i])
-                stndata_df.set_value((int(idx_vals[i])), 'TMIN', tmax_vals[i])
-                transposed += 1
-                stnerr_idx = stnerr_df.ix[stnerr_df['STATION'] ==
-                                          stn_vals[i], 'IDX']
-                stnerr_val = stnerr_df.ix[stnerr_df['STATION'] ==
-                                          stn_vals[i], 'T_REV_ERR']
-                stnerr_df.set_value((stnerr_idx), 'T_REV_ERR',
-                                    (stnerr_val + 1))
-    if transposed > 0:
-        message('- date %d has %d entries where Tmax < Tmin, now reversed' %
-                (date, transposed))
-        noperations += transposed
+    # sort by station and date, assign index values, and add IDX column
+    stndata_df = stndata_df.sort_values(by=['STATION', 'DATE'])
+    stndata_df.index = pd.Index(np.arange(ndatarows))
+    stndata_df['IDX'] = np.arange(ndatarows)
+    message('-- assigned index and added index column')
+    message(' ')
     #
-    # find outlier Tmax values (not spatial, purely arithmetic)
-    valid_tmax_vals = date_df[date_df['TMAX'] != -9999]
-    tmax_vals = np.array(valid_tmax_vals['TMAX'])
-    stn_vals = list(valid_tmax_vals['STATION'])
-    idx_vals = list(valid_tmax_vals['IDX'])
-    tmax_outlier_stns, tmax_outlier_idxs = find_outliers(tmax_vals, stn_vals,
-                                                         idx_vals,
-                                                         outlier_threshold)
-    if len(tmax_outlier_stns) > 0:
-        stndata_df.set_value((tmax_outlier_idxs), 'TMAX', -9999)
-        for stn in tmax_outlier_stns:
-            stnerr_idx = stnerr_df.ix[stnerr_df['STATION'] == stn, 'IDX']
-            stnerr_val = stnerr_df.ix[stnerr_df['STATION'] ==
-                                      stn, 'TMAX_OUTLIER']
-            stnerr_df.set_value((stnerr_idx), 'TMAX_OUTLIER', (stnerr_val + 1))
-        message('- date %d has %d outlier Tmax values (p < 0.001), now set to \
-                -9999' % (date, len(tmax_outlier_stns)))
-        noperations += len(tmax_outlier_stns)
+    message('original input dataset has:')
+    message('- %d total data rows' % ndatarows)
+    report_counts(add_counts(None, stndata_df['STATION']),
+                  add_counts(None, stndata_df['DATE']))
+    message(' ')
     #
-    # find outlier Tmin values (not spatial, purely arithmetic)
-    valid_tmin_vals = date_df[date_df['TMIN'] != -9999]
-    tmin_vals = np.array(valid_tmin_vals['TMIN'])
-    stn_vals = list(valid_tmin_vals['STATION'])
-    idx_vals = list(valid_tmin_vals['IDX'])
-    tmin_outlier_stns, tmin_outlier_idxs = find_outliers(tmin_vals, stn_vals,
-                                                         idx_vals,
-                                                         outlier_threshold)
-    if len(tmin_outlier_stns) > 0:
-        stndata_df.set_value((tmin_outlier_idxs), 'TMAX', -9999)
-        for stn in tmin_outlier_stns:
-            stnerr_idx = stnerr_df.ix[stnerr_df['STATION'] == stn, 'IDX']
-            stnerr_val = stnerr_df.ix[stnerr_df['STATION'] ==
-                                      stn, 'TMIN_OUTLIER']
-            stnerr_df.set_value((stnerr_idx), 'TMIN_OUTLIER', (stnerr_val + 1))
-        message('- date %d has %d outlier Tmin values (p < 0.001), now set to \
-                -9999' % (date, len(tmin_outlier_stns)))
-        noperations += len(tmin_outlier_stns)
+    message('cleaning input dataset')
+    message(' ')
     #
-    # if no apparent errors/outliers found, report that
-    if (transposed + len(tmax_outlier_stns) + len(tmin_outlier_stns)) == 0:
-        message('- date %d data seem OK' % date)
-message(' ')
-#
-# drop entries with no useful meteorological data (just for convenience)
-no_prcp_data_idxs = list(stndata_df.ix[stndata_df['PRCP'] == -9999, 'IDX'])
-no_tmax_data_idxs = list(stndata_df.ix[stndata_df['TMAX'] == -9999, 'IDX'])
-no_tmin_data_idxs = list(stndata_df.ix[stndata_df['TMIN'] == -9999, 'IDX'])
-# set intersection, see if all met data are missing
-no_data_idxs = list(set(no_prcp_data_idxs) &
-                    set(no_tmax_data_idxs) &
-                    set(no_tmin_data_idxs))
-if len(no_data_idxs) > 0:
-    stndata_df = stndata_df.drop(no_data_idxs)
-    message('dropped %d records for lack of useful meteorological data' %
-            len(no_data_idxs))
-    noperations += len(no_data_idxs)
-#
-# re-index
-stndata_df = stndata_df.drop('IDX', axis=1)
-stndata_df = stndata_df.sort_values(by=['STATION', 'DATE'])
-ndatarows, ndatacols = np.shape(stndata_df)
-stndata_df.index = pd.Index(np.arange(ndatarows))
-stndata_df['IDX'] = np.arange(ndatarows)
-message('re-indexed remaining data records')
+    # drop entries with no location information
+    # ('unknown' locations were read as NaN)
+    unk_lats = stndata_df['LATITUDE'].isnull()
+    message('found %d records at %d stations with unknown latitude' %
+            (np.sum(unk_lats),
+             len(stndata_df.loc[unk_lats, 'STATION'].unique())))
+    unk_lons = stndata_df['LONGITUDE'].isnull()
+    message('found %d records at %d stations with unknown longitude' %
+            (np.sum(unk_lons),
+             len(stndata_df.loc[unk_lons, 'STATION'].unique())))
+    # set union, either lat or lon is missing
+    unk_locs = np.array(unk_lats | unk_lons)
+    if np.sum(unk_locs) > 0:
+        stndata_df = stndata_df[~unk_locs]
+    message('dropped %d total records for lack of location information' %
+            np.sum(unk_locs))
+    noperations += np.sum(unk_locs)
+    #
+    # re-index
+    stndata_df = stndata_df.drop('IDX', axis=1)
+    stndata_df['STATION'] = \
+        stndata_df['STATION'].cat.remove_unused_categories()
+    ndatarows, ndatacols = np.shape(stndata_df)
+    stn_id = list(sorted(stndata_df['STATION'].unique()))
+    stndata_df.index = pd.Index(np.arange(ndatarows))
+    stndata_df['IDX'] = np.arange(ndatarows)
+    message('re-indexed remaining data records')
+    message(' ')
+    #
+    # set up error accounting and reporting
+    # (per-rule counts of affected rows by station index, merged at the end)
+    stn_codes = np.array(pd.Categorical(stndata_df['STATION'],
+                                        categories=stn_id).codes)
+    stnerr_counts = {}
+    message('established error accounting table')
+    message(' ')
+    #
+    report_flags(dict([(flag_col, stndata_df[flag_col].unique())
+                       for flag_col in flag_cols]))
+    stndata_df, nops = apply_qc_rules(stndata_df, stn_id, stn_codes,
+                                      stnerr_counts)
+    noperations += nops
+    #
+    # drop entries with no useful meteorological data (just for convenience)
+    no_data = get_no_data(stndata_df)
+    if np.sum(no_data) > 0:
+        stndata_df = stndata_df[~no_data]
+        message('dropped %d records for lack of useful meteorological data' %
+                np.sum(no_data))
+        noperations += np.sum(no_data)
+    #
+    # re-index
+    stndata_df = stndata_df.drop('IDX', axis=1)
+    stndata_df['STATION'] = \
+        stndata_df['STATION'].cat.remove_unused_categories()
+    stndata_df = stndata_df.sort_values(by=['STATION', 'DATE'])
+    ndatarows, ndatacols = np.shape(stndata_df)
+    stndata_df.index = pd.Index(np.arange(ndatarows))
+    stndata_df['IDX'] = np.arange(ndatarows)
+    message('re-indexed remaining data records')
+    message(' ')
+    #
+    # station metadata
+    clean_stn_id = sorted(stndata_df['STATION'].unique())
+    stn_groups = stndata_df.groupby('STATION')
+    lats = np.array(stn_groups['LATITUDE'].last())
+    lons = np.array(stn_groups['LONGITUDE'].last())
+    ndates = np.array(stn_groups.size())
+    valid_df = stndata_df[['PRCP', 'TMAX', 'TMIN']] != ncei_missing
+    valid_counts = valid_df.groupby(stndata_df['STATION']).sum()
+    nprcp = np.array(valid_counts['PRCP']).astype(int)
+    ntmax = np.array(valid_counts['TMAX']).astype(int)
+    ntmin = np.array(valid_counts['TMIN']).astype(int)
+    clean_date_counts = add_counts(None, stndata_df['DATE'])
+    #
+    # save cleaned csv dataset
+    stndata_df.to_csv(cleaneddatafile)
+    message('saved cleaned NCEI dataset to %s' % cleaneddatafile)
+    message(' ')
+else:
+    message('- streaming mode, with up to %d data rows at a time' %
+            chunk_rows)
+    #
+    # first pass over the station columns only: dataset summary, dates and
+    # per-station totals for the per-station QA/QC rules
+    stn_cols = qc_station_columns()
+    stn_pass = min([rule['pass'] for rule in qc_rules
+                    if rule['test'][0] == 'station_sum_le'] or [0])
+    stn_prior_rules = [rule for rule in qc_rules if rule['pass'] < stn_pass and
+                       set(qc_rule_columns(rule)) <= set(stn_cols)]
+    if ingest_is_current:
+        chunks = read_ncei_h5_chunks(ingestfname, chunk_rows, stn_cols)
+    else:
+        chunks = read_ncei_chunks(NCEIfname, idxs, chunk_rows, stn_cols)
+    ndatarows = 0
+    stn_counts = None
+    date_counts = None
+    unk_lats_stns = set()
+    unk_lons_stns = set()
+    nunk_lats = 0
+    nunk_lons = 0
+    nunk_locs = 0
+    known_stn_counts = None
+    known_date_counts = None
+    station_totals = {}
+    for chunk in chunks:
+        ndatarows += len(chunk)
+        message('- read %d data rows (%s)' % (ndatarows, ', '.join(stn_cols)))
+        stn_counts = add_counts(stn_counts, chunk['STATION'])
+        date_counts = add_counts(date_counts, chunk['DATE'])
+        unk_lats = chunk['LATITUDE'].isnull()
+        nunk_lats += np.sum(unk_lats)
+        unk_lats_stns |= set(chunk.loc[unk_lats, 'STATION'].unique())
+        unk_lons = chunk['LONGITUDE'].isnull()
+        nunk_lons += np.sum(unk_lons)
+        unk_lons_stns |= set(chunk.loc[unk_lons, 'STATION'].unique())
+        unk_locs = np.array(unk_lats | unk_lons)
+        nunk_locs += np.sum(unk_locs)
+        chunk = chunk[~unk_locs]
+        known_stn_counts = add_counts(known_stn_counts, chunk['STATION'])
+        known_date_counts = add_counts(known_date_counts, chunk['DATE'])
+        for qc_pass in sorted(set([rule['pass']
+                                   for rule in stn_prior_rules])):
+            rules = [rule for rule in stn_prior_rules
+                     if rule['pass'] == qc_pass]
+            masks = [qc_mask(chunk, rule) for rule in rules]
+            for rule, mask in zip(rules, masks):
+                chunk = qc_apply(chunk, rule, mask)
+        station_totals = qc_station_totals(chunk, station_totals)
+    message(' ')
+    #
+    message('original input dataset has:')
+    message('- %d total data rows' % ndatarows)
+    report_counts(stn_counts, date_counts)
+    message(' ')
+    #
+    message('cleaning input dataset')
+    message(' ')
+    message('found %d records at %d stations with unknown latitude' %
+            (nunk_lats, len(unk_lats_stns)))
+    message('found %d records at %d stations with unknown longitude' %
+            (nunk_lons, len(unk_lons_stns)))
+    message('dropped %d total records for lack of location information' %
+            nunk_locs)
+    noperations += nunk_locs
+    message(' ')
+    #
+    # second pass: partition the rows by date range, so that each range of
+    # at most <chunk_rows> rows can be cleaned on its own (the per-date rules
+    # only need all of the rows of each date)
+    known_dates = sorted(known_date_counts.index)
+    date_bins = get_date_bins(known_dates,
+                              list(known_date_counts[known_dates]),
+                              chunk_rows)
+    message('partitioning data rows into %d date ranges in %s' %
+            (len(date_bins), binsfname))
+    if ingest_is_current:
+        chunks = read_ncei_h5_chunks(ingestfname, chunk_rows)
+    else:
+        chunks = read_ncei_chunks(NCEIfname, idxs, chunk_rows)
+    flag_values = dict([(flag_col, set()) for flag_col in flag_cols])
+    ncei_chunks_to_h5(known_location_chunks(chunks, flag_values), binsfname,
+                      date_bins)
+    message(' ')
+    #
+    # set up error accounting and reporting
+    # (per-rule counts of affected rows by station index, merged at the end)
+    stn_id = sorted(known_stn_counts.index)
+    nstns = len(stn_id)
+    stnerr_counts = {}
+    message('established error accounting table')
+    message(' ')
+    #
+    report_flags(flag_values)
+    #
+    # third pass: clean each date range, and append it to the cleaned dataset
+    lats = np.zeros(nstns) * np.nan
+    lons = np.zeros(nstns) * np.nan
+    ndates = np.zeros(nstns, dtype=int)
+    nprcp = np.zeros(nstns, dtype=int)
+    ntmax = np.zeros(nstns, dtype=int)
+    ntmin = np.zeros(nstns, dtype=int)
+    clean_date_counts = None
+    nrows_out = 0
+    for i in range(len(date_bins)):
+        stndata_df = read_ncei_h5(binsfname, 'bins/%d' % i)
+        stndata_df = stndata_df.sort_values(by=['DATE', 'STATION'])
+        stndata_df.index = pd.Index(np.arange(len(stndata_df)))
+        message('cleaning %d data rows for dates %d to %d' %
+                (len(stndata_df), stndata_df['DATE'].iloc[0],
+                 stndata_df['DATE'].iloc[-1]))
+        message(' ')
+        stn_codes = np.array(pd.Categorical(stndata_df['STATION'],
+                                            categories=stn_id).codes)
+        stndata_df, nops = apply_qc_rules(stndata_df, stn_id, stn_codes,
+                                          stnerr_counts, station_totals)
+        noperations += nops
+        #
+        # drop entries with no useful meteorological data
+        no_data = get_no_data(stndata_df)
+        if np.sum(no_data) > 0:
+            stndata_df = stndata_df[~no_data]
+            stn_codes = stn_codes[~no_data]
+            message('dropped %d records for lack of useful meteorological \
+                    data' % np.sum(no_data))
+            noperations += np.sum(no_data)
+        #
+        # station metadata (rows are in date order, so the last location
+        # assigned is that of the last date)
+        lats[stn_codes] = np.array(stndata_df['LATITUDE'])
+        lons[stn_codes] = np.array(stndata_df['LONGITUDE'])
+        ndates += np.bincount(stn_codes, minlength=nstns)
+        nprcp += np.bincount(stn_codes, minlength=nstns,
+                             weights=np.array(stndata_df['PRCP'] !=
+                                              ncei_missing)).astype(int)
+        ntmax += np.bincount(stn_codes, minlength=nstns,
+                             weights=np.array(stndata_df['TMAX'] !=
+                                              ncei_missing)).astype(int)
+        ntmin += np.bincount(stn_codes, minlength=nstns,
+                             weights=np.array(stndata_df['TMIN'] !=
+                                              ncei_missing)).astype(int)
+        clean_date_counts = add_counts(clean_date_counts, stndata_df['DATE'])
+        #
+        # append to the cleaned csv dataset, in date order
+        nrows = len(stndata_df)
+        stndata_df.index = pd.Index(np.arange(nrows_out, nrows_out + nrows))
+        stndata_df['IDX'] = np.arange(nrows_out, nrows_out + nrows)
+        if nrows_out == 0:
+            stndata_df.to_csv(cleaneddatafile)
+        else:
+            stndata_df.to_csv(cleaneddatafile, mode='a', header=False)
+        nrows_out += nrows
+        message('- saved %d cleaned data rows to %s' %
+                (nrows_out, cleaneddatafile))
+        message(' ')
+    os.remove(binsfname)
+    #
+    # station metadata, for the stations left in the cleaned dataset
+    clean_stns = ndates > 0
+    clean_stn_id = list(np.array(stn_id)[clean_stns])
+    lats = lats[clean_stns]
+    lons = lons[clean_stns]
+    ndates = ndates[clean_stns]
+    nprcp = nprcp[clean_stns]
+    ntmax = ntmax[clean_stns]
+    ntmin = ntmin[clean_stns]
+    ndatarows = nrows_out
+#
+# merge the error counts into one table, one row per station
+stnerr_df = pd.DataFrame({'STATION': stn_id, 'IDX': np.arange(len(stn_id))},
+                         columns=['STATION', 'IDX'] + stnerr_cols)
+for col in stnerr_cols:
+    stnerr_df[col] = stnerr_counts.get(col, np.zeros(len(stn_id), dtype=int))
+message('merged error counts for %d stations' % len(stn_id))
 message(' ')
 #
 message('a total of %d data value operations were performed' % noperations)
 message(' ')
 #
-ndatarows, ndatacols = np.shape(stndata_df)
 message('cleaned dataset has:')
 message('- %d total data rows' % ndatarows)
-#
-# dataset summary by stations
-stns_all = stndata_df['STATION']
-stn_id = sorted(stns_all.unique())
-message('- %d unique stations' % len(stn_id))
-stn_counts = pd.value_counts(stns_all, sort=True)
-min_dates = min(stn_counts)
-n_min_dates = sum(stn_counts == min_dates)
-message('-- minimum %d date entries for %d stations' %
-        (min_dates, n_min_dates))
-max_dates = max(stn_counts)
-n_max_dates = sum(stn_counts == max_dates)
-message('-- maximum %d date entries for %d stations' %
-        (max_dates, n_max_dates))
-avg_dates = np.mean(stn_counts)
-message('-- average %.1f date entries per station' % avg_dates)
-med_dates = np.median(stn_counts)
-message('-- median %d date entries per station' % med_dates)
-#
-# dataset summary by dates
-dates_all = stndata_df['DATE']
-dates = sorted(dates_all.unique())
-message('- %d unique dates from %s to %s' %
-        (len(dates), str(dates[0]), str(dates[-1])))
-date_counts = pd.value_counts(dates_all, sort=True)
-min_stns = min(date_counts)
-n_min_stns = sum(date_counts == min_stns)
-message('-- minimum %d station entries for %d dates' %
-        (min_stns, n_min_stns))
-max_stns = max(date_counts)
-n_max_stns = sum(date_counts == max_stns)
-message('-- maximum %d station entries for %d dates' %
-        (max_stns, n_max_stns))
-avg_stns = np.mean(date_counts)
-message('-- average %.1f station entries per date' % avg_stns)
-med_stns = np.median(date_counts)
-message('-- median %d station entries per date' % med_stns)
+report_counts(pd.Series(ndates, index=clean_stn_id), clean_date_counts)
 message(' ')
 #
 # dataset summary by variable
+stn_id = clean_stn_id
+dates = sorted(clean_date_counts.index)
 message('- %d total stations' % len(stn_id))
 message('- %d unique dates from %s to %s' %
         (len(dates), str(dates[0]), str(dates[-1])))
-lats = np.zeros((len(stn_id)))
-lons = np.zeros((len(stn_id)))
-ndates = np.zeros((len(stn_id))).astype(int)
-nprcp = np.zeros((len(stn_id))).astype(int)
-ntmax = np.zeros((len(stn_id))).astype(int)
-ntmin = np.zeros((len(stn_id))).astype(int)
-for i in range(len(stn_id)):
-    message('-- processing station %s' % stn_id[i])
-    stndata_subset = stndata_df[stndata_df['STATION'] == stn_id[i]]
-    lats[i] = list(stndata_subset['LATITUDE'])[-1]
-    lons[i] = list(stndata_subset['LONGITUDE'])[-1]
-    ndates[i] = len(list(stndata_subset['DATE']))
-    nprcp[i] = sum(list(stndata_subset['PRCP'] != -9999))
-    ntmax[i] = sum(list(stndata_subset['TMAX'] != -9999))
-    ntmin[i] = sum(list(stndata_subset['TMIN'] != -9999))
 stnmeta_df = pd.DataFrame({'STATION': stn_id, 'LATITUDE': lats,
                            'LONGITUDE': lons, 'NDATES': ndates,
                            'NPRCP': nprcp, 'NTMAX': ntmax, 'NTMIN': ntmin})
 message(' ')
 #
-# save cleaned csv dataset
-stndata_df.to_csv(cleaneddatafile)
-message('saved cleaned NCEI dataset to %s' % cleaneddatafile)
+# save error accounting and station metadata
 stnerr_df.to_csv(errorsdatafile)
 message('saved station-by-station error counts to %s' % errorsdatafile)
 stnmeta_df.to_csv(stnmetadatafile)
@@ -647,6 +592,10 @@ with hdf.File(h5outfname, 'w') as h5file:
     h5file.create_dataset('meta/last_updated',
                           data=datetime.datetime.now().isoformat())
     h5file.create_dataset('meta/at', data='unique stations list, dates list')
+    if chunk_rows > 0:
+        h5file.create_dataset('meta/sorted_by', data='DATE')
+    else:
+        h5file.create_dataset('meta/sorted_by', data='STATION')
     h5file.create_dataset('stn_id', data=stn_id)
     h5file.create_dataset('dates', data=dates)
 message('saved processing metadata to %s' % h5outfname)
@@ -0,0 +1,507 @@
+"""
+Python module 'process_NCEI_00_aux.py'
+by Matthew Garcia, PhD student
+Dept. of Forest and Wildlife Ecology
+University of Wisconsin - Madison
+matt.e.garcia@gmail.com
+
+Copyright (C) 2015-2016 by Matthew Garcia
+Licensed Gnu GPL v3; see 'LICENSE_GnuGPLv3.txt' for complete terms
+Send questions, bug reports, any related requests to matt.e.garcia@gmail.com
+See also 'README.md', 'DISCLAIMER.txt', 'CITATION.txt', 'ACKNOWLEDGEMENTS.txt'
+Treat others as you would be treated. Pay it forward. Valar dohaeris.
+
+PURPOSE: helper functions for process_NCEI_00.py: typed (and chunked) reading
+         of NOAA/NCEI GHCN-Daily '.csv' files, and a columnar '.h5' copy of
+         that input for much faster loading in later runs
+
+DEPENDENCIES: h5py, numpy, pandas
+
+USAGE: insert 'from process_NCEI_00_aux import *' line near head of script
+       see usage examples in 'process_NCEI_00.py'
+
+NOTES: In the columnar '.h5' copy, each column of <metvals> is one dataset;
+       the text columns are stored as integer codes into a '[column]_cats'
+       list, and are returned as pandas categoricals
+
+INPUT: '.csv' (or earlier columnar '.h5') filename provided by calling script
+
+OUTPUT: pandas DataFrame returned to calling script, columnar '.h5' file
+"""
+
+
+import os
+import sys
+import h5py as hdf
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+# the minimum information that should be requested from the NCEI data server
+metvals = ['STATION', 'STATION_NAME', 'ELEVATION', 'LATITUDE', 'LONGITUDE',
+           'DATE', 'PRCP', 'PRCP_M_FLAG', 'PRCP_Q_FLAG', 'TMAX', 'TMAX_M_FLAG',
+           'TMAX_Q_FLAG', 'TMIN', 'TMIN_M_FLAG', 'TMIN_Q_FLAG']
+#
+# explicit column types: text columns as categoricals, and observed values in
+# the NCEI integer units (0.1 mm, 0.1 degC, -9999 = missing); unknown
+# locations become NaN instead of forcing whole columns to text
+metvals_dtypes = {'STATION': 'category', 'STATION_NAME': 'category',
+                  'ELEVATION': np.float32, 'LATITUDE': np.float64,
+                  'LONGITUDE': np.float64, 'DATE': np.int32,
+                  'PRCP': np.int32, 'PRCP_M_FLAG': 'category',
+                  'PRCP_Q_FLAG': 'category', 'TMAX': np.int16,
+                  'TMAX_M_FLAG': 'category', 'TMAX_Q_FLAG': 'category',
+                  'TMIN': np.int16, 'TMIN_M_FLAG': 'category',
+                  'TMIN_Q_FLAG': 'category'}
+metvals_na = {'ELEVATION': ['unknown'], 'LATITUDE': ['unknown'],
+              'LONGITUDE': ['unknown']}
+#
+# *actual* null value is -9999, not 9999 as listed in the GHCND documentation
+ncei_missing = -9999
+#
+# Declarative QA/QC rules, applied in passes: within a pass, all tests are
+# evaluated on the same data before any action is applied (a rule depending
+# on the results of another goes in a later pass). Tests:
+#   ('equals', column, value) / ('not_equals', column, value)
+#   ('greater', column_a, column_b) - both valid and column_a > column_b
+#   ('station_sum_le', column, value) - all rows of stations whose valid
+#       values sum to <= value
+#   ('date_outlier', column, nsigma) - Chauvenet's criterion (see
+#       find_outliers) among the valid values of each date
+# Actions: ('set', column, value) / ('swap', column_a, column_b)
+# Counts of affected rows by station go to the 'errcol' column of the error
+# accounting table; 'report' lists the affected stations or dates
+#   nsigma >= 1.96 --> p < 0.05  --> 95% chance of data being an outlier
+#             2.58 --> p < 0.01  --> 99%
+#             2.81 --> p < 0.005 --> 99.5%
+#             3.27 --> p < 0.001 --> 99.9%
+outlier_threshold = 3.27
+qc_rules = [
+    # GHCND documentation lists 9999 as the null value
+    {'pass': 1, 'test': ('equals', 'PRCP', 9999),
+     'action': ('set', 'PRCP', ncei_missing), 'errcol': None, 'report': None,
+     'msg': 'PRCP = 9999 set to PRCP = -9999'},
+    {'pass': 1, 'test': ('equals', 'TMAX', 9999),
+     'action': ('set', 'TMAX', ncei_missing), 'errcol': None, 'report': None,
+     'msg': 'TMAX = 9999 set to TMAX = -9999'},
+    {'pass': 1, 'test': ('equals', 'TMIN', 9999),
+     'action': ('set', 'TMIN', ncei_missing), 'errcol': None, 'report': None,
+     'msg': 'TMIN = 9999 set to TMIN = -9999'},
+    # PRCP measurement flags ('B' and 'D' are ok)
+    # - flag 'T' means that a value of 0 *should* be 1 (= 0.1 mm ==> 0.01 cm)
+    # - flag 'P' means that value *should* be missing (-9999 instead of 0)
+    {'pass': 2, 'test': ('equals', 'PRCP_M_FLAG', 'T'),
+     'action': ('set', 'PRCP', 1), 'errcol': 'PRCP_T_ADJ', 'report': None,
+     'msg': 'trace PRCP --> PRCP = 1 (= 0.01 cm)'},
+    {'pass': 2, 'test': ('equals', 'PRCP_M_FLAG', 'P'),
+     'action': ('set', 'PRCP', ncei_missing), 'errcol': 'PRCP_M_ERR',
+     'report': None, 'msg': 'presumed PRCP = 0 --> PRCP = -9999'},
+    # quality flags: anything but a blank means that the observation failed
+    # one of NOAA/NCEI's own QA checks
+    {'pass': 2, 'test': ('not_equals', 'PRCP_Q_FLAG', ' '),
+     'action': ('set', 'PRCP', ncei_missing), 'errcol': 'PRCP_Q_ERR',
+     'report': None, 'msg': 'QA-failed PRCP set to PRCP = -9999'},
+    # TMAX/TMIN measurement flag 'L' means that the observation may have been
+    # recorded some time later than the actual TMAX/TMIN occurrence
+    {'pass': 2, 'test': ('equals', 'TMAX_M_FLAG', 'L'),
+     'action': ('set', 'TMAX', ncei_missing), 'errcol': 'TMAX_M_ERR',
+     'report': None, 'msg': 'lagged TMAX set to TMAX = -9999'},
+    {'pass': 2, 'test': ('not_equals', 'TMAX_Q_FLAG', ' '),
+     'action': ('set', 'TMAX', ncei_missing), 'errcol': 'TMAX_Q_ERR',
+     'report': None, 'msg': 'QA-failed TMAX set to TMAX = -9999'},
+    {'pass': 2, 'test': ('equals', 'TMIN_M_FLAG', 'L'),
+     'action': ('set', 'TMIN', ncei_missing), 'errcol': 'TMIN_M_ERR',
+     'report': None, 'msg': 'lagged TMIN set to TMIN = -9999'},
+    {'pass': 2, 'test': ('not_equals', 'TMIN_Q_FLAG', ' '),
+     'action': ('set', 'TMIN', ncei_missing), 'errcol': 'TMIN_Q_ERR',
+     'report': None, 'msg': 'QA-failed TMIN set to TMIN = -9999'},
+    # stations with potentially erroneous P values
+    # (evaluation criterion: all of that station's P values = 0)
+    # (outlier detection of extreme values not yet implemented)
+    {'pass': 3, 'test': ('station_sum_le', 'PRCP', 0),
+     'action': ('set', 'PRCP', ncei_missing), 'errcol': 'PRCP_ZERO_ERR',
+     'report': 'station',
+     'msg': 'PRCP of stations with no nonzero PRCP set to PRCP = -9999'},
+    # entries with potentially erroneous values: reversed Tmax and Tmin
+    # values, and outlier T values (not spatial, purely arithmetic)
+    {'pass': 4, 'test': ('greater', 'TMIN', 'TMAX'),
+     'action': ('swap', 'TMAX', 'TMIN'), 'errcol': 'T_REV_ERR',
+     'report': 'date', 'msg': 'entries where Tmax < Tmin, now reversed'},
+    {'pass': 4, 'test': ('date_outlier', 'TMAX', outlier_threshold),
+     'action': ('set', 'TMAX', ncei_missing), 'errcol': 'TMAX_OUTLIER',
+     'report': 'date',
+     'msg': 'outlier Tmax values (p < 0.001), now set to -9999'},
+    {'pass': 4, 'test': ('date_outlier', 'TMIN', outlier_threshold),
+     'action': ('set', 'TMIN', ncei_missing), 'errcol': 'TMIN_OUTLIER',
+     'report': 'date',
+     'msg': 'outlier Tmin values (p < 0.001), now set to -9999'}]
+
+
+def message(char_string):
+    """
+    prints a string to the terminal and flushes the buffer
+    """
+    print char_string
+    sys.stdout.flush()
+    return
+
+
+def get_ncei_columns(fname):
+    """
+    reads the header line of an NCEI '.csv' file and names the measurement
+    and quality flag columns that follow each of PRCP/TMAX/TMIN
+    """
+    idxs = list(pd.read_csv(fname, nrows=0).columns.values)
+    for i, var in enumerate(idxs):
+        if var in ['PRCP', 'TMAX', 'TMIN']:
+            if 'Measurement Flag' in idxs[i + 1]:
+                idxs[i + 1] = '%s_M_FLAG' % var
+            if 'Quality Flag' in idxs[i + 2]:
+                idxs[i + 2] = '%s_Q_FLAG' % var
+    return idxs
+
+
+def as_str_categories(values):
+    """
+    makes sure the categories of a categorical column are plain strings
+    """
+    cats = [c.encode('utf-8') if isinstance(c, unicode) else str(c)
+            for c in values.cat.categories]
+    return values.cat.rename_categories(cats)
+
+
+def read_ncei_chunks(fname, names, chunksize=1000000, columns=metvals):
+    """
+    generator of typed DataFrame chunks with the <metvals> columns (or a
+    subset of them) of an NCEI '.csv' file, given its (renamed) column names
+    from get_ncei_columns()
+    """
+    # other columns (possibly with repeated names) are not read at all
+    unique_names = [name if name in metvals else 'COLUMN_%d' % i
+                    for i, name in enumerate(names)]
+    reader = pd.read_csv(fname, header=0, names=unique_names, usecols=columns,
+                         dtype=metvals_dtypes, na_values=metvals_na,
+                         keep_default_na=False, chunksize=chunksize)
+    for chunk in reader:
+        for col in columns:
+            if metvals_dtypes[col] == 'category':
+                chunk[col] = as_str_categories(chunk[col])
+        yield chunk[columns]
+
+
+def combine_chunks(chunks):
+    """
+    combines typed DataFrame chunks into one, keeping categorical columns
+    categorical (with sorted categories)
+    """
+    columns = {}
+    for col in metvals:
+        if metvals_dtypes[col] == 'category':
+            columns[col] = union_categoricals([chunk[col] for chunk in chunks],
+                                              sort_categories=True)
+        else:
+            columns[col] = np.concatenate([np.array(chunk[col])
+                                           for chunk in chunks])
+    return pd.DataFrame(columns, columns=metvals)
+
+
+def read_ncei_csv(fname, names, chunksize=1000000):
+    """
+    reads the <metvals> columns of an NCEI '.csv' file in typed chunks
+    """
+    chunks = []
+    nrows = 0
+    for chunk in read_ncei_chunks(fname, names, chunksize):
+        chunks.append(chunk)
+        nrows += len(chunk)
+        message('- read %d data rows' % nrows)
+    return combine_chunks(chunks)
+
+
+def ncei_chunks_to_h5(chunks, h5fname, date_bins=None):
+    """
+    writes typed DataFrame chunks of an NCEI dataset into a columnar '.h5'
+    file, one chunk at a time; with <date_bins> (sorted first dates of
+    consecutive date ranges), the rows of each date range are written to
+    their own group ('bins/[i]/') instead of to 'ncei/'
+    """
+    cats = {}
+    codes = {}
+    nrows = {}
+    with hdf.File(h5fname, 'w') as h5file:
+        for chunk in chunks:
+            columns = list(chunk.columns.values)
+            chunk_vals = {}
+            for col in columns:
+                if metvals_dtypes[col] == 'category':
+                    if col not in cats:
+                        cats[col] = []
+                        codes[col] = {}
+                    # map this chunk's category codes onto the file's codes
+                    chunk_codes = []
+                    for cat in chunk[col].cat.categories:
+                        if cat not in codes[col]:
+                            codes[col][cat] = len(cats[col])
+                            cats[col].append(cat)
+                        chunk_codes.append(codes[col][cat])
+                    chunk_vals[col] = np.array(chunk_codes, dtype=np.int32)[
+                        np.array(chunk[col].cat.codes)]
+                else:
+                    chunk_vals[col] = np.array(chunk[col])
+            if date_bins is None:
+                groups = {'ncei': slice(None)}
+            else:
+                chunk_bins = np.searchsorted(date_bins,
+                                             np.array(chunk['DATE']),
+                                             side='right') - 1
+                groups = {}
+                for i in np.unique(chunk_bins):
+                    groups['bins/%d' % i] = chunk_bins == i
+            for group in sorted(groups):
+                rows = groups[group]
+                n = len(chunk_vals[columns[0]][rows])
+                nrows0 = nrows.get(group, 0)
+                for col in columns:
+                    vals = chunk_vals[col][rows]
+                    if nrows0 == 0:
+                        h5file.create_dataset('%s/%s' % (group, col),
+                                              data=vals, maxshape=(None,),
+                                              chunks=True, compression='gzip')
+                    else:
+                        h5file['%s/%s' % (group, col)].resize((nrows0 + n,))
+                        h5file['%s/%s' % (group, col)][nrows0:] = vals
+                nrows[group] = nrows0 + n
+            message('- converted %d data rows' % sum(nrows.values()))
+        for group in nrows:
+            for col in cats:
+                h5file.create_dataset('%s/%s_cats' % (group, col),
+                                      data=cats[col])
+            h5file[group].attrs['nrows'] = nrows[group]
+    return sum(nrows.values())
+
+
+def ncei_csv_to_h5(fname, h5fname, names, chunksize=1000000):
+    """
+    streams the <metvals> columns of an NCEI '.csv' file into a columnar
+    '.h5' file, one chunk at a time (so the '.csv' may be larger than memory)
+    """
+    nrows = ncei_chunks_to_h5(read_ncei_chunks(fname, names, chunksize),
+                              h5fname)
+    with hdf.File(h5fname, 'r+') as h5file:
+        h5file['ncei'].attrs['source'] = os.path.basename(fname)
+        h5file['ncei'].attrs['source_mtime'] = os.path.getmtime(fname)
+    return nrows
+
+
+def read_ncei_h5_columns(h5group, columns=metvals, start=0, stop=None):
+    """
+    reads rows [start:stop] of the columns of an open columnar '.h5' group
+    into a DataFrame
+    """
+    vals = {}
+    for col in columns:
+        vals[col] = h5group[col][start:stop]
+        if metvals_dtypes[col] == 'category':
+            cats = np.copy(h5group['%s_cats' % col])
+            # categories in sorted order, like those read from '.csv'
+            order = np.argsort(cats, kind='mergesort')
+            recode = np.zeros(len(cats), dtype=np.int32)
+            recode[order] = np.arange(len(cats), dtype=np.int32)
+            vals[col] = pd.Categorical.from_codes(recode[vals[col]],
+                                                  [str(c) for c in
+                                                   cats[order]])
+    return pd.DataFrame(vals, columns=columns)
+
+
+def read_ncei_h5(h5fname, group='ncei', columns=metvals):
+    """
+    reads the columnar '.h5' copy of an NCEI dataset (or one date range group
+    of it) into a DataFrame
+    """
+    with hdf.File(h5fname, 'r') as h5file:
+        return read_ncei_h5_columns(h5file[group], columns)
+
+
+def read_ncei_h5_chunks(h5fname, chunksize=1000000, columns=metvals):
+    """
+    generator of DataFrame chunks of the columnar '.h5' copy of an NCEI
+    dataset, like read_ncei_chunks() for the '.csv' file
+    """
+    with hdf.File(h5fname, 'r') as h5file:
+        nrows = len(h5file['ncei/DATE'])
+        for start in range(0, nrows, chunksize):
+            yield read_ncei_h5_columns(h5file['ncei'], columns, start,
+                                       start + chunksize)
+
+
+def ncei_h5_is_current(fname, h5fname):
+    """
+    checks that a columnar '.h5' copy exists and was made from the current
+    version of its '.csv' file
+    """
+    if not os.path.isfile(h5fname):
+        return False
+    with hdf.File(h5fname, 'r') as h5file:
+        if 'ncei' not in h5file.keys():
+            return False
+        attrs = h5file['ncei'].attrs
+        if 'source_mtime' not in attrs.keys():
+            return False
+        if not os.path.isfile(fname):
+            return True
+        return float(attrs['source_mtime']) == os.path.getmtime(fname)
+
+
+def get_date_bins(dates, date_counts, max_rows):
+    """
+    groups sorted dates into consecutive ranges of at most <max_rows> data
+    rows (or a single date, if it alone has more) and returns the first date
+    of each range
+    """
+    date_bins = [dates[0]]
+    nrows = 0
+    for date, count in zip(dates, date_counts):
+        if nrows > 0 and nrows + count > max_rows:
+            date_bins.append(date)
+            nrows = 0
+        nrows += count
+    return np.array(date_bins)
+
+
+def find_outliers(dset, groups, nsigma):
+    """
+    Simplified (simplistic?) implementation of Chauvenet's criterion for
+    outlier detection, within each group (e.g. date) of observations
+    Reference: https://en.wikipedia.org/wiki/Chauvenet%27s_criterion
+    Primary assumption: normally distributed data (may not be correct!)
+    - dset is a float Series with NaN for missing values
+    - returns a boolean mask of the outliers
+    """
+    dset_dev = dset - dset.groupby(groups).transform('mean')
+    dset_std = np.sqrt((dset_dev ** 2).groupby(groups).transform('mean'))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dset_z = np.array(dset_dev / dset_std)
+        outliers = np.abs(dset_z) > nsigma
+    return outliers
+
+
+def qc_mask(df, rule, station_totals=None):
+    """
+    evaluates the test of a QA/QC rule, returning a boolean row mask
+    - station_totals (optional) is a dict of per-station sums of valid
+      values (Series indexed by station) over the whole dataset, by column,
+      for use when <df> is only part of it (see qc_station_totals)
+    """
+    test = rule['test']
+    if test[0] == 'equals':
+        mask = np.array(df[test[1]] == test[2])
+    elif test[0] == 'not_equals':
+        mask = np.array(df[test[1]] != test[2])
+    elif test[0] == 'greater':
+        mask = np.array((df[test[1]] != ncei_missing) &
+                        (df[test[2]] != ncei_missing) &
+                        (df[test[1]] > df[test[2]]))
+    elif test[0] == 'station_sum_le':
+        if station_totals is None:
+            vals = df[test[1]].where(df[test[1]] != ncei_missing, 0)
+            stn_sums = vals.groupby(df['STATION']).transform('sum')
+        else:
+            stn_sums = station_totals[test[1]].reindex(df['STATION'])
+        mask = np.array(stn_sums <= test[2])
+    elif test[0] == 'date_outlier':
+        vals = df[test[1]].where(df[test[1]] != ncei_missing).astype(float)
+        mask = find_outliers(vals, df['DATE'], test[2])
+    return mask
+
+
+def qc_apply(df, rule, mask):
+    """
+    applies the action of a QA/QC rule to the masked rows
+    """
+    action = rule['action']
+    if action[0] == 'set':
+        df.loc[mask, action[1]] = action[2]
+    elif action[0] == 'swap':
+        vals_a = np.array(df.loc[mask, action[1]])
+        df.loc[mask, action[1]] = np.array(df.loc[mask, action[2]])
+        df.loc[mask, action[2]] = vals_a
+    return df
+
+
+def qc_rule_columns(rule):
+    """
+    returns the data columns that a QA/QC rule reads or changes
+    """
+    columns = [rule['test'][1], rule['action'][1]]
+    if rule['test'][0] == 'greater':
+        columns.append(rule['test'][2])
+    if rule['action'][0] == 'swap':
+        columns.append(rule['action'][2])
+    return columns
+
+
+def qc_station_columns():
+    """
+    returns the columns needed to evaluate the per-station QA/QC rules
+    (those columns, and any others used by earlier rules that change them)
+    """
+    columns = ['STATION', 'DATE', 'LATITUDE', 'LONGITUDE']
+    stn_rules = [rule for rule in qc_rules
+                 if rule['test'][0] == 'station_sum_le']
+    if len(stn_rules) == 0:
+        return columns
+    last_pass = max([rule['pass'] for rule in stn_rules])
+    for rule in stn_rules:
+        if rule['test'][1] not in columns:
+            columns.append(rule['test'][1])
+    for rule in sorted(qc_rules, key=lambda r: -r['pass']):
+        if rule['pass'] >= last_pass:
+            continue
+        changed_cols = [rule['action'][1]]
+        if rule['action'][0] == 'swap':
+            changed_cols.append(rule['action'][2])
+        if any([col in columns for col in changed_cols]):
+            for col in qc_rule_columns(rule):
+                if col not in columns:
+                    columns.append(col)
+    return [col for col in metvals if col in columns]
+
+
+def qc_station_totals(df, totals=None):
+    """
+    accumulates the per-station sums of valid values of the columns tested by
+    the per-station QA/QC rules, in a dict of Series indexed by station; <df>
+    is one chunk (with qc_station_columns) of the dataset, with the earlier
+    rules already applied
+    """
+    if totals is None:
+        totals = {}
+    for rule in qc_rules:
+        if rule['test'][0] != 'station_sum_le':
+            continue
+        col = rule['test'][1]
+        vals = df[col].where(df[col] != ncei_missing, 0)
+        sums = vals.groupby(df['STATION'], observed=True).sum()
+        sums.index = sums.index.astype(str)
+        if col in totals:
+            totals[col] = totals[col].add(sums, fill_value=0)
+        else:
+            totals[col] = sums
+    return totals
+
+
+def qc_flags_handled(col):
+    """
+    returns the flag values of a column that are acted upon by a QA/QC rule,
+    or 'all' when any non-blank flag is
+    """
+    handled = []
+    for rule in qc_rules:
+        if rule['test'][1] == col:
+            if rule['test'][0] == 'not_equals':
+                return 'all'
+            handled.append(rule['test'][2])
+    return handled
+
+# end process_NCEI_00_aux.py
@@ -14,12 +14,34 @@ Treat others as you would be treated. Pay it forward. Valar dohaeris.
 PURPOSE: Extract daily station data from cleaned NOAA/NCEI dataset
 
 DEPENDENCIES: h5py, numpy, pandas
+              'UTM_Geo_Convert' module has its own requirements
 
 USAGE: '$ python process_NCEI_01.py NCEI_WLS_20000101-20101231 ./data'
+       '$ python process_NCEI_01.py NCEI_WLS_20000101-20101231 ./data 15'
+       '$ python process_NCEI_01.py NCEI_WLS_20000101-20101231 ./data 15
+        5000000'
+       '$ python process_NCEI_01.py NCEI_WLS_20000101-20101231 ./data 15 0 1'
+
+NOTES: <15> (optional, default 15) is the UTM zone of the study area grid,
+         to which the station locations are projected once here and stored
+         in a station location table ('stn_locs/' in the '.h5' file); the
+         daily '[var]_loc' datasets index that table, so later stages need
+         not reproject the stations every day
+       <5000000> (optional, default 0) is the maximum number of data rows
+         read at a time from the cleaned '.csv' file; with a number > 0, that
+         file must be in date order (from process_NCEI_00.py in streaming
+         mode), and each date is saved as soon as all of its rows are read
+       <1> (optional, default 0) is the flag to save the met data as dense
+         (ndates x nlocations) float32 arrays ('obs/prcp', 'obs/tmax' and
+         'obs/tmin', NaN = missing, with rows by 'obs/dates' and columns by
+         the station location table) instead of as 15 small datasets per
+         date ('metdata/[date]/'); reading one date is then one row slice
+         of each array, and reading one station's history one column slice
 
 INPUT: '.csv' and '.h5' output from process_NCEI_00.py
 
-OUTPUT: Updated '.h5' file with sorted meteorological data (no new files)
+OUTPUT: Updated '.h5' file with sorted meteorological data (per date, or as
+        station-by-date arrays) and station location table (no new files)
 """
 
 
@@ -28,6 +50,7 @@ import datetime
 import h5py as hdf
 import numpy as np
 import pandas as pd
+from UTM_Geo_Convert import geographic_to_utm_array
 
 
 def message(char_string):
@@ -39,63 +62,29 @@ def message(char_string):
     return
 
 
-message(' ')
-message('process_NCEI_01.py started at %s' %
-        datetime.datetime.now().isoformat())
-message(' ')
-#
-if len(sys.argv) < 3:
-    message('input warning: no data directory path indicated, using ./data')
-    path = './data'
-else:
-    path = sys.argv[2]
-#
-if len(sys.argv) < 2:
-    message('input error: need prefix for files containing NCEI weather data')
-    sys.exit(1)
-else:
-    NCEIfname = sys.argv[1]
-datafile = '%s/%s_cleaned.csv' % (path, NCEIfname)
-h5fname = '%s/%s_processed.h5' % (path, NCEIfname)
-#
-message('reading station and date information from %s' % h5fname)
-with hdf.File(h5fname, 'r') as h5infile:
-    stn_id = np.copy(h5infile['stn_id'])
-    dates = np.copy(h5infile['dates'])
-message('- identifiers for %d stations found' % len(stn_id))
-message('- meteorological data for %d dates found' % len(dates))
-message(' ')
-#
-message('loading weather observation information from %s' % datafile)
-stndata_df = pd.read_csv(datafile, low_memory=False)
-ndatarows, ndatacols = np.shape(stndata_df)
-message('- read %d total data rows with %d columns' % (ndatarows, ndatacols))
-stndata_df = stndata_df.drop(['Unnamed: 0', 'IDX'], axis=1)
-message('- dropped index columns')
-#
-# sanity (data integrity) check
-metvals = ['STATION', 'STATION_NAME', 'ELEVATION', 'LATITUDE', 'LONGITUDE',
-           'DATE', 'PRCP', 'PRCP_M_FLAG', 'PRCP_Q_FLAG', 'TMAX', 'TMAX_M_FLAG',
-           'TMAX_Q_FLAG', 'TMIN', 'TMIN_M_FLAG', 'TMIN_Q_FLAG']
-idxs = list(stndata_df.columns.values)
-if idxs == metvals:
-    stndata_df = stndata_df.drop(['PRCP_M_FLAG', 'PRCP_Q_FLAG',
-                                  'TMAX_M_FLAG', 'TMAX_Q_FLAG',
-                                  'TMIN_M_FLAG', 'TMIN_Q_FLAG'], axis=1)
-    message('- dropped data flag columns')
-else:
-    message('input error: cleaned NCEI weather data file does not have the \
-            expected fields')
-    message('   expected %s' % str(metvals))
-    message('  but found %s' % str(idxs))
-    sys.exit(1)
-message(' ')
-#
-# sort dataset by date and station, and process met values by date
-stndata_df = stndata_df.sort_values(by=['DATE', 'STATION'])
-for date in dates:
-    message('gathering met data for %d' % date)
-    date_df = stndata_df[stndata_df['DATE'] == date]
+def check_columns(stndata_df):
+    """
+    checks the columns of (a chunk of) the cleaned dataset and drops the
+    index and data flag columns
+    """
+    stndata_df = stndata_df.drop(['Unnamed: 0', 'IDX'], axis=1)
+    idxs = list(stndata_df.columns.values)
+    if idxs != metvals:
+        message('input error: cleaned NCEI weather data file does not have \
+                the expected fields')
+        message('   expected %s' % str(metvals))
+        message('  but found %s' % str(idxs))
+        sys.exit(1)
+    return stndata_df.drop(['PRCP_M_FLAG', 'PRCP_Q_FLAG', 'TMAX_M_FLAG',
+                            'TMAX_Q_FLAG', 'TMIN_M_FLAG', 'TMIN_Q_FLAG'],
+                           axis=1)
+
+
+def save_date_metdata(h5file, date, date_df):
+    """
+    saves the valid met values of one date, with their stations, locations
+    and station location table indices, to the open '.h5' file
+    """
     nr, nc = np.shape(date_df)
     message('- found %d total rows' % nr)
     #
@@ -103,6 +92,7 @@ for date in dates:
     prcp_stns = list(prcp_valid_df['STATION'])
     prcp_lat = np.array(prcp_valid_df['LATITUDE'])
     prcp_lon = np.array(prcp_valid_df['LONGITUDE'])
+    prcp_loc = np.array(prcp_valid_df['LOC'], dtype=np.int32)
     # convert PRCP from 0.1mm to cm
     prcp_vals = np.array(prcp_valid_df['PRCP']) / 100.0
     message('-- %d stns with PRCP data (mean %.1f  stdev %.1f  min %.1f \
@@ -114,6 +104,7 @@ for date in dates:
     tmax_stns = list(tmax_valid_df['STATION'])
     tmax_lat = np.array(tmax_valid_df['LATITUDE'])
     tmax_lon = np.array(tmax_valid_df['LONGITUDE'])
+    tmax_loc = np.array(tmax_valid_df['LOC'], dtype=np.int32)
     # convert TMAX from 0.1dC to dC
     tmax_vals = np.array(tmax_valid_df['TMAX']) / 10.0
     message('-- %d stns with TMAX data (mean %.1f  stdev %.1f  min %.1f  \
@@ -125,6 +116,7 @@ for date in dates:
     tmin_stns = list(tmin_valid_df['STATION'])
     tmin_lat = np.array(tmin_valid_df['LATITUDE'])
     tmin_lon = np.array(tmin_valid_df['LONGITUDE'])
+    tmin_loc = np.array(tmin_valid_df['LOC'], dtype=np.int32)
     # convert TMIN from 0.1dC to dC
     tmin_vals = np.array(tmin_valid_df['TMIN']) / 10.0
     message('-- %d stns with TMIN data (mean %.1f  stdev %.1f  min %.1f  \
@@ -132,32 +124,258 @@ for date in dates:
                           np.std(tmin_vals), np.min(tmin_vals),
                           np.max(tmin_vals)))
     #
-    message('- saving %d met data to %s' % (date, h5fname))
-    with hdf.File(h5fname, 'r+') as h5file:
-        if 'last_updated' in h5file['meta'].keys():
-            del h5file['meta/last_updated']
-        h5file.create_dataset('meta/last_updated',
-                              data=datetime.datetime.now().isoformat())
-        if 'at' in h5file['meta'].keys():
-            del h5file['meta/at']
-        h5file.create_dataset('meta/at', data=date)
-        datepath = 'metdata/%d' % date
-        if 'metdata' in h5file.keys():
-            if date in h5file['metdata'].keys():
-                del h5file[datepath]
-        h5file.create_dataset(datepath + '/prcp_stns', data=prcp_stns)
-        h5file.create_dataset(datepath + '/prcp_lat', data=prcp_lat)
-        h5file.create_dataset(datepath + '/prcp_lon', data=prcp_lon)
-        h5file.create_dataset(datepath + '/prcp_vals', data=prcp_vals)
-        h5file.create_dataset(datepath + '/tmax_stns', data=tmax_stns)
-        h5file.create_dataset(datepath + '/tmax_lat', data=tmax_lat)
-        h5file.create_dataset(datepath + '/tmax_lon', data=tmax_lon)
-        h5file.create_dataset(datepath + '/tmax_vals', data=tmax_vals)
-        h5file.create_dataset(datepath + '/tmin_stns', data=tmin_stns)
-        h5file.create_dataset(datepath + '/tmin_lat', data=tmin_lat)
-        h5file.create_dataset(datepath + '/tmin_lon', data=tmin_lon)
-        h5file.create_dataset(datepath + '/tmin_vals', data=tmin_vals)
+    message('- saving %d met data' % date)
+    datepath = 'metdata/%d' % date
+    if datepath in h5file:
+        del h5file[datepath]
+    h5file.create_dataset(datepath + '/prcp_stns', data=prcp_stns)
+    h5file.create_dataset(datepath + '/prcp_lat', data=prcp_lat)
+    h5file.create_dataset(datepath + '/prcp_lon', data=prcp_lon)
+    h5file.create_dataset(datepath + '/prcp_loc', data=prcp_loc)
+    h5file.create_dataset(datepath + '/prcp_vals', data=prcp_vals)
+    h5file.create_dataset(datepath + '/tmax_stns', data=tmax_stns)
+    h5file.create_dataset(datepath + '/tmax_lat', data=tmax_lat)
+    h5file.create_dataset(datepath + '/tmax_lon', data=tmax_lon)
+    h5file.create_dataset(datepath + '/tmax_loc', data=tmax_loc)
+    h5file.create_dataset(datepath + '/tmax_vals', data=tmax_vals)
+    h5file.create_dataset(datepath + '/tmin_stns', data=tmin_stns)
+    h5file.create_dataset(datepath + '/tmin_lat', data=tmin_lat)
+    h5file.create_dataset(datepath + '/tmin_lon', data=tmin_lon)
+    h5file.create_dataset(datepath + '/tmin_loc', data=tmin_loc)
+    h5file.create_dataset(datepath + '/tmin_vals', data=tmin_vals)
+    message(' ')
+    return
+
+
+def init_obs_arrays(h5file, dates, nlocs):
+    """
+    creates the (ndates x nlocs) float32 observation arrays in the open '.h5'
+    file, and returns a buffer for blocks of their rows (one row per date)
+    """
+    block_rows = min(len(dates), 32)
+    if 'obs' in h5file.keys():
+        del h5file['obs']
+    h5file.create_dataset('obs/dates', data=dates)
+    obs_block = {'dates': np.array(dates), 'start': 0, 'nrows': block_rows}
+    for var in ['prcp', 'tmax', 'tmin']:
+        h5file.create_dataset('obs/%s' % var, shape=(len(dates), nlocs),
+                              dtype=np.float32,
+                              chunks=(block_rows, min(nlocs, 256)),
+                              fillvalue=np.nan, compression='gzip')
+        obs_block[var] = np.full((block_rows, nlocs), np.nan,
+                                 dtype=np.float32)
+    return obs_block
+
+
+def write_obs_block(h5file, obs_block):
+    """
+    writes the buffered block of rows to the observation arrays
+    """
+    start = obs_block['start']
+    nrows = min(obs_block['nrows'], len(obs_block['dates']) - start)
+    for var in ['prcp', 'tmax', 'tmin']:
+        h5file['obs/%s' % var][start:start + nrows, :] = \
+            obs_block[var][:nrows, :]
+    return
+
+
+def save_date_obs(h5file, obs_block, date, date_df):
+    """
+    saves the valid met values of one date as its row of the observation
+    arrays, at the columns of their station location table indices (through
+    the block buffer, which is written out whenever a date falls past it)
+    """
+    irow = int(np.searchsorted(obs_block['dates'], date))
+    if irow >= obs_block['start'] + obs_block['nrows']:
+        write_obs_block(h5file, obs_block)
+        obs_block['start'] = irow - (irow % obs_block['nrows'])
+        for var in ['prcp', 'tmax', 'tmin']:
+            obs_block[var][:, :] = np.nan
+    nr, nc = np.shape(date_df)
+    message('- found %d total rows' % nr)
+    locs = np.array(date_df['LOC'], dtype=np.int32)
+    # convert PRCP from 0.1mm to cm, and TMAX/TMIN from 0.1dC to dC
+    for var, scale in [('prcp', 100.0), ('tmax', 10.0), ('tmin', 10.0)]:
+        vals = np.array(date_df[var.upper()])
+        valid = vals != -9999
+        obs_block[var][irow - obs_block['start'], locs[valid]] = \
+            vals[valid] / scale
+        message('-- %d stns with %s data' % (np.sum(valid), var.upper()))
     message(' ')
+    return
+
+
+def save_date(h5file, date, date_df):
+    """
+    saves the met data of one date in the chosen layout
+    """
+    if use_obs_arrays:
+        save_date_obs(h5file, obs_block, date, date_df)
+    else:
+        save_date_metdata(h5file, date, date_df)
+    return
+
+
+def update_meta(h5file, date):
+    """
+    updates the processing metadata of the open '.h5' file
+    """
+    if 'last_updated' in h5file['meta'].keys():
+        del h5file['meta/last_updated']
+    h5file.create_dataset('meta/last_updated',
+                          data=datetime.datetime.now().isoformat())
+    if 'at' in h5file['meta'].keys():
+        del h5file['meta/at']
+    h5file.create_dataset('meta/at', data=date)
+    return
+
+
+# sanity (data integrity) check
+metvals = ['STATION', 'STATION_NAME', 'ELEVATION', 'LATITUDE', 'LONGITUDE',
+           'DATE', 'PRCP', 'PRCP_M_FLAG', 'PRCP_Q_FLAG', 'TMAX', 'TMAX_M_FLAG',
+           'TMAX_Q_FLAG', 'TMIN', 'TMIN_M_FLAG', 'TMIN_Q_FLAG']
+#
+message(' ')
+message('process_NCEI_01.py started at %s' %
+        datetime.datetime.now().isoformat())
+message(' ')
+#
+if len(sys.argv) < 6:
+    use_obs_arrays = 0
+else:
+    use_obs_arrays = int(sys.argv[5])
+#
+if len(sys.argv) < 5:
+    chunk_rows = 0
+else:
+    chunk_rows = int(sys.argv[4])
+#
+if len(sys.argv) < 4:
+    message('input warning: no UTM zone indicated, using 15')
+    UTMzone = 15
+else:
+    UTMzone = int(sys.argv[3])
+#
+if len(sys.argv) < 3:
+    message('input warning: no data directory path indicated, using ./data')
+    path = './data'
+else:
+    path = sys.argv[2]
+#
+if len(sys.argv) < 2:
+    message('input error: need prefix for files containing NCEI weather data')
+    sys.exit(1)
+else:
+    NCEIfname = sys.argv[1]
+datafile = '%s/%s_cleaned.csv' % (path, NCEIfname)
+h5fname = '%s/%s_processed.h5' % (path, NCEIfname)
+#
+message('reading station and date information from %s' % h5fname)
+with hdf.File(h5fname, 'r') as h5infile:
+    stn_id = np.copy(h5infile['stn_id'])
+    dates = np.copy(h5infile['dates'])
+    if 'sorted_by' in h5infile['meta'].keys():
+        sorted_by = str(h5infile['meta/sorted_by'][()])
+    else:
+        sorted_by = 'STATION'
+message('- identifiers for %d stations found' % len(stn_id))
+message('- meteorological data for %d dates found' % len(dates))
+message(' ')
+#
+if chunk_rows == 0:
+    message('loading weather observation information from %s' % datafile)
+    stndata_df = pd.read_csv(datafile, low_memory=False)
+    ndatarows, ndatacols = np.shape(stndata_df)
+    message('- read %d total data rows with %d columns' %
+            (ndatarows, ndatacols))
+    stndata_df = check_columns(stndata_df)
+    message('- dropped index and data flag columns')
+    locs_df = stndata_df[['STATION', 'LATITUDE', 'LONGITUDE']]
+else:
+    if sorted_by != 'DATE':
+        message('input error: cleaned NCEI weather data file is not in date \
+                order; run process_NCEI_00.py in streaming mode, or run this \
+                script without a maximum number of data rows')
+        sys.exit(1)
+    message('reading station locations from %s (%d data rows at a time)' %
+            (datafile, chunk_rows))
+    locs_dfs = []
+    for chunk in pd.read_csv(datafile, usecols=['STATION', 'LATITUDE',
+                                                'LONGITUDE'],
+                             chunksize=chunk_rows):
+        locs_dfs.append(chunk.drop_duplicates())
+    locs_df = pd.concat(locs_dfs)
+message(' ')
+#
+# project each distinct station location once, and index all rows to it
+locs_df = locs_df.drop_duplicates()
+locs_df = locs_df.sort_values(by=['STATION', 'LATITUDE', 'LONGITUDE'])
+locs_df['LOC'] = np.arange(len(locs_df), dtype=np.int32)
+message('projecting %d station locations to UTM zone %d' %
+        (len(locs_df), UTMzone))
+loc_east, loc_north = \
+    geographic_to_utm_array(np.array(locs_df['LONGITUDE']),
+                            np.array(locs_df['LATITUDE']), UTMzone)
+message('- saving station location table to %s' % h5fname)
+with hdf.File(h5fname, 'r+') as h5file:
+    if 'stn_locs' in h5file.keys():
+        del h5file['stn_locs']
+    h5file.create_dataset('stn_locs/UTMzone', data=UTMzone)
+    h5file.create_dataset('stn_locs/stn_id', data=list(locs_df['STATION']))
+    h5file.create_dataset('stn_locs/lat', data=np.array(locs_df['LATITUDE']))
+    h5file.create_dataset('stn_locs/lon',
+                          data=np.array(locs_df['LONGITUDE']))
+    h5file.create_dataset('stn_locs/easting', data=loc_east)
+    h5file.create_dataset('stn_locs/northing', data=loc_north)
+message(' ')
+#
+# sort dataset by date and station, and process met values by date, with
+# the '.h5' file open for all of the dates
+message('saving met data to %s' % h5fname)
+message(' ')
+h5file = hdf.File(h5fname, 'r+')
+if use_obs_arrays:
+    message('- as (%d dates x %d locations) arrays' % (len(dates),
+                                                      len(locs_df)))
+    message(' ')
+    obs_block = init_obs_arrays(h5file, dates, len(locs_df))
+if chunk_rows == 0:
+    stndata_df = pd.merge(stndata_df, locs_df,
+                          on=['STATION', 'LATITUDE', 'LONGITUDE'], how='left')
+    stndata_df = stndata_df.sort_values(by=['DATE', 'STATION'])
+    # each date's rows are one contiguous slice of the sorted dataset
+    date_vals = np.array(stndata_df['DATE'])
+    date_starts = np.searchsorted(date_vals, dates, side='left')
+    date_ends = np.searchsorted(date_vals, dates, side='right')
+    for date, i0, i1 in zip(dates, date_starts, date_ends):
+        message('gathering met data for %d' % date)
+        save_date(h5file, date, stndata_df.iloc[i0:i1])
+    last_date = dates[-1]
+else:
+    # the rows of the last date in each chunk are held back until the rows
+    # of the next date are found
+    held_df = None
+    for chunk in pd.read_csv(datafile, chunksize=chunk_rows):
+        chunk = check_columns(chunk)
+        chunk = pd.merge(chunk, locs_df,
+                         on=['STATION', 'LATITUDE', 'LONGITUDE'], how='left')
+        if held_df is not None:
+            chunk = pd.concat([held_df, chunk])
+        chunk = chunk.sort_values(by=['DATE', 'STATION'])
+        last_date = chunk['DATE'].iloc[-1]
+        held_df = chunk[chunk['DATE'] == last_date]
+        chunk = chunk[chunk['DATE'] != last_date]
+        for date, date_df in chunk.groupby('DATE', sort=True):
+            message('gathering met data for %d' % date)
+            save_date(h5file, date, date_df)
+        h5file.flush()
+    if held_df is not None:
+        message('gathering met data for %d' % last_date)
+        save_date(h5file, last_date, held_df)
+if use_obs_arrays:
+    write_obs_block(h5file, obs_block)
+update_meta(h5file, last_date)
+h5file.close()
 #
 message('process_NCEI_01.py completed at %s' %
         datetime.datetime.now().isoformat())
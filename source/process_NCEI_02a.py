@@ -23,10 +23,20 @@ NOTES: <NCEI_WLS_19840101-20131231> is the '_processed.h5' file prefix in your
 
 INPUT: '.h5' output from process_NCEI_01.py
 
-OUTPUT: annual '.h5' files with original meteorological data
+NOTES: The annual files hold only their own list of dates; the station list,
+       station location table, and met data (per-date groups, or the
+       station-by-date 'obs/' arrays, see process_NCEI_01.py) are HDF5
+       external links into the multi-year file, so no data is copied and
+       the multi-year file must stay in the same directory
+       process_NCEI_02b.py can also read a date range from the multi-year
+       file directly, without these annual files
+
+OUTPUT: annual '.h5' files that link to the original meteorological data (and
+        station location table, if present)
 """
 
 
+import os
 import sys
 import datetime
 import h5py as hdf
@@ -65,12 +75,18 @@ message('reading station and date information from %s' % h5infname)
 with hdf.File(h5infname, 'r') as h5infile:
     stn_id = np.copy(h5infile['stn_id'])
     all_dates = np.copy(h5infile['dates'])
+    have_stn_locs = 'stn_locs' in h5infile.keys()
+    have_obs_arrays = 'obs' in h5infile.keys()
 all_years = sorted(list(set([int(j // 1E4) for j in all_dates])))
 message('- identifiers for %d stations found' % len(stn_id))
 message('- meteorological data for %d total dates found' % len(all_dates))
 message(' ')
 #
+# links are stored relative to the annual file, which is in the same
+# directory as the multi-year file
+h5inlink = os.path.basename(h5infname)
 for year in all_years:
+    year_dates = all_dates[all_dates // 10000 == year]
     h5outfname = '%s/%s_%s_%d_processed.h5' % (path, parts[0], parts[1], year)
     with hdf.File(h5outfname, 'w') as h5file:
         h5file.create_dataset('meta/filename', data=h5outfname)
@@ -80,55 +96,22 @@ for year in all_years:
                               data='M. Garcia, UWisconsin-Madison FWE')
         h5file.create_dataset('meta/last_updated',
                               data=datetime.datetime.now().isoformat())
-        h5file.create_dataset('meta/at',
-                              data='unique stations list, dates list')
-        h5file.create_dataset('stn_id', data=stn_id)
-        h5file.create_dataset('dates', data=all_dates)
-    message('initialized processing metadata in %s' % h5outfname)
-message(' ')
-#
-for date in all_dates:
-    message('transferring station information and met data for %d' % date)
-    with hdf.File(h5infname, 'r') as h5infile:
-        datepath = 'metdata/%d' % date
-        prcp_stns = np.copy(h5infile['%s/prcp_stns' % datepath])
-        prcp_lat = np.copy(h5infile['%s/prcp_lat' % datepath])
-        prcp_lon = np.copy(h5infile['%s/prcp_lon' % datepath])
-        prcp_vals = np.copy(h5infile['%s/prcp_vals' % datepath])
-        tmax_stns = np.copy(h5infile['%s/tmax_stns' % datepath])
-        tmax_lat = np.copy(h5infile['%s/tmax_lat' % datepath])
-        tmax_lon = np.copy(h5infile['%s/tmax_lon' % datepath])
-        tmax_vals = np.copy(h5infile['%s/tmax_vals' % datepath])
-        tmin_stns = np.copy(h5infile['%s/tmin_stns' % datepath])
-        tmin_lat = np.copy(h5infile['%s/tmin_lat' % datepath])
-        tmin_lon = np.copy(h5infile['%s/tmin_lon' % datepath])
-        tmin_vals = np.copy(h5infile['%s/tmin_vals' % datepath])
-    year = date // 1E4
-    h5outfname = '%s/%s_%s_%d_processed.h5' % (path, parts[0], parts[1], year)
-    with hdf.File(h5outfname, 'r+') as h5outfile:
-        if 'last_updated' in h5outfile['meta'].keys():
-            del h5outfile['meta/last_updated']
-        h5outfile.create_dataset('meta/last_updated',
-                                 data=datetime.datetime.now().isoformat())
-        if 'at' in h5outfile['meta'].keys():
-            del h5outfile['meta/at']
-        h5outfile.create_dataset('meta/at', data=date)
-        datepath = 'metdata/%d' % date
-        if 'metdata' in h5outfile.keys():
-            if date in h5outfile['metdata'].keys():
-                del h5outfile[datepath]
-        h5outfile.create_dataset(datepath + '/prcp_stns', data=prcp_stns)
-        h5outfile.create_dataset(datepath + '/prcp_lat', data=prcp_lat)
-        h5outfile.create_dataset(datepath + '/prcp_lon', data=prcp_lon)
-        h5outfile.create_dataset(datepath + '/prcp_vals', data=prcp_vals)
-        h5outfile.create_dataset(datepath + '/tmax_stns', data=tmax_stns)
-        h5outfile.create_dataset(datepath + '/tmax_lat', data=tmax_lat)
-        h5outfile.create_dataset(datepath + '/tmax_lon', data=tmax_lon)
-        h5outfile.create_dataset(datepath + '/tmax_vals', data=tmax_vals)
-        h5outfile.create_dataset(datepath + '/tmin_stns', data=tmin_stns)
-        h5outfile.create_dataset(datepath + '/tmin_lat', data=tmin_lat)
-        h5outfile.create_dataset(datepath + '/tmin_lon', data=tmin_lon)
-        h5outfile.create_dataset(datepath + '/tmin_vals', data=tmin_vals)
+        h5file.create_dataset('meta/at', data=year_dates[-1])
+        h5file.create_dataset('meta/linked_to', data=h5inlink)
+        h5file['stn_id'] = hdf.ExternalLink(h5inlink, 'stn_id')
+        h5file.create_dataset('dates', data=year_dates)
+        if have_stn_locs:
+            h5file['stn_locs'] = hdf.ExternalLink(h5inlink, 'stn_locs')
+        if have_obs_arrays:
+            # rows are located by date in 'obs/dates', so the whole arrays
+            # are linked and only this year's rows are ever read
+            h5file['obs'] = hdf.ExternalLink(h5inlink, 'obs')
+        else:
+            for date in year_dates:
+                datepath = 'metdata/%d' % date
+                h5file[datepath] = hdf.ExternalLink(h5inlink, datepath)
+    message('linked %d dates of met data for %d in %s' %
+            (len(year_dates), year, h5outfname))
 message(' ')
 #
 message('process_NCEI_02a.py completed at %s' %
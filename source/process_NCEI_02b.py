@@ -20,6 +20,8 @@ CHOICES: RBF - multiquadric radial basis functions, a SciPy built-in method
          BSP - bivariate cubic B-splines, a SciPy built-in method
          IDW - inverse-distance-squared for temperature and -cubed for
                precipitation
+         KDW - IDW as above, limited to the nearest stations of each grid
+               cell via a k-d tree (a SciPy built-in method)
 
 NOTES: RBF is an exact full-domain method with an excellent daily processing
        time. CSP is just about as fast but may not cover the whole desired
@@ -28,22 +30,57 @@ NOTES: RBF is an exact full-domain method with an excellent daily processing
        some weird patterns between stations. BSP does cover the whole desired
        domain but also gets weird in areas with low station density,
        especially near the edges of the domain. IDW maps often show isolated
-       bull's-eye patterns that are difficult to smooth out.
+       bull's-eye patterns that are difficult to smooth out. KDW gives
+       nearly the same maps as IDW, but its memory use does not grow with
+       the number of stations times the number of grid cells, so it is
+       practical at much finer grid resolution.
 
 DEPENDENCIES: h5py, numpy
-              'UTM_Geo_Convert', 'Interpolation', and 'Plots' modules have
-                their own requirements
+              'UTM_Geo_Convert', 'Interpolation', 'Plots', 'Provenance', and
+                'Storage_Policy' modules have their own requirements
 
 USAGE: '$ python process_NCEI_02b.py NLCD_2011_WLS_UTM15N
         NCEI_WLS_19840101-20131231 ./grids 500 RBF 1'
+       '$ python process_NCEI_02b.py NLCD_2011_WLS_UTM15N
+        NCEI_WLS_19840101-20131231 ./grids 500 KDW 0 1'
+       '$ python process_NCEI_02b.py NLCD_2011_WLS_UTM15N
+        NCEI_WLS_19840101-20131231 ./grids 500 RBF 0 0 32'
+       '$ python process_NCEI_02b.py NLCD_2011_WLS_UTM15N
+        NCEI_WLS_19840101-20131231 ./grids 500 RBF 0 0 1 32'
+       '$ python process_NCEI_02b.py NLCD_2011_WLS_UTM15N
+        NCEI_WLS_19840101-20131231 ./grids 500 RBF 0 0 1 4 1984'
 
 NOTES: <NCEI_WLS_19840101-20131231> is the '_processed.h5' file prefix in your
        'data/' directory
        <500> is the (default) output grid resolution in meters
        <RBF> is the (default) interpolation method
        <1> is the (default) flag to plot the resulting daily grids
+       <1> (optional, default 0) is the flag to store and reuse the RBF or
+         KDW interpolation operator of each station set in the weights file
+         'data/[NLCD prefix]_[method]_weights.h5'; worthwhile when the same
+         station sets recur, e.g. when regridding again after new QC
+       <32> (optional, default 1) is the number of dates read and
+         interpolated together; with RBF or KDW, the variable-days in a batch
+         that share a station configuration are solved at once as multiple
+         right-hand sides, which is several times faster than one day at a
+         time (memory use grows with the batch size)
+       <32> (optional, default 1) is the number of worker processes among
+         which all (batches of) dates are queued; each worker writes its own
+         daily output files, and progress with an estimated time remaining
+         is reported as dates are completed (the weights file is not used
+         with more than 1 worker)
+       <1984> or <19840101-19841231> (optional, default all dates) is the
+         year or range of dates to grid, so that each (HTCondor) job can
+         read its own dates from the multi-year file instead of from an
+         annual file made by process_NCEI_02a.py
+       Known bad stations listed in 'data/NCEI_bad_stations.txt' (one station
+         identifier per line; or in a copy in the working directory, as
+         transferred to an HTCondor job) are left out of the interpolations;
+         if that file is missing, the two stations of earlier versions are
+         left out, with a warning
 
-INPUT: '.h5' output file from process_NCEI_01.py (or process_NCEI_02a.py)
+INPUT: '.h5' output file from process_NCEI_01.py (or process_NCEI_02a.py),
+       with per-date datasets or station-by-date arrays
        A header file corresponding to your study region's map boundaries
        (possibly from a clipped NLCD grid)
 
@@ -62,14 +99,24 @@ OUTPUT: Daily '.h5' file with original met data and gridded fields (1 / day)
 """
 
 
+import os
 import sys
+import time
 import datetime
+import itertools
+import multiprocessing
 import h5py as hdf
 import numpy as np
 import Interpolation
-from UTM_Geo_Convert import geographic_to_utm
+from UTM_Geo_Convert import geographic_to_utm_array
 from Read_Header_Files import get_bil_hdr_info
 from Plots import p_map_plot, t_map_plot
+from Storage_Policy import create_grid, storage_settings
+from Provenance import set_provenance
+
+
+# used if 'data/NCEI_bad_stations.txt' is missing
+default_bad_stns = ['GHCND:USC00214884', 'GHCND:CA006041109']
 
 
 def message(char_string):
@@ -82,57 +129,47 @@ def message(char_string):
 
 
 def get_stn_coords(lats, lons, UTMz):
-    easts = []
-    norths = []
-    nstns = len(lats)
-    for i in range(nstns):
-        UTM_coords = geographic_to_utm(lons[i].astype(np.float64),
-                                       lats[i].astype(np.float64), UTMz)
-        easts.append(int(round(UTM_coords[1], 0)))
-        norths.append(int(round(UTM_coords[2], 0)))
+    easts, norths = geographic_to_utm_array(lons, lats, UTMz)
+    easts = np.round(easts, 0).astype(int)
+    norths = np.round(norths, 0).astype(int)
     return easts, norths
 
 
+def get_bad_stns(fname):
+    """
+    reads the list of known bad stations (one identifier per line, '#' for
+    comments), or returns the built-in list if that file is missing
+    """
+    if not os.path.isfile(fname):
+        message('input warning: %s not found, using built-in list' % fname)
+        return list(default_bad_stns)
+    bad_stns = []
+    with open(fname, 'r') as bad_file:
+        for line in bad_file:
+            line = line.split('#')[0].strip()
+            if len(line) > 0:
+                bad_stns.append(line)
+    return bad_stns
+
+
 def check_duplicates(stns, east, north, vals):
-    nstns = len(stns)
+    stns = np.asarray(stns)
+    east = np.asarray(east)
+    north = np.asarray(north)
+    vals = np.asarray(vals)
     # first remove known bad stations
-    bad_stns = ['GHCND:USC00214884', 'GHCND:CA006041109']
-    bad_idxs = []
-    for i in range(nstns):
-        if stns[i] in bad_stns:
-            bad_idxs.append(i)
-    nbad = len(bad_idxs)
+    good = ~np.in1d(stns, bad_stns)
+    nbad = len(stns) - np.sum(good)
     if nbad > 0:
-        bad_idxs = sorted(bad_idxs, reverse=True)
-        for idx in bad_idxs:
-            stns = np.delete(stns, idx)
-            east = np.delete(east, idx)
-            north = np.delete(north, idx)
-            vals = np.delete(vals, idx)
-    # now check for duplicate locations
-    nstns = len(stns)
-    ndups = 0
-    e_n_pairs = []
-    for i in range(nstns):
-        e_n_pairs.append((east[i], north[i]))
-    unique_pairs = list(set(e_n_pairs))
-    if nstns != len(unique_pairs):
-        dup_loc_idxs = []
-        for i, u_pair in enumerate(unique_pairs):
-            n_entries = 0
-            for j, en_pair in enumerate(e_n_pairs):
-                if en_pair == u_pair:
-                    n_entries += 1
-                    if n_entries > 1:
-                        dup_loc_idxs.append(j)
-        ndups = len(dup_loc_idxs)
-        if ndups > 0:
-            dup_loc_idxs = sorted(dup_loc_idxs, reverse=True)
-            for idx in dup_loc_idxs:
-                stns = np.delete(stns, idx)
-                east = np.delete(east, idx)
-                north = np.delete(north, idx)
-                vals = np.delete(vals, idx)
+        stns, east, north, vals = \
+            stns[good], east[good], north[good], vals[good]
+    # now check for duplicate locations, keeping the first station at each
+    _, first_idxs = np.unique(east + 1j * north, return_index=True)
+    ndups = len(stns) - len(first_idxs)
+    if ndups > 0:
+        keep = np.sort(first_idxs)
+        stns, east, north, vals = \
+            stns[keep], east[keep], north[keep], vals[keep]
     return stns, east, north, vals, ndups, nbad
 
 
@@ -144,6 +181,24 @@ def process_grid_idw(xgrid, ygrid, grid_shp,
     return grid_var
 
 
+def process_grid_kdw(xgrid, ygrid, grid_shp,
+                     stns, stns_e, stns_n, stns_vals, exp):
+    if use_weights_file:
+        grid_var_flat = Interpolation.cached_kdw(stns, stns_e, stns_n,
+                                                 stns_vals, xgrid, ygrid, exp,
+                                                 h5wfile, grid_id,
+                                                 kdw_neighbors, kdw_radius)
+    else:
+        grid_var_flat = Interpolation.kdtree_idw(stns_e, stns_n, stns_vals,
+                                                 xgrid, ygrid, exp,
+                                                 kdw_neighbors, kdw_radius)
+    if np.ndim(stns_vals) > 1:
+        grid_var = grid_var_flat.T.reshape((-1,) + grid_shp)
+    else:
+        grid_var = grid_var_flat.reshape(grid_shp)
+    return grid_var
+
+
 def process_grid_csp(xgrid, ygrid, stns_e, stns_n, stns_vals):
     grid_var = Interpolation.scipy_griddata(stns_e, stns_n, stns_vals,
                                             xgrid, ygrid)
@@ -157,12 +212,294 @@ def process_grid_bsp(xgrid, ygrid, stns_e, stns_n, stns_vals):
     return grid_var
 
 
-def process_grid_rbf(xgrid, ygrid, stns_e, stns_n, stns_vals):
-    grid_var = Interpolation.scipy_rbf(stns_e, stns_n, stns_vals,
-                                       xgrid, ygrid)
+def process_grid_rbf(xgrid, ygrid, stns, stns_e, stns_n, stns_vals):
+    grid_var = Interpolation.cached_rbf(stns, stns_e, stns_n, stns_vals,
+                                        xgrid, ygrid, rbf_cache)
     return grid_var
 
 
+def get_day_obs(h5infile, date, var, UTMz):
+    """
+    reads one variable's station data for one date from the open processed
+    file, looks up (or projects) the station coordinates, and removes bad
+    stations and duplicates
+    """
+    if use_obs_arrays:
+        # one row of the station-by-date array, valid values only
+        irow = int(np.searchsorted(obs_dates, date))
+        if irow == len(obs_dates) or obs_dates[irow] != date:
+            raise KeyError('no %s data for %d in %s' % (var, date,
+                                                         h5infname))
+        row = h5infile['obs/%s' % var][irow, :]
+        locs = np.where(~np.isnan(row))[0]
+        stns = stn_locs_id[locs]
+        lat = stn_locs_lat[locs]
+        lon = stn_locs_lon[locs]
+        vals = row[locs].astype(float)
+    else:
+        datepath = 'metdata/%d/%s' % (date, var)
+        stns = np.copy(h5infile[datepath + '_stns'])
+        lat = np.copy(h5infile[datepath + '_lat'])
+        lon = np.copy(h5infile[datepath + '_lon'])
+        vals = np.copy(h5infile[datepath + '_vals'])
+        if datepath + '_loc' in h5infile:
+            locs = np.copy(h5infile[datepath + '_loc'])
+        else:
+            locs = None
+    if use_stn_locs and locs is not None:
+        east, north = stn_locs_east[locs], stn_locs_north[locs]
+    else:
+        east, north = get_stn_coords(lat, lon, UTMz)
+    stns, east, north, vals, nduplicates, nbadstns = \
+        check_duplicates(stns, east, north, vals)
+    message('- %s data for %d unique stations found' %
+            (var.upper(), len(stns)))
+    if nbadstns > 0:
+        message('-- %d known bad stations were removed' % nbadstns)
+    if nduplicates > 0:
+        message('-- %d duplicate locations were removed' % nduplicates)
+    return stns, lat, lon, east, north, vals
+
+
+def interpolate_batch(batch_obs, batch_dates):
+    """
+    interpolates PRCP/TMAX/TMIN for a batch of dates; for RBF and KDW the
+    variable-days sharing a station configuration are solved together, with
+    their value vectors as the columns of one right-hand side
+    """
+    exps = {'prcp': 3, 'tmax': 2, 'tmin': 2}
+    batch_grids = {}
+    for date in batch_dates:
+        batch_grids[date] = {}
+    if interp_method in ['RBF', 'KDW']:
+        groups = {}
+        group_keys = []
+        for date in batch_dates:
+            for var in ['prcp', 'tmax', 'tmin']:
+                stns, lat, lon, east, north, vals = batch_obs[date][var]
+                order, key = Interpolation.stn_set_order(stns, east, north)
+                if interp_method == 'KDW':
+                    key = '%s_%d' % (key, exps[var])
+                if key not in groups:
+                    groups[key] = {'stns': np.asarray(stns)[order],
+                                   'east': np.asarray(east)[order],
+                                   'north': np.asarray(north)[order],
+                                   'exp': exps[var], 'members': [],
+                                   'vals': []}
+                    group_keys.append(key)
+                groups[key]['members'].append((date, var))
+                groups[key]['vals'].append(np.asarray(vals)[order])
+        for key in group_keys:
+            group = groups[key]
+            vals_block = np.vstack(group['vals']).T
+            if interp_method == 'RBF':
+                grids = process_grid_rbf(grid_x, grid_y, group['stns'],
+                                         group['east'], group['north'],
+                                         vals_block)
+            else:
+                grids = process_grid_kdw(grid_x, grid_y, grid_shape,
+                                         group['stns'], group['east'],
+                                         group['north'], vals_block,
+                                         group['exp'])
+            for i, (date, var) in enumerate(group['members']):
+                batch_grids[date][var] = grids[i]
+        message('- calculated %d PRCP/TMAX/TMIN grids via %s from %d \
+                station configurations' % (3 * len(batch_dates),
+                                           interp_method, len(group_keys)))
+        return batch_grids
+    for date in batch_dates:
+        for var in ['prcp', 'tmax', 'tmin']:
+            stns, lat, lon, east, north, vals = batch_obs[date][var]
+            if interp_method == 'CSP':
+                grid_var = process_grid_csp(grid_x, grid_y, east, north, vals)
+            elif interp_method == 'BSP':
+                grid_var = process_grid_bsp(grid_x, grid_y, east, north, vals)
+            elif interp_method == 'IDW':
+                grid_var = process_grid_idw(grid_x, grid_y, grid_shape,
+                                            east, north, vals, exps[var])
+            batch_grids[date][var] = grid_var
+            message('- calculated %s grid for %d via %s' %
+                    (var.upper(), date, interp_method))
+    return batch_grids
+
+
+def process_batch(batch_dates):
+    """
+    reads, interpolates, and writes the daily grid files for one batch of
+    dates (run directly, or in a worker process)
+    """
+    if batch_size > 1:
+        message('reading station information and met data for %d dates \
+                (%d-%d)' % (len(batch_dates), batch_dates[0], batch_dates[-1]))
+    batch_obs = {}
+    with hdf.File(h5infname, 'r') as h5infile:
+        for date in batch_dates:
+            if batch_size == 1:
+                message('reading station information and met data for %d' %
+                        date)
+            batch_obs[date] = {}
+            for var in ['prcp', 'tmax', 'tmin']:
+                batch_obs[date][var] = get_day_obs(h5infile, date, var,
+                                                   UTMzone)
+    #
+    if batch_size > 1:
+        message('interpolating meteorological values for %d dates' %
+                len(batch_dates))
+    batch_grids = interpolate_batch(batch_obs, batch_dates)
+    if interp_method == 'RBF':
+        message('- RBF station configurations: %d reused, %d stored, %d new' %
+                (rbf_cache['hits'], rbf_cache['loaded'], rbf_cache['misses']))
+    if batch_size > 1:
+        message(' ')
+    #
+    for date in batch_dates:
+        prcp_stns, prcp_lat, prcp_lon, prcp_east, prcp_north, prcp_vals = \
+            batch_obs[date]['prcp']
+        tmax_stns, tmax_lat, tmax_lon, tmax_east, tmax_north, tmax_vals = \
+            batch_obs[date]['tmax']
+        tmin_stns, tmin_lat, tmin_lon, tmin_east, tmin_north, tmin_vals = \
+            batch_obs[date]['tmin']
+        grid_prcp = batch_grids[date]['prcp']
+        grid_tmax = batch_grids[date]['tmax']
+        grid_tmin = batch_grids[date]['tmin']
+        if batch_size > 1:
+            message('deriving and saving grids for %d' % date)
+        # ensure prcp is a positive definite field
+        grid_prcp = np.where(grid_prcp < 0.0, 0.0, grid_prcp)
+        # calculate tavg
+        grid_tavg = (grid_tmin + grid_tmax) / 2.0
+        tavg_stns = list(set(tmax_stns) | set(tmin_stns))
+        message('- calculated TAVG grid and station set')
+        # calculate vapor pressure deficit
+        tavg_daytime = 0.606 * grid_tmax + 0.394 * grid_tmin
+        esat_tavg = calc_esat(tavg_daytime)
+        esat_tmin = calc_esat(grid_tmin)
+        grid_vpd = esat_tavg - esat_tmin
+        message('- calculated VPD grid')
+        #
+        h5outfname = '%s/%d_NCEI_grids_1.h5' % (path, date)
+        message('writing grids to %s' % h5outfname)
+        with hdf.File(h5outfname, 'w') as h5outfile:
+            params = storage_settings()
+            params.update({'input': NCEIfname, 'method': interp_method,
+                           'dx': dx_out, 'batch_size': batch_size})
+            set_provenance(h5outfile, 'process_NCEI_02b.py', params)
+            message('- saved processing metadata items')
+            #
+            h5outfile.create_dataset('grid/UTMzone', data=UTMzone)
+            h5outfile.create_dataset('grid/min_x', data=min_x)
+            h5outfile.create_dataset('grid/max_x', data=max_x)
+            h5outfile.create_dataset('grid/x_dist', data=x_dist)
+            h5outfile.create_dataset('grid/dx', data=dx)
+            h5outfile.create_dataset('grid/ncols', data=ncols)
+            h5outfile.create_dataset('grid/min_y', data=min_y)
+            h5outfile.create_dataset('grid/max_y', data=max_y)
+            h5outfile.create_dataset('grid/y_dist', data=y_dist)
+            h5outfile.create_dataset('grid/dy', data=dy)
+            h5outfile.create_dataset('grid/nrows', data=nrows)
+            h5outfile.create_dataset('grid/interp_method', data=interp_method)
+            message('- saved grid definition metadata items')
+            #
+            h5outfile.create_dataset('stns/stn_id', data=stn_id)
+            h5outfile.create_dataset('stns/prcp_stns', data=prcp_stns)
+            h5outfile.create_dataset('stns/prcp_lat', data=prcp_lat)
+            h5outfile.create_dataset('stns/prcp_lon', data=prcp_lon)
+            h5outfile.create_dataset('stns/prcp_easting', data=prcp_east)
+            h5outfile.create_dataset('stns/prcp_northing', data=prcp_north)
+            h5outfile.create_dataset('stns/prcp_value', data=prcp_vals)
+            h5outfile.create_dataset('stns/tmax_stns', data=tmax_stns)
+            h5outfile.create_dataset('stns/tmax_lat', data=tmax_lat)
+            h5outfile.create_dataset('stns/tmax_lon', data=tmax_lon)
+            h5outfile.create_dataset('stns/tmax_easting', data=tmax_east)
+            h5outfile.create_dataset('stns/tmax_northing', data=tmax_north)
+            h5outfile.create_dataset('stns/tmax_value', data=tmax_vals)
+            h5outfile.create_dataset('stns/tmin_stns', data=tmin_stns)
+            h5outfile.create_dataset('stns/tmin_lat', data=tmin_lat)
+            h5outfile.create_dataset('stns/tmin_lon', data=tmin_lon)
+            h5outfile.create_dataset('stns/tmin_easting', data=tmin_east)
+            h5outfile.create_dataset('stns/tmin_northing', data=tmin_north)
+            h5outfile.create_dataset('stns/tmin_value', data=tmin_vals)
+            h5outfile.create_dataset('stns/tavg_stns', data=tavg_stns)
+            message('- saved input station data items')
+            #
+            create_grid(h5outfile, 'grid_prcp', grid_prcp)
+            message('- saved PRCP grid %s with %d stations' %
+                    (str(grid_prcp.shape), len(prcp_stns)))
+            create_grid(h5outfile, 'grid_tmax', grid_tmax)
+            message('- saved TMAX grid %s with %d stations' %
+                    (str(grid_tmax.shape), len(tmax_stns)))
+            create_grid(h5outfile, 'grid_tmin', grid_tmin)
+            message('- saved TMIN grid %s with %d stations' %
+                    (str(grid_tmin.shape), len(tmin_stns)))
+            create_grid(h5outfile, 'grid_tavg', grid_tavg)
+            message('- saved TAVG grid %s with %d stations' %
+                    (str(grid_tavg.shape), len(tavg_stns)))
+            create_grid(h5outfile, 'grid_vpd', grid_vpd)
+            message('- saved VPD grid %s' % str(grid_vpd.shape))
+        #
+        if plots:
+            message('plotting grids')
+            titlestr = '%d Precip (cm) via %s' % (date, interp_method)
+            filename = '%s/../images/%d_%s_prcp.png' % \
+                (path, date, interp_method.lower())
+            p_map_plot(prcp_east, prcp_north, prcp_vals, min_x, max_x,
+                       min_y, max_y, grid_prcp, UTMzone, titlestr, filename)
+            titlestr = '%d Tmax (%sC) via %s' % \
+                (date, r'$^\circ$', interp_method)
+            filename = '%s/../images/%d_%s_tmax.png' % \
+                (path, date, interp_method.lower())
+            t_map_plot(tmax_east, tmax_north, tmax_vals, min_x, max_x,
+                       min_y, max_y, grid_tmax, UTMzone, titlestr, filename)
+            titlestr = '%d Tmin (%sC) via %s' % \
+                (date, r'$^\circ$', interp_method)
+            filename = '%s/../images/%d_%s_tmin.png' % \
+                (path, date, interp_method.lower())
+            t_map_plot(tmin_east, tmin_north, tmin_vals, min_x, max_x,
+                       min_y, max_y, grid_tmin, UTMzone, titlestr, filename)
+            titlestr = '%d Tavg (%sC) via %s' % \
+                (date, r'$^\circ$', interp_method)
+            filename = '%s/../images/%d_%s_tavg.png' % \
+                (path, date, interp_method.lower())
+            t_map_plot(tmin_east, tmin_north, tmin_vals, min_x, max_x,
+                       min_y, max_y, grid_tavg, UTMzone, titlestr, filename,
+                       stations=0)
+            titlestr = '%d VPD (Pa) via %s' % (date, interp_method)
+            filename = '%s/../images/%d_%s_vpd.png' % \
+                (path, date, interp_method.lower())
+            t_map_plot(tmin_east, tmin_north, tmin_vals, min_x, max_x,
+                       min_y, max_y, grid_vpd, UTMzone, titlestr, filename,
+                       stations=0)
+        message(' ')
+    return len(batch_dates)
+
+
+def report_progress(ndone, ntotal, start_time):
+    """
+    prints the number of dates completed and the estimated time remaining
+    """
+    elapsed = time.time() - start_time
+    eta = elapsed * (ntotal - ndone) / max(ndone, 1)
+    message('- completed %d of %d dates (%.1f%%), elapsed %s, ETA %s' %
+            (ndone, ntotal, 100.0 * ndone / ntotal,
+             datetime.timedelta(seconds=int(elapsed)),
+             datetime.timedelta(seconds=int(eta))))
+    return
+
+
+def get_date_range(range_str):
+    """
+    converts a year ('1984') or date range ('19840101-19841231') argument
+    to first and last dates (inclusive) as YYYYMMDD integers
+    """
+    parts = range_str.split('-')
+    if len(parts) == 1 and len(parts[0]) == 4:
+        return int(parts[0]) * 10000 + 101, int(parts[0]) * 10000 + 1231
+    elif len(parts) == 2 and len(parts[0]) == 8 and len(parts[1]) == 8:
+        return int(parts[0]), int(parts[1])
+    else:
+        return 0, 0
+
+
 def calc_esat(temp):
     """
     calculates saturation vapor pressure [Pa] for the given Temp [degC]
@@ -178,6 +515,32 @@ message('process_NCEI_02b.py started at %s' %
         datetime.datetime.now().isoformat())
 message(' ')
 #
+if len(sys.argv) < 11:
+    first_date, last_date = 0, 99999999
+else:
+    first_date, last_date = get_date_range(sys.argv[10])
+    if first_date == 0:
+        message('input error: date range %s is not YYYY or \
+                YYYYMMDD-YYYYMMDD' % sys.argv[10])
+        sys.exit(1)
+    message('gridding dates from %d to %d' % (first_date, last_date))
+#
+if len(sys.argv) < 10:
+    workers = 1
+else:
+    workers = max(int(sys.argv[9]), 1)
+    message('gridding with %d worker processes' % workers)
+#
+if len(sys.argv) < 9:
+    batch_size = 1
+else:
+    batch_size = max(int(sys.argv[8]), 1)
+#
+if len(sys.argv) < 8:
+    use_weights_file = 0
+else:
+    use_weights_file = int(sys.argv[7])
+#
 if len(sys.argv) < 7:
     message('no plot flag indicated, setting plots = True')
     plots = 1
@@ -188,11 +551,11 @@ if len(sys.argv) < 6:
     message('no interpolation method indicated, \
             using RBF (most economical choice)')
     interp_method = 'RBF'
-elif sys.argv[4] in ['RBF', 'CSP', 'BSP', 'IDW']:
+elif sys.argv[5] in ['RBF', 'CSP', 'BSP', 'IDW', 'KDW']:
     interp_method = sys.argv[5]
 else:
-    message('interpolation method %s is not available; use RBF/CSP/BSP/IDW' %
-            sys.argv[4])
+    message('interpolation method %s is not available; \
+            use RBF/CSP/BSP/IDW/KDW' % sys.argv[5])
     sys.exit(1)
 #
 if len(sys.argv) < 5:
@@ -217,6 +580,11 @@ if len(sys.argv) < 3:
 else:
     NCEIfname = sys.argv[2]
 h5infname = '%s/../data/%s_processed.h5' % (path, NCEIfname)
+bad_stns_fname = '%s/../data/NCEI_bad_stations.txt' % path
+if not os.path.isfile(bad_stns_fname) and \
+        os.path.isfile('NCEI_bad_stations.txt'):
+    # copy transferred with an HTCondor job
+    bad_stns_fname = 'NCEI_bad_stations.txt'
 #
 if len(sys.argv) < 2:
     message('input error: need prefix for map boundaries hdr file')
@@ -225,6 +593,10 @@ else:
     NLCDhname = sys.argv[1]
 NLCDfname = '%s/../data/%s.hdr' % (path, NLCDhname)
 #
+bad_stns = get_bad_stns(bad_stns_fname)
+message('leaving out %d known bad stations: %s' %
+        (len(bad_stns), ', '.join(bad_stns)))
+#
 message('extracting header information from %s' % NLCDfname)
 UTMzone, nrows, ncols, min_y, max_y, min_x, max_x, dy, dx = \
     get_bil_hdr_info(NLCDfname)
@@ -281,212 +653,93 @@ elif interp_method == 'IDW':
     grid_x, grid_y = np.meshgrid(grid_x, grid_y)
     grid_shape = grid_x.shape
     grid_x, grid_y = grid_x.flatten(), grid_y.flatten()
+elif interp_method == 'KDW':
+    # interpolate using the whole target grid, nearest stations only
+    message('generating target grid for k-d tree inverse-distance-weighted \
+            (KDW) interpolation')
+    kdw_neighbors = 12  # number of nearest stations used for each cell
+    kdw_radius = 0  # [m] search radius (0 = no limit)
+    message('- using %d nearest stations for each grid cell' % kdw_neighbors)
+    grid_x = np.arange(min_x, max_x, dx)
+    grid_y = np.arange(min_y, max_y, dy)
+    grid_x, grid_y = np.meshgrid(grid_x, grid_y)
+    grid_shape = grid_x.shape
+    grid_x, grid_y = grid_x.flatten(), grid_y.flatten()
+if interp_method not in ['RBF', 'KDW']:
+    use_weights_file = 0
+if use_weights_file and workers > 1:
+    # the HDF5 weights file cannot be written by several processes at once
+    message('- weights file is not used with multiple worker processes')
+    use_weights_file = 0
+if use_weights_file:
+    h5wfname = '%s/../data/%s_%s_weights.h5' % \
+        (path, NLCDhname, interp_method)
+    message('storing/reusing interpolation operators in %s' % h5wfname)
+    h5wfile = hdf.File(h5wfname, 'a')
+    grid_id = Interpolation.grid_hash(grid_x, grid_y)
+else:
+    h5wfile = 0
+    grid_id = ''
+if interp_method == 'RBF':
+    # RBF factorizations (and evaluation kernels, within 1GB) are reused
+    # for days/variables with the same station configuration
+    rbf_cache = Interpolation.rbf_cache_init(h5file=h5wfile, grid_id=grid_id)
 message(' ')
 #
 message('reading station and date information from %s' % h5infname)
 with hdf.File(h5infname, 'r') as h5infile:
     stn_id = np.copy(h5infile['stn_id'])
     dates = np.copy(h5infile['dates'])
+    dates = dates[(dates >= first_date) & (dates <= last_date)]
+    use_stn_locs = False
+    use_obs_arrays = 'obs' in h5infile.keys()
+    if use_obs_arrays:
+        obs_dates = np.copy(h5infile['obs/dates'])
+        stn_locs_id = np.copy(h5infile['stn_locs/stn_id'])
+        stn_locs_lat = np.copy(h5infile['stn_locs/lat'])
+        stn_locs_lon = np.copy(h5infile['stn_locs/lon'])
+    if 'stn_locs' in h5infile.keys():
+        if int(np.copy(h5infile['stn_locs/UTMzone'])) == UTMzone:
+            use_stn_locs = True
+            stn_locs_east = \
+                np.round(np.copy(h5infile['stn_locs/easting']), 0).astype(int)
+            stn_locs_north = \
+                np.round(np.copy(h5infile['stn_locs/northing']),
+                         0).astype(int)
 message('- identifiers for %d stations found' % len(stn_id))
 message('- meteorological data for %d dates found' % len(dates))
+if use_obs_arrays:
+    message('- as (%d dates x %d locations) arrays' % (len(obs_dates),
+                                                      len(stn_locs_id)))
+if use_stn_locs:
+    message('- projected coordinates for %d station locations found' %
+            len(stn_locs_east))
+else:
+    message('- station locations will be projected to UTM zone %d' % UTMzone)
 message(' ')
 #
-for date in dates:
-    message('reading station information and met data for %d' % date)
-    with hdf.File(h5infname, 'r') as h5infile:
-        datepath = 'metdata/%d' % date
-        #
-        prcp_stns = np.copy(h5infile[datepath + '/prcp_stns'])
-        prcp_lat = np.copy(h5infile[datepath + '/prcp_lat'])
-        prcp_lon = np.copy(h5infile[datepath + '/prcp_lon'])
-        prcp_east, prcp_north = get_stn_coords(prcp_lat, prcp_lon, UTMzone)
-        prcp_vals = np.copy(h5infile[datepath + '/prcp_vals'])
-        prcp_stns, prcp_east, prcp_north, prcp_vals, nduplicates, nbadstns = \
-            check_duplicates(prcp_stns, prcp_east, prcp_north, prcp_vals)
-        message('- PRCP data for %d unique stations found' % len(prcp_stns))
-        if nbadstns > 0:
-            message('-- %d known bad stations were removed' % nbadstns)
-        if nduplicates > 0:
-            message('-- %d duplicate locations were removed' % nduplicates)
-        #
-        tmax_stns = np.copy(h5infile[datepath + '/tmax_stns'])
-        tmax_lat = np.copy(h5infile[datepath + '/tmax_lat'])
-        tmax_lon = np.copy(h5infile[datepath + '/tmax_lon'])
-        tmax_east, tmax_north = get_stn_coords(tmax_lat, tmax_lon, UTMzone)
-        tmax_vals = np.copy(h5infile[datepath + '/tmax_vals'])
-        tmax_stns, tmax_east, tmax_north, tmax_vals, nduplicates, nbadstns = \
-            check_duplicates(tmax_stns, tmax_east, tmax_north, tmax_vals)
-        message('- TMAX data for %d unique stations found' % len(tmax_stns))
-        if nbadstns > 0:
-            message('-- %d known bad stations were removed' % nbadstns)
-        if nduplicates > 0:
-            message('-- %d duplicate locations were removed' % nduplicates)
-        #
-        tmin_stns = np.copy(h5infile[datepath + '/tmin_stns'])
-        tmin_lat = np.copy(h5infile[datepath + '/tmin_lat'])
-        tmin_lon = np.copy(h5infile[datepath + '/tmin_lon'])
-        tmin_east, tmin_north = get_stn_coords(tmin_lat, tmin_lon, UTMzone)
-        tmin_vals = np.copy(h5infile[datepath + '/tmin_vals'])
-        tmin_stns, tmin_east, tmin_north, tmin_vals, nduplicates, nbadstns = \
-            check_duplicates(tmin_stns, tmin_east, tmin_north, tmin_vals)
-        message('- TMIN data for %d unique stations found' % len(tmin_stns))
-        if nbadstns > 0:
-            message('-- %d known bad stations were removed' % nbadstns)
-        if nduplicates > 0:
-            message('-- %d duplicate locations were removed' % nduplicates)
-    #
-    message('interpolating meteorological values for %d' % date)
-    if interp_method == 'RBF':
-        grid_prcp = process_grid_rbf(grid_x, grid_y,
-                                     prcp_east, prcp_north, prcp_vals)
-        message('- calculated PRCP grid via %s' % interp_method)
-        grid_tmax = process_grid_rbf(grid_x, grid_y,
-                                     tmax_east, tmax_north, tmax_vals)
-        message('- calculated TMAX grid via %s' % interp_method)
-        grid_tmin = process_grid_rbf(grid_x, grid_y,
-                                     tmin_east, tmin_north, tmin_vals)
-        message('- calculated TMIN grid via %s' % interp_method)
-    elif interp_method == 'CSP':
-        grid_prcp = process_grid_csp(grid_x, grid_y,
-                                     prcp_east, prcp_north, prcp_vals)
-        message('- calculated PRCP grid via %s' % interp_method)
-        grid_tmax = process_grid_csp(grid_x, grid_y,
-                                     tmax_east, tmax_north, tmax_vals)
-        message('- calculated TMAX grid via %s' % interp_method)
-        grid_tmin = process_grid_csp(grid_x, grid_y,
-                                     tmin_east, tmin_north, tmin_vals)
-        message('- calculated TMIN grid via %s' % interp_method)
-    elif interp_method == 'BSP':
-        grid_prcp = process_grid_bsp(grid_x, grid_y,
-                                     prcp_east, prcp_north, prcp_vals)
-        message('- calculated PRCP grid via %s' % interp_method)
-        grid_tmax = process_grid_bsp(grid_x, grid_y,
-                                     tmax_east, tmax_north, tmax_vals)
-        message('- calculated TMAX grid via %s' % interp_method)
-        grid_tmin = process_grid_bsp(grid_x, grid_y,
-                                     tmin_east, tmin_north, tmin_vals)
-        message('- calculated TMIN grid via %s' % interp_method)
-    elif interp_method == 'IDW':
-        grid_prcp = process_grid_idw(grid_x, grid_y, grid_shape,
-                                     prcp_east, prcp_north, prcp_vals, 3)
-        message('- calculated PRCP grid via %s' % interp_method)
-        grid_tmax = process_grid_idw(grid_x, grid_y, grid_shape,
-                                     tmax_east, tmax_north, tmax_vals, 2)
-        message('- calculated TMAX grid via %s' % interp_method)
-        grid_tmin = process_grid_idw(grid_x, grid_y, grid_shape,
-                                     tmin_east, tmin_north, tmin_vals, 2)
-        message('- calculated TMIN grid via %s' % interp_method)
-    # ensure prcp is a positive definite field
-    grid_prcp = np.where(grid_prcp < 0.0, 0.0, grid_prcp)
-    # calculate tavg
-    grid_tavg = (grid_tmin + grid_tmax) / 2.0
-    tavg_stns = list(set(tmax_stns) | set(tmin_stns))
-    message('- calculated TAVG grid and station set')
-    # calculate vapor pressure deficit
-    tavg_daytime = 0.606 * grid_tmax + 0.394 * grid_tmin
-    esat_tavg = calc_esat(tavg_daytime)
-    esat_tmin = calc_esat(grid_tmin)
-    grid_vpd = esat_tavg - esat_tmin
-    message('- calculated VPD grid')
-    #
-    h5outfname = '%s/%d_NCEI_grids_1.h5' % (path, date)
-    message('writing grids to %s' % h5outfname)
-    with hdf.File(h5outfname, 'w') as h5outfile:
-        h5outfile.create_dataset('meta/filename', data=h5outfname)
-        h5outfile.create_dataset('meta/created',
-                                 data=datetime.datetime.now().isoformat())
-        h5outfile.create_dataset('meta/by',
-                                 data='M. Garcia, UWisconsin-Madison FWE')
-        h5outfile.create_dataset('meta/last_updated',
-                                 data=datetime.datetime.now().isoformat())
-        h5outfile.create_dataset('meta/at',
-                                 data='prcp/tmax/tmin/tavg/vpd grids')
-        message('- saved processing metadata items')
-        #
-        h5outfile.create_dataset('grid/UTMzone', data=UTMzone)
-        h5outfile.create_dataset('grid/min_x', data=min_x)
-        h5outfile.create_dataset('grid/max_x', data=max_x)
-        h5outfile.create_dataset('grid/x_dist', data=x_dist)
-        h5outfile.create_dataset('grid/dx', data=dx)
-        h5outfile.create_dataset('grid/ncols', data=ncols)
-        h5outfile.create_dataset('grid/min_y', data=min_y)
-        h5outfile.create_dataset('grid/max_y', data=max_y)
-        h5outfile.create_dataset('grid/y_dist', data=y_dist)
-        h5outfile.create_dataset('grid/dy', data=dy)
-        h5outfile.create_dataset('grid/nrows', data=nrows)
-        h5outfile.create_dataset('grid/interp_method', data=interp_method)
-        message('- saved grid definition metadata items')
-        #
-        h5outfile.create_dataset('stns/stn_id', data=stn_id)
-        h5outfile.create_dataset('stns/prcp_stns', data=prcp_stns)
-        h5outfile.create_dataset('stns/prcp_lat', data=prcp_lat)
-        h5outfile.create_dataset('stns/prcp_lon', data=prcp_lon)
-        h5outfile.create_dataset('stns/prcp_easting', data=prcp_east)
-        h5outfile.create_dataset('stns/prcp_northing', data=prcp_north)
-        h5outfile.create_dataset('stns/prcp_value', data=prcp_vals)
-        h5outfile.create_dataset('stns/tmax_stns', data=tmax_stns)
-        h5outfile.create_dataset('stns/tmax_lat', data=tmax_lat)
-        h5outfile.create_dataset('stns/tmax_lon', data=tmax_lon)
-        h5outfile.create_dataset('stns/tmax_easting', data=tmax_east)
-        h5outfile.create_dataset('stns/tmax_northing', data=tmax_north)
-        h5outfile.create_dataset('stns/tmax_value', data=tmax_vals)
-        h5outfile.create_dataset('stns/tmin_stns', data=tmin_stns)
-        h5outfile.create_dataset('stns/tmin_lat', data=tmin_lat)
-        h5outfile.create_dataset('stns/tmin_lon', data=tmin_lon)
-        h5outfile.create_dataset('stns/tmin_easting', data=tmin_east)
-        h5outfile.create_dataset('stns/tmin_northing', data=tmin_north)
-        h5outfile.create_dataset('stns/tmin_value', data=tmin_vals)
-        h5outfile.create_dataset('stns/tavg_stns', data=tavg_stns)
-        message('- saved input station data items')
-        #
-        h5outfile.create_dataset('grid_prcp', data=grid_prcp,
-                                 dtype=np.float32, compression='gzip')
-        message('- saved PRCP grid %s with %d stations' %
-                (str(grid_prcp.shape), len(prcp_stns)))
-        h5outfile.create_dataset('grid_tmax', data=grid_tmax,
-                                 dtype=np.float32, compression='gzip')
-        message('- saved TMAX grid %s with %d stations' %
-                (str(grid_tmax.shape), len(tmax_stns)))
-        h5outfile.create_dataset('grid_tmin', data=grid_tmin,
-                                 dtype=np.float32, compression='gzip')
-        message('- saved TMIN grid %s with %d stations' %
-                (str(grid_tmin.shape), len(tmin_stns)))
-        h5outfile.create_dataset('grid_tavg', data=grid_tavg,
-                                 dtype=np.float32, compression='gzip')
-        message('- saved TAVG grid %s with %d stations' %
-                (str(grid_tavg.shape), len(tavg_stns)))
-        h5outfile.create_dataset('grid_vpd', data=grid_vpd,
-                                 dtype=np.float32, compression='gzip')
-        message('- saved VPD grid %s' % str(grid_vpd.shape))
-    #
-    if plots:
-        message('plotting grids')
-        titlestr = '%d Precip (cm) via %s' % (date, interp_method)
-        filename = '%s/../images/%d_%s_prcp.png' % \
-            (path, date, interp_method.lower())
-        p_map_plot(prcp_east, prcp_north, prcp_vals, min_x, max_x, min_y,
-                   max_y, grid_prcp, UTMzone, titlestr, filename)
-        titlestr = '%d Tmax (%sC) via %s' % (date, r'$^\circ$', interp_method)
-        filename = '%s/../images/%d_%s_tmax.png' % \
-            (path, date, interp_method.lower())
-        t_map_plot(tmax_east, tmax_north, tmax_vals, min_x, max_x, min_y,
-                   max_y, grid_tmax, UTMzone, titlestr, filename)
-        titlestr = '%d Tmin (%sC) via %s' % (date, r'$^\circ$', interp_method)
-        filename = '%s/../images/%d_%s_tmin.png' % \
-            (path, date, interp_method.lower())
-        t_map_plot(tmin_east, tmin_north, tmin_vals, min_x, max_x, min_y,
-                   max_y, grid_tmin, UTMzone, titlestr, filename)
-        titlestr = '%d Tavg (%sC) via %s' % (date, r'$^\circ$', interp_method)
-        filename = '%s/../images/%d_%s_tavg.png' % \
-            (path, date, interp_method.lower())
-        t_map_plot(tmin_east, tmin_north, tmin_vals, min_x, max_x, min_y,
-                   max_y, grid_tavg, UTMzone, titlestr, filename, stations=0)
-        titlestr = '%d VPD (Pa) via %s' % (date, interp_method)
-        filename = '%s/../images/%d_%s_vpd.png' % \
-            (path, date, interp_method.lower())
-        t_map_plot(tmin_east, tmin_north, tmin_vals, min_x, max_x, min_y,
-                   max_y, grid_vpd, UTMzone, titlestr, filename, stations=0)
+n_batches = (len(dates) + batch_size - 1) // batch_size
+batches = [dates[b * batch_size:(b + 1) * batch_size]
+           for b in range(n_batches)]
+start_time = time.time()
+ndone = 0
+if workers > 1:
+    message('distributing %d dates among %d worker processes' %
+            (len(dates), workers))
     message(' ')
+    pool = multiprocessing.Pool(workers)
+    results = pool.imap_unordered(process_batch, batches)
+else:
+    results = itertools.imap(process_batch, batches)
+for ndates in results:
+    ndone += ndates
+    report_progress(ndone, len(dates), start_time)
+if workers > 1:
+    pool.close()
+    pool.join()
+#
+if use_weights_file:
+    h5wfile.close()
 #
 message('process_NCEI_02b.py completed at %s' %
         datetime.datetime.now().isoformat())
@@ -0,0 +1,282 @@
+"""
+Python script 'process_NCEI_03.py'
+by Matthew Garcia, PhD student
+Dept. of Forest and Wildlife Ecology
+University of Wisconsin - Madison
+matt.e.garcia@gmail.com
+
+Copyright (C) 2015-2016 by Matthew Garcia
+Licensed Gnu GPL v3; see 'LICENSE_GnuGPLv3.txt' for complete terms
+Send questions, bug reports, any related requests to matt.e.garcia@gmail.com
+See also 'README.md', 'DISCLAIMER.txt', 'CITATION.txt', 'ACKNOWLEDGEMENTS.txt'
+Treat others as you would be treated. Pay it forward. Valar dohaeris.
+
+PURPOSE: Temporal accumulation of all climatological indicators in a single
+         pass over the daily grid files (replaces running the individual
+         process_NCEI_03_*.py scripts one after another)
+
+DEPENDENCIES: h5py, numpy
+              'process_NCEI_03_aux', 'Grid_Store', 'Storage_Policy', and
+                'Provenance' modules have their own requirements
+
+USAGE: '$ python process_NCEI_03.py NCEI_WLS_1983 1983 ./grids'
+       '$ python process_NCEI_03.py NCEI_WLS_1983 1983 ./grids chill_d,grow_dd'
+       '$ python process_NCEI_03.py NCEI_WLS_1983 1983 ./grids all /scratch'
+       '$ python process_NCEI_03.py NCEI_WLS_1983 1983 ./grids all 0 1'
+
+NOTES: The optional 4th argument is a comma-separated list of indicators to
+       calculate (default or 'all': all indicators registered in
+       process_NCEI_03_aux)
+       The optional 5th argument is a scratch directory in which the rolling
+       windows are kept as memory-mapped files instead of in memory ('0' for
+       none)
+       The optional 6th argument '1' writes the daily grids and indicators
+       of the year to one annual grid store (see Grid_Store.py) instead of
+       updating the daily '_grids_2.h5' files, which then need not be
+       copied by process_NCEI_03_preprocess.py
+
+INPUT: copied '.h5' file from process_NCEI_03_preprocess.py
+       (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_2.h5')
+       or, for the annual grid store, the '.h5' files from process_NCEI_02b.py
+       (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_1.h5')
+
+OUTPUT: updated daily '.h5' file with all new accumulation grids
+        (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_2.h5')
+        or annual grid store with all daily grids and station lists
+        (with the naming convention 'grids/[YYYY]_NCEI_grid_store.h5')
+        year-end '.h5' file with rolling accounted variables and stations
+        (with the naming convention 'grids/[YYYY]_year_end_wxcd.h5')
+"""
+
+
+import os
+import sys
+import datetime
+import glob
+import h5py as hdf
+import numpy as np
+from process_NCEI_03_aux import write_to_file, write_to_file_2g, \
+    get_indicators, init_indicator, update_indicator, read_indicator_state, \
+    write_indicator_state, stn_track_init, stn_track_update, \
+    stn_track_next_day, stn_track_read, stn_track_write
+from Grid_Store import grid_store_fname, grid_store_init, grid_store_write
+from Storage_Policy import read_grid, storage_settings
+from Provenance import set_provenance
+
+
+def message(char_string):
+    """
+    prints a string to the terminal and flushes the buffer
+    """
+    print char_string
+    sys.stdout.flush()
+    return
+
+
+message(' ')
+message('process_NCEI_03.py started at %s' %
+        datetime.datetime.now().isoformat())
+message(' ')
+#
+if len(sys.argv) < 7:
+    use_grid_store = 0
+else:
+    use_grid_store = int(sys.argv[6])
+#
+if len(sys.argv) < 6 or sys.argv[5] == '0':
+    mmap_path = 0
+else:
+    mmap_path = sys.argv[5]
+    message('rolling windows will be memory-mapped in %s' % mmap_path)
+#
+params = storage_settings()
+if len(sys.argv) < 5 or sys.argv[4] == 'all':
+    inds = get_indicators()
+    params['indicators'] = 'all'
+else:
+    inds = get_indicators(sys.argv[4].split(','))
+    params['indicators'] = sys.argv[4]
+message('calculating %d indicators: %s' %
+        (len(inds), ', '.join([ind['name'] for ind in inds])))
+input_grids = []
+for ind in inds:
+    if ind['grid'] not in input_grids:
+        input_grids.append(ind['grid'])
+message(' ')
+#
+if len(sys.argv) < 4:
+    message('input warning: no input directory indicated, using ./grids')
+    path = './grids'
+else:
+    path = sys.argv[3]
+#
+if len(sys.argv) < 3:
+    message('input error: need year to process')
+    sys.exit(1)
+else:
+    this_year = int(sys.argv[2])
+#
+if len(sys.argv) < 2:
+    message('input error: need prefix for weather data h5 file')
+    sys.exit(1)
+else:
+    NCEIfname = sys.argv[1]
+h5infname = '%s/../data/%s_processed.h5' % (path, NCEIfname)
+#
+message('reading station and dates information from %s' % h5infname)
+with hdf.File(h5infname, 'r') as h5infile:
+    stn_id = np.copy(h5infile['stn_id'])
+    all_dates = np.copy(h5infile['dates'])
+message('- identifiers for %d stations found' % len(stn_id))
+message('- information for %d total dates found' % len(all_dates))
+dates = sorted([j for j in all_dates if int(j // 1E4) == this_year])
+message('- processing %d dates in %d' % (len(dates), this_year))
+if use_grid_store:
+    # daily grids are read from the interpolation output files
+    grids_suffix = 1
+    h5storefname = grid_store_fname(path, this_year)
+    message('writing daily grids and indicators to %s' % h5storefname)
+else:
+    grids_suffix = 2
+message(' ')
+#
+prev_year = this_year - 1
+vars_files = sorted(glob.glob('%s/*_year_end_wxcd.h5' % path))
+use_vars_file = False
+if len(vars_files) > 0:
+    for vars_file in vars_files:
+        if str(prev_year) in vars_file:
+            use_vars_file = True
+            varfname = vars_file
+            break
+#
+# if rolling accounting variable files exist to be carried over
+# from previous year
+states = {}
+if use_vars_file:
+    message('extracting rolling accounting variables from %s' % varfname)
+    with hdf.File(varfname, 'r') as h5infile:
+        nrows = np.copy(h5infile['nrows'])
+        ncols = np.copy(h5infile['ncols'])
+        for ind in inds:
+            states[ind['name']] = \
+                read_indicator_state(h5infile, ind, nrows, ncols, mmap_path)
+        message('extracting station accounting')
+        if 'stn_track' in h5infile.keys():
+            track = stn_track_read(h5infile)
+        else:
+            message('- not found, establishing new station accounting')
+            track = stn_track_init(stn_id, input_grids)
+else:  # otherwise, initialize the variable space(s)
+    h5infname = '%s/%d_NCEI_grids_%d.h5' % (path, dates[0], grids_suffix)
+    message('extracting grid information from %s' % h5infname)
+    with hdf.File(h5infname, 'r') as h5infile:
+        nrows = np.copy(h5infile['grid/nrows'])
+        ncols = np.copy(h5infile['grid/ncols'])
+    message('establishing rolling accounting variables')
+    for ind in inds:
+        states[ind['name']] = init_indicator(ind, nrows, ncols, 0, mmap_path)
+    message('establishing station accounting')
+    track = stn_track_init(stn_id, input_grids)
+message(' ')
+#
+if use_grid_store:
+    h5storefile = hdf.File(h5storefname, 'w')
+    with hdf.File('%s/%d_NCEI_grids_1.h5' % (path, dates[0]), 'r') as h5file:
+        grid_store_init(h5storefile, h5file)
+#
+for date in dates:
+    year = date // 10000
+    month = (date - (year * 10000)) // 100
+    day = date - (year * 10000) - (month * 100)
+    #
+    h5fname = '%s/%d_NCEI_grids_%d.h5' % (path, date, grids_suffix)
+    if use_grid_store:
+        message('calculating indicators from %s' % h5fname)
+        h5file = hdf.File(h5fname, 'r')
+        # the store gets all of the daily file's grids and station lists
+        day_grids = {}
+        day_stns = {}
+        for key in h5file.keys():
+            if key not in ['grid', 'meta', 'stns']:
+                day_grids[key] = read_grid(h5file[key])
+        for key in h5file['stns'].keys():
+            if key != 'stn_id':
+                day_stns[key] = np.copy(h5file['stns/%s' % key])
+    else:
+        message('updating indicators in %s' % h5fname)
+        h5file = hdf.File(h5fname, 'r+')
+    track = stn_track_next_day(track)
+    grids = {}
+    for var in input_grids:
+        grids[var] = read_grid(h5file['grid_%s' % var])
+        if '%s_stns' % var in h5file['stns'].keys():
+            track = stn_track_update(track, var,
+                                     np.copy(h5file['stns/%s_stns' % var]))
+    message('- extracted %s grids' % '/'.join(input_grids).upper())
+    #
+    stns_out = {}
+    for ind in inds:
+        name = ind['name']
+        ind_grids, stns_out[name] = \
+            update_indicator(ind, states[name], month, day,
+                             grids[ind['grid']], track)
+        if ind['stns'] in [None, 'window', 'daily']:
+            svar = ind['stns']
+        else:
+            stns_out[name] = stns_out[ind['stns']]
+            svar = 'from'
+        if use_grid_store:
+            for k, outvar in enumerate(ind['outvars']):
+                day_grids[outvar] = ind_grids[k]
+            if svar is not None:
+                day_stns['%s_stns' % name] = stns_out[name]
+        elif svar is None:
+            write_to_file_2g(h5file, ind['outvars'][0], ind_grids[0],
+                             ind['outvars'][1], ind_grids[1])
+            message('- %s %s and %s %s' %
+                    (ind['outvars'][0], str(ind_grids[0].shape),
+                     ind['outvars'][1], str(ind_grids[1].shape)))
+        elif len(ind_grids) == 2:
+            write_to_file_2g(h5file, ind['outvars'][0], ind_grids[0],
+                             ind['outvars'][1], ind_grids[1],
+                             '%s_stns' % name, stns_out[name])
+        else:
+            write_to_file(h5file, ind['outvars'][0], ind_grids[0],
+                          '%s_stns' % name, stns_out[name])
+    #
+    if use_grid_store:
+        grid_store_write(h5storefile, date, day_grids, day_stns)
+        message('- saved %d grids and %d station lists for %d' %
+                (len(day_grids), len(day_stns), date))
+    else:
+        set_provenance(h5file, 'process_NCEI_03.py', params)
+    h5file.close()
+    message(' ')
+if use_grid_store:
+    set_provenance(h5storefile, 'process_NCEI_03.py', params)
+    h5storefile.close()
+#
+# save rolling accounting variables for next year's run
+varfname = '%s/%d_year_end_wxcd.h5' % (path, this_year)
+message('saving rolling accounting variables to %s' % varfname)
+with hdf.File(varfname, 'w') as h5outfile:
+    h5outfile.create_dataset('nrows', data=nrows)
+    h5outfile.create_dataset('ncols', data=ncols)
+    for ind in inds:
+        write_indicator_state(h5outfile, ind, states[ind['name']])
+    stn_track_write(h5outfile, track)
+if mmap_path:
+    message('removing memory-mapped rolling windows from %s' % mmap_path)
+    del states
+    for ind in inds:
+        mmap_fname = '%s/%s.mmap' % (mmap_path, ind['name'])
+        if os.path.isfile(mmap_fname):
+            os.remove(mmap_fname)
+#
+message('process_NCEI_03.py completed at %s' %
+        datetime.datetime.now().isoformat())
+message(' ')
+sys.exit(0)
+
+# end process_NCEI_03.py
\ No newline at end of file
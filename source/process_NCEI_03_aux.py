@@ -14,6 +14,7 @@ Treat others as you would be treated. Pay it forward. Valar dohaeris.
 PURPOSE: helper functions for process_NCEI_03_*.py
 
 DEPENDENCIES: h5py, numpy, pickle
+              'Storage_Policy' module has its own requirements
 
 USAGE: insert 'from process_NCEI_03_aux import *' line near head of script
        see usage examples in 'process_NCEI_03_*.py'
@@ -28,6 +29,7 @@ import sys
 import pickle
 import h5py as hdf
 import numpy as np
+from Storage_Policy import grid_kwargs, create_grid
 
 
 def message(char_string):
@@ -85,29 +87,6 @@ def cube_sum(nd, var_cube, var_grid, stns_all, stns):
     return grid_var_sum, stns_all_list, var_cube, stns_all
 
 
-def cube_sum_parts(nd, var_cube1, var_cube2, var_grid, stns_all, stns):
-    var_cube1_dims = np.shape(var_cube1)
-    nd1 = var_cube1_dims[0]
-    var_cube2_dims = np.shape(var_cube2)
-    nd2 = var_cube2_dims[0]
-    var_cube1[0:nd1 - 1, :, :] = var_cube1[1:nd1, :, :]
-    var_cube1[nd1 - 1, :, :] = var_cube2[0, :, :]
-    var_cube2[0:nd2 - 1, :, :] = var_cube2[1:nd2, :, :]
-    var_cube2[nd2 - 1, :, :] = var_grid[:, :]
-    grid_var_sum = np.sum(var_cube1, axis=0) + np.sum(var_cube2, axis=0)
-    stns_all_dims = np.shape(stns_all)
-    if stns_all_dims[0] == nd:
-        stns_all[0:nd - 1][:] = stns_all[1:nd][:]
-        stns_all[nd - 1] = stns
-    else:
-        stns_all.append(stns)
-    stns_all_list = []
-    stns_all_dims = np.shape(stns_all)
-    for i in range(stns_all_dims[0]):
-        stns_all_list = list(set(stns_all_list) | set(stns_all[i]))
-    return grid_var_sum, stns_all_list, var_cube1, var_cube2, stns_all
-
-
 def cube_threshold_count(nd, var_cube, var_grid, thresh):
     thresh_var = np.where(var_grid > thresh, 1.0, 0.0)
     var_cube[0:nd - 1, :, :] = var_cube[1:nd, :, :]
@@ -142,11 +121,185 @@ def cube_mean_var_ns(nd, var_cube, var_grid):
     return grid_var_mean, grid_var_var, var_cube
 
 
+def ring_init(nd, nrows, ncols, var_cube=0, sumsq=True, mmap_fname=0):
+    """
+    establishes a rolling window of nd daily grids as a ring buffer with
+    running sums, optionally from an existing cube (oldest day first; an
+    open h5py dataset is read one day at a time)
+    - daily grids are kept as float32 (as they are stored in the daily grid
+      files), in a memory-mapped file if mmap_fname is given
+    - running sums are float64 and kept relative to a per-cell shift (the
+      window mean at the last exact recomputation) to limit cancellation
+    """
+    ring = {'nd': nd, 'head': 0, 'use_sumsq': sumsq}
+    if mmap_fname:
+        ring['cube'] = np.memmap(mmap_fname, dtype=np.float32, mode='w+',
+                                 shape=(nd, nrows, ncols))
+    else:
+        ring['cube'] = np.zeros((nd, nrows, ncols), dtype=np.float32)
+    if np.shape(var_cube) == (nd, nrows, ncols):
+        for i in range(nd):
+            ring['cube'][i, :, :] = var_cube[i, :, :]
+    ring_recompute(ring)
+    return ring
+
+
+def ring_recompute(ring):
+    """
+    exact recomputation of a ring's running sums from its contents,
+    one day at a time to avoid a full-size float64 temporary cube
+    """
+    nd = ring['nd']
+    shift = np.zeros(ring['cube'].shape[1:])
+    for i in range(nd):
+        shift += ring['cube'][i, :, :]
+    ring['shift'] = shift / nd
+    ring['sum'] = np.zeros_like(shift)
+    if ring['use_sumsq']:
+        ring['sumsq'] = np.zeros_like(shift)
+    for i in range(nd):
+        dev = ring['cube'][i, :, :] - ring['shift']
+        ring['sum'] += dev
+        if ring['use_sumsq']:
+            ring['sumsq'] += dev ** 2
+    return
+
+
+def ring_push(ring, var_grid):
+    """
+    replaces the oldest day in a ring with a new daily grid and updates
+    the running sums in O(nrows * ncols); the running sums are recomputed
+    exactly once per full turn of the ring to bound accumulated error
+    """
+    head = ring['head']
+    dev_old = ring['cube'][head, :, :] - ring['shift']
+    ring['cube'][head, :, :] = var_grid[:, :]
+    dev_new = ring['cube'][head, :, :] - ring['shift']
+    ring['sum'] += dev_new - dev_old
+    if ring['use_sumsq']:
+        ring['sumsq'] += dev_new ** 2 - dev_old ** 2
+    ring['head'] = (head + 1) % ring['nd']
+    if ring['head'] == 0:
+        ring_recompute(ring)
+    return ring
+
+
+def ring_total(ring):
+    return ring['nd'] * ring['shift'] + ring['sum']
+
+
+def ring_mean(ring):
+    return ring['shift'] + ring['sum'] / ring['nd']
+
+
+def ring_variance(ring):
+    dev_mean = ring['sum'] / ring['nd']
+    return np.maximum(ring['sumsq'] / ring['nd'] - dev_mean ** 2, 0.0)
+
+
+def ring_write(h5file, dname, ring):
+    """
+    saves the contents of a ring as a cube in chronological order (oldest
+    day first, as the cube_* functions keep it), one day at a time
+    """
+    nd, nrows, ncols = ring['cube'].shape
+    dset = h5file.create_dataset(dname, shape=(nd, nrows, ncols),
+                                 dtype=np.float32,
+                                 **grid_kwargs((nd, nrows, ncols), 'map'))
+    for i in range(nd):
+        dset[i, :, :] = ring['cube'][(ring['head'] + i) % nd, :, :]
+    return
+
+
+def ring_sum(ring, var_grid):
+    ring = ring_push(ring, var_grid)
+    return ring_total(ring), ring
+
+
+def ring_threshold_count(ring, var_grid, thresh):
+    ring = ring_push(ring, np.where(var_grid > thresh, 1.0, 0.0))
+    return np.around(ring_total(ring)), ring
+
+
+def ring_mean_var(ring, var_grid):
+    ring = ring_push(ring, var_grid)
+    return ring_mean(ring), ring_variance(ring), ring
+
+
+def stn_track_init(stn_ids, grids):
+    """
+    establishes station accounting for rolling windows and seasons: one
+    sorted array of station identifiers and, for each input grid, the
+    day on which each station last contributed to it (-1 = never)
+    """
+    stn_ids = np.unique(np.array(stn_ids))
+    track = {'day': -1, 'stn_ids': stn_ids}
+    for grid in grids:
+        track[grid] = np.zeros(len(stn_ids), dtype=np.int32) - 1
+    return track
+
+
+def stn_track_update(track, grid, stns):
+    """
+    records the stations contributing to one input grid on the current day
+    (call stn_track_next_day once per date before any updates)
+    """
+    stns = np.asarray(stns)
+    if len(np.setdiff1d(stns, track['stn_ids'])) > 0:
+        stn_ids = np.union1d(track['stn_ids'], stns)
+        idxs = np.searchsorted(stn_ids, track['stn_ids'])
+        for key in track.keys():
+            if key not in ['day', 'stn_ids']:
+                last_seen = np.zeros(len(stn_ids), dtype=np.int32) - 1
+                last_seen[idxs] = track[key]
+                track[key] = last_seen
+        track['stn_ids'] = stn_ids
+    if grid not in track.keys():
+        track[grid] = np.zeros(len(track['stn_ids']), dtype=np.int32) - 1
+    if len(stns) > 0:
+        track[grid][np.searchsorted(track['stn_ids'], stns)] = track['day']
+    return track
+
+
+def stn_track_next_day(track):
+    track['day'] += 1
+    return track
+
+
+def stn_track_since(track, grid, first_day):
+    """
+    returns the stations contributing to one input grid from first_day
+    through the current day
+    """
+    return list(track['stn_ids'][track[grid] >= max(first_day, 0)])
+
+
+def stn_track_window(track, grid, nd):
+    """
+    returns the stations contributing to one input grid in the nd-day
+    window ending on the current day
+    """
+    return stn_track_since(track, grid, track['day'] - nd + 1)
+
+
+def stn_track_write(h5file, track):
+    for key in track.keys():
+        h5file.create_dataset('stn_track/%s' % key, data=track[key])
+    return
+
+
+def stn_track_read(h5file):
+    track = {}
+    for key in h5file['stn_track'].keys():
+        track[key] = np.copy(h5file['stn_track/%s' % key])
+    track['day'] = int(track['day'])
+    return track
+
+
 def write_to_file(h5file, gvar, gdata, svar=0, sdata=0):
     if gvar in h5file.keys():
         del h5file[gvar]
-    h5file.create_dataset(gvar, data=gdata, dtype=np.float32,
-                          compression='gzip')
+    create_grid(h5file, gvar, gdata)
     if svar:
         stnsdir = 'stns'
         datapath = '%s/%s' % (stnsdir, svar)
@@ -163,10 +316,8 @@ def write_to_file_2g(h5file, gvar1, gdata1, gvar2, gdata2, svar=0, sdata=0):
         del h5file[gvar1]
     if gvar2 in h5file.keys():
         del h5file[gvar2]
-    h5file.create_dataset(gvar1, data=gdata1, dtype=np.float32,
-                          compression='gzip')
-    h5file.create_dataset(gvar2, data=gdata2, dtype=np.float32,
-                          compression='gzip')
+    create_grid(h5file, gvar1, gdata1)
+    create_grid(h5file, gvar2, gdata2)
     if svar:
         stnsdir = 'stns'
         datapath = '%s/%s' % (stnsdir, svar)
@@ -194,4 +345,185 @@ def get_stn_lists(path, year, var):
     f.close()
     return contents
 
+
+def indicator(name, grid, method, outvars, nd=0, thresh=0.0, tbase=0.0,
+              sign=1.0, reset=(1, 1), stns='window'):
+    """
+    defines one climatological indicator for process_NCEI_03.py
+    - the daily input field is sign * (grid_<grid> - tbase)
+    - stns is 'window' (accumulated station list), 'daily' (that day's
+      input stations), the name of another indicator whose station list is
+      reused, or None (no station list is written)
+    """
+    return {'name': name, 'grid': grid, 'method': method, 'outvars': outvars,
+            'nd': nd, 'thresh': thresh, 'tbase': tbase, 'sign': sign,
+            'reset_mm': reset[0], 'reset_dd': reset[1], 'stns': stns}
+
+
+# registry of all indicators calculated by process_NCEI_03.py, in the order
+# of calculation (an indicator that reuses another's station list must
+# follow that indicator); names, outputs, and parameters are those of the
+# individual process_NCEI_03_*.py scripts
+wxcd_indicators = [
+    indicator('chill_d', 'tavg', 'season_count', ['chill_d'],
+              tbase=5.0, reset=(7, 1)),
+    indicator('chill_dd', 'tavg', 'season_sum', ['chill_dd'],
+              tbase=5.0, sign=-1.0, reset=(7, 1)),
+    indicator('grow_dd', 'tavg', 'season_sum', ['grow_dd'], tbase=5.0),
+    indicator('grow_dd_base0', 'tavg', 'season_sum', ['grow_dd_base0']),
+    indicator('tavg_frz', 'tavg', 'season_count', ['tavg_frz_days'],
+              reset=(7, 1), stns='daily'),
+    indicator('tmax_frz', 'tmax', 'season_count', ['tmax_frz_days'],
+              reset=(7, 1), stns='daily'),
+    indicator('tmin_frz', 'tmin', 'season_count', ['tmin_frz_days'],
+              reset=(7, 1), stns='daily')]
+for nd in [3, 7, 15, 30, 60, 90]:
+    wxcd_indicators.append(
+        indicator('prcp_%02dd' % nd, 'prcp', 'window_sum',
+                  ['prcp_%02dd_sum' % nd], nd=nd))
+    for tvar in ['tavg', 'tmax', 'tmin', 'vpd']:
+        if tvar == 'vpd':
+            stns = None
+        else:
+            stns = 'window'
+        wxcd_indicators.append(
+            indicator('%s_%02dd' % (tvar, nd), tvar, 'window_mean_var',
+                      ['%s_%02dd_avg' % (tvar, nd),
+                       '%s_%02dd_var' % (tvar, nd)], nd=nd, stns=stns))
+for thresh, label in [(0.0, 'nd0'), (1.0, 'nd10'), (2.5, 'nd25')]:
+    wxcd_indicators.append(
+        indicator('prcp_90d_%s' % label, 'prcp', 'window_count',
+                  ['prcp_90d_%s_sum' % label], nd=90, thresh=thresh,
+                  stns='prcp_90d'))
+for nd in [120, 180]:
+    wxcd_indicators.append(
+        indicator('prcp_%dd' % nd, 'prcp', 'window_sum',
+                  ['prcp_%dd_sum' % nd], nd=nd))
+wxcd_indicators.append(
+    indicator('prcp_365d', 'prcp', 'window_sum', ['prcp_365d_sum'], nd=365))
+
+
+def get_indicators(names=0):
+    """
+    returns registered indicators, all of them or only those named
+    """
+    if names == 0:
+        return list(wxcd_indicators)
+    inds = [ind for ind in wxcd_indicators if ind['name'] in names]
+    found = [ind['name'] for ind in inds]
+    for ind in inds:
+        if ind['stns'] not in ['window', 'daily', None]:
+            if ind['stns'] not in found:
+                message('note: %s station list comes from %s, adding it' %
+                        (ind['name'], ind['stns']))
+                return get_indicators(list(names) + [ind['stns']])
+    return inds
+
+
+def init_indicator(ind, nrows, ncols, var_cube=0, mmap_path=0):
+    """
+    establishes the rolling accounting variable(s) for one indicator
+    - rolling windows are memory-mapped in directory mmap_path if given
+    """
+    state = {}
+    if ind['method'] in ['season_count', 'season_sum']:
+        state[ind['name'] + '_prev'] = np.zeros((nrows, ncols))
+        state[ind['name'] + '_since'] = 0
+    else:
+        if mmap_path:
+            mmap_fname = '%s/%s.mmap' % (mmap_path, ind['name'])
+        else:
+            mmap_fname = 0
+        state[ind['name']] = \
+            ring_init(ind['nd'], nrows, ncols, var_cube,
+                      ind['method'] == 'window_mean_var', mmap_fname)
+    return state
+
+
+def update_indicator(ind, state, mm, dd, var_grid, track):
+    """
+    updates one indicator's accounting variable(s) with one day's grid
+    returns list of output grids (matching ind['outvars']) and the
+    indicator's contributing stations (empty unless ind['stns'] is
+    'window' or 'daily') from the station accounting in track
+    """
+    name = ind['name']
+    var_grid = ind['sign'] * (var_grid - ind['tbase'])
+    if ind['method'] in ['season_count', 'season_sum']:
+        if mm == ind['reset_mm'] and dd == ind['reset_dd']:
+            state[name + '_since'] = track['day']
+        if ind['method'] == 'season_count':
+            grid_var = \
+                grid_threshold_count(mm, dd, ind['reset_mm'], ind['reset_dd'],
+                                     var_grid, state[name + '_prev'])
+        else:
+            grid_var, _ = \
+                grid_threshold_accumulate(mm, dd, ind['reset_mm'],
+                                          ind['reset_dd'], var_grid,
+                                          state[name + '_prev'], [], [])
+        state[name + '_prev'] = grid_var
+        grids = [grid_var]
+        first_day = state[name + '_since']
+    elif ind['method'] == 'window_sum':
+        grid_var, state[name] = ring_sum(state[name], var_grid)
+        grids = [grid_var]
+        first_day = track['day'] - ind['nd'] + 1
+    elif ind['method'] == 'window_mean_var':
+        grid_mean, grid_var, state[name] = ring_mean_var(state[name], var_grid)
+        grids = [grid_mean, grid_var]
+        first_day = track['day'] - ind['nd'] + 1
+    elif ind['method'] == 'window_count':
+        grid_var, state[name] = \
+            ring_threshold_count(state[name], var_grid, ind['thresh'])
+        grids = [grid_var]
+        first_day = track['day'] - ind['nd'] + 1
+    if ind['stns'] == 'window':
+        stns_out = stn_track_since(track, ind['grid'], first_day)
+    elif ind['stns'] == 'daily':
+        stns_out = stn_track_since(track, ind['grid'], track['day'])
+    else:
+        stns_out = []
+    return grids, stns_out
+
+
+def write_indicator_state(h5file, ind, state):
+    """
+    saves one indicator's rolling accounting variable(s) to year-end file
+    """
+    for key in sorted(state.keys()):
+        if isinstance(state[key], dict):
+            ring_write(h5file, key, state[key])
+        elif key.endswith('_since'):
+            h5file.create_dataset(key, data=state[key])
+        else:
+            h5file.create_dataset(key, data=state[key], dtype=np.float32,
+                                  **grid_kwargs(np.shape(state[key])))
+    return
+
+
+def read_indicator_state(h5file, ind, nrows, ncols, mmap_path=0):
+    """
+    extracts one indicator's rolling accounting variable(s) from year-end file
+    (or establishes them if the indicator is not present in that file)
+    - a rolling window saved in two parts ([name]_p1 and [name]_p2, oldest
+      days first) is read into a single window
+    """
+    name = ind['name']
+    if ind['method'] in ['season_count', 'season_sum']:
+        if name + '_prev' in h5file.keys():
+            state = init_indicator(ind, nrows, ncols)
+            state[name + '_prev'] = \
+                np.copy(h5file[name + '_prev']).astype(np.float64)
+            if name + '_since' in h5file.keys():
+                state[name + '_since'] = int(np.copy(h5file[name + '_since']))
+            return state
+    elif name in h5file.keys():
+        return init_indicator(ind, nrows, ncols, h5file[name], mmap_path)
+    elif name + '_p1' in h5file.keys() and name + '_p2' in h5file.keys():
+        var_cube = np.concatenate((np.copy(h5file[name + '_p1']),
+                                   np.copy(h5file[name + '_p2'])), axis=0)
+        return init_indicator(ind, nrows, ncols, var_cube, mmap_path)
+    message('- %s not found, establishing new %s' % (name, name))
+    return init_indicator(ind, nrows, ncols, 0, mmap_path)
+
 # end process_NCEI_03_aux.py
@@ -14,7 +14,8 @@ Treat others as you would be treated. Pay it forward. Valar dohaeris.
 PURPOSE: Temporal accumulation of growing degree-days (counted from 1 Jan)
 
 DEPENDENCIES: h5py, numpy
-              'process_NCEI_03_aux' module has its own requirements
+              'process_NCEI_03_aux', 'Storage_Policy', and 'Provenance'
+                modules have their own requirements
 
 USAGE: '$ python process_NCEI_03_grow_dd.py NCEI_WLS_1983 1983 ./grids'
 
@@ -34,6 +35,8 @@ import h5py as hdf
 import numpy as np
 from process_NCEI_03_aux import get_stn_lists, write_stn_lists, \
     write_to_file, grid_threshold_accumulate
+from Storage_Policy import read_grid
+from Provenance import set_provenance
 
 
 def message(char_string):
@@ -118,7 +121,7 @@ for date in dates:
     message('extracting TAVG grid from %s' % h5infname)
     with hdf.File(h5infname, 'r') as h5infile:
         tavg_stns = np.copy(h5infile['stns/tavg_stns'])
-        tavg = np.copy(h5infile['grid_tavg'])
+        tavg = read_grid(h5infile['grid_tavg'])
     #
     year = date // 10000
     month = (date - (year * 10000)) // 100
@@ -138,12 +141,8 @@ for date in dates:
     h5outfname = '%s/%d_NCEI_grids_2.h5' % (path, date)
     message('saving grids to %s' % h5outfname)
     with hdf.File(h5outfname, 'r+') as h5outfile:
-        del h5outfile['meta/last_updated']
-        h5outfile.create_dataset('meta/last_updated',
-                                 data=datetime.datetime.now().isoformat())
-        del h5outfile['meta/at']
         outstr = 'grow_dd'
-        h5outfile.create_dataset('meta/at', data=outstr)
+        set_provenance(h5outfile, outstr)
         write_to_file(h5outfile, 'grow_dd', grid_grow_dd,
                       'grow_dd_stns', grow_dd_stns)
     message(' ')
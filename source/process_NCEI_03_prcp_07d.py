@@ -14,7 +14,8 @@ Treat others as you would be treated. Pay it forward. Valar dohaeris.
 PURPOSE: Temporal calculation of PRCP 7-day accumulation
 
 DEPENDENCIES: h5py, numpy
-              'process_NCEI_03_aux' module has its own requirements
+              'process_NCEI_03_aux', 'Storage_Policy', and 'Provenance'
+                modules have their own requirements
 
 USAGE: '$ python process_NCEI_03_prcp_07d.py NCEI_WLS_1983 1983 ./grids'
 
@@ -34,6 +35,8 @@ import h5py as hdf
 import numpy as np
 from process_NCEI_03_aux import get_stn_lists, write_stn_lists, \
     write_to_file, cube_sum
+from Storage_Policy import read_grid
+from Provenance import set_provenance
 
 
 def message(char_string):
@@ -113,7 +116,7 @@ for date in dates:
     message('extracting PRCP grid from %s' % h5infname)
     with hdf.File(h5infname, 'r') as h5infile:
         prcp_stns = np.copy(h5infile['stns/prcp_stns'])
-        prcp = np.copy(h5infile['grid_prcp'])
+        prcp = read_grid(h5infile['grid_prcp'])
     #
     year = date // 10000
     month = (date - (year * 10000)) // 100
@@ -127,12 +130,8 @@ for date in dates:
     h5outfname = '%s/%d_NCEI_grids_2.h5' % (path, date)
     message('saving grids to %s' % h5outfname)
     with hdf.File(h5outfname, 'r+') as h5outfile:
-        del h5outfile['meta/last_updated']
-        h5outfile.create_dataset('meta/last_updated',
-                                 data=datetime.datetime.now().isoformat())
-        del h5outfile['meta/at']
         outstr = 'prcp_07d'
-        h5outfile.create_dataset('meta/at', data=outstr)
+        set_provenance(h5outfile, outstr)
         write_to_file(h5outfile, 'prcp_07d_sum', grid_prcp_07d,
                       'prcp_07d_stns', prcp_07d_stns_all)
     message(' ')
@@ -14,7 +14,8 @@ Treat others as you would be treated. Pay it forward. Valar dohaeris.
 PURPOSE: Temporal calculation of PRCP 365-day accumulation
 
 DEPENDENCIES: h5py, numpy
-              'process_NCEI_03_aux' module has its own requirements
+              'process_NCEI_03_aux', 'Storage_Policy', and 'Provenance'
+                modules have their own requirements
 
 USAGE: '$ python process_NCEI_03_prcp_365d.py NCEI_WLS_1983 1983 ./grids'
 
@@ -23,7 +24,7 @@ INPUT: copied '.h5' file from process_NCEI_03_preprocess.py
 
 OUTPUT: updated daily '.h5' file with new accumulation grid
         (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_2.h5')
-        year-end '.h5' and '.pickle' files with rolling accounted variable
+        year-end '.h5' file with rolling accounted variable and stations
 """
 
 
@@ -32,8 +33,11 @@ import datetime
 import glob
 import h5py as hdf
 import numpy as np
-from process_NCEI_03_aux import get_stn_lists, write_stn_lists, \
-    write_to_file, cube_sum_parts
+from process_NCEI_03_aux import write_to_file, ring_init, ring_sum, \
+    ring_write, stn_track_init, stn_track_update, stn_track_next_day, \
+    stn_track_window, stn_track_read, stn_track_write
+from Storage_Policy import read_grid
+from Provenance import set_provenance
 
 
 def message(char_string):
@@ -69,9 +73,11 @@ else:
     NCEIfname = sys.argv[1]
 h5infname = '%s/../data/%s_processed.h5' % (path, NCEIfname)
 #
-message('reading dates information from %s' % h5infname)
+message('reading station and dates information from %s' % h5infname)
 with hdf.File(h5infname, 'r') as h5infile:
+    stn_id = np.copy(h5infile['stn_id'])
     all_dates = np.copy(h5infile['dates'])
+message('- identifiers for %d stations found' % len(stn_id))
 message('- information for %d total dates found' % len(all_dates))
 dates = sorted([j for j in all_dates if int(j // 1E4) == this_year])
 message('- processing %d dates in %d' % (len(dates), this_year))
@@ -90,14 +96,25 @@ if len(vars_files) > 0:
 # if rolling accounting variable files exist to be carried over
 # from previous year
 if use_vars_file:
-    message('extracting prcp_365d datacubes from %s' % varfname)
+    message('extracting prcp_365d datacube from %s' % varfname)
     with hdf.File(varfname, 'r') as h5infile:
         nrows = np.copy(h5infile['nrows'])
         ncols = np.copy(h5infile['ncols'])
-        prcp_365d_p1 = np.copy(h5infile['prcp_365d_p1'])
-        prcp_365d_p2 = np.copy(h5infile['prcp_365d_p2'])
-    message('extracting station lists')
-    prcp_365d_stns = get_stn_lists(path, prev_year, 'prcp_365d_stns')
+        if 'prcp_365d' in h5infile.keys():
+            prcp_365d = ring_init(365, nrows, ncols, h5infile['prcp_365d'],
+                                  False)
+        else:  # older year-end files hold the datacube in two parts
+            prcp_365d_cube = \
+                np.concatenate((np.copy(h5infile['prcp_365d_p1']),
+                                np.copy(h5infile['prcp_365d_p2'])), axis=0)
+            prcp_365d = ring_init(365, nrows, ncols, prcp_365d_cube, False)
+            del prcp_365d_cube
+        message('extracting station accounting')
+        if 'stn_track' in h5infile.keys():
+            prcp_365d_stns = stn_track_read(h5infile)
+        else:
+            message('- not found, establishing new station accounting')
+            prcp_365d_stns = stn_track_init(stn_id, ['prcp'])
 else:  # otherwise, initialize the variable space(s)
     h5infname = '%s/%d_NCEI_grids_2.h5' % (path, dates[0])
     message('extracting grid information from %s' % h5infname)
@@ -105,10 +122,9 @@ else:  # otherwise, initialize the variable space(s)
         nrows = np.copy(h5infile['grid/nrows'])
         ncols = np.copy(h5infile['grid/ncols'])
     h5infile.close()
-    message('establishing prcp_365d datacubes')
-    prcp_365d_p1 = np.zeros((183, nrows, ncols))
-    prcp_365d_p2 = np.zeros((182, nrows, ncols))
-    prcp_365d_stns = []
+    message('establishing prcp_365d datacube')
+    prcp_365d = ring_init(365, nrows, ncols, 0, False)
+    prcp_365d_stns = stn_track_init(stn_id, ['prcp'])
 message(' ')
 #
 for date in dates:
@@ -116,27 +132,24 @@ for date in dates:
     message('extracting PRCP grid from %s' % h5infname)
     with hdf.File(h5infname, 'r') as h5infile:
         prcp_stns = np.copy(h5infile['stns/prcp_stns'])
-        prcp = np.copy(h5infile['grid_prcp'])
+        prcp = read_grid(h5infile['grid_prcp'])
     #
     year = date // 10000
     month = (date - (year * 10000)) // 100
     day = date - (year * 10000) - (month * 100)
     #
-    grid_prcp_365d, prcp_365d_stns_all, prcp_365d_p1, prcp_365d_p2, \
-        prcp_365d_stns = cube_sum_parts(365, prcp_365d_p1, prcp_365d_p2,
-                                        prcp, prcp_365d_stns, prcp_stns)
+    grid_prcp_365d, prcp_365d = ring_sum(prcp_365d, prcp)
+    prcp_365d_stns = stn_track_next_day(prcp_365d_stns)
+    prcp_365d_stns = stn_track_update(prcp_365d_stns, 'prcp', prcp_stns)
+    prcp_365d_stns_all = stn_track_window(prcp_365d_stns, 'prcp', 365)
     message('- calculated updated 365-day running precipitation total, \
             mean %.1f' % np.mean(grid_prcp_365d))
     #
     h5outfname = '%s/%d_NCEI_grids_2.h5' % (path, date)
     message('saving grids to %s' % h5outfname)
     with hdf.File(h5outfname, 'r+') as h5outfile:
-        del h5outfile['meta/last_updated']
-        h5outfile.create_dataset('meta/last_updated',
-                                 data=datetime.datetime.now().isoformat())
-        del h5outfile['meta/at']
         outstr = 'prcp_365d'
-        h5outfile.create_dataset('meta/at', data=outstr)
+        set_provenance(h5outfile, outstr)
         write_to_file(h5outfile, 'prcp_365d_sum', grid_prcp_365d,
                       'prcp_365d_stns', prcp_365d_stns_all)
     message(' ')
@@ -147,12 +160,8 @@ message('saving variable datacube to %s' % varfname)
 with hdf.File(varfname, 'w') as h5outfile:
     h5outfile.create_dataset('nrows', data=nrows)
     h5outfile.create_dataset('ncols', data=ncols)
-    h5outfile.create_dataset('prcp_365d_p1', data=prcp_365d_p1,
-                             dtype=np.float32, compression='gzip')
-    h5outfile.create_dataset('prcp_365d_p2', data=prcp_365d_p2,
-                             dtype=np.float32, compression='gzip')
-message('saving station lists')
-write_stn_lists(path, this_year, 'prcp_365d_stns', prcp_365d_stns)
+    ring_write(h5outfile, 'prcp_365d', prcp_365d)
+    stn_track_write(h5outfile, prcp_365d_stns)
 #
 message('process_NCEI_03_prcp_365d.py completed at %s' %
         datetime.datetime.now().isoformat())
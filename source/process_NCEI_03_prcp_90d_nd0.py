@@ -15,7 +15,8 @@ PURPOSE: Temporal calculation of PRCP 90-day accumulation of number of days
          with P > 0
 
 DEPENDENCIES: h5py, numpy
-              'process_NCEI_03_aux' module has its own requirements
+              'process_NCEI_03_aux', 'Storage_Policy', and 'Provenance'
+                modules have their own requirements
 
 USAGE: '$ python process_NCEI_03_prcp_90d_nd0.py NCEI_WLS_1983 1983 ./grids'
 
@@ -34,6 +35,8 @@ import glob
 import h5py as hdf
 import numpy as np
 from process_NCEI_03_aux import write_to_file, cube_threshold_count
+from Storage_Policy import read_grid
+from Provenance import set_provenance
 
 
 def message(char_string):
@@ -111,7 +114,7 @@ for date in dates:
     message('extracting PRCP grid from %s' % h5infname)
     with hdf.File(h5infname, 'r') as h5infile:
         prcp_90d_stns = np.copy(h5infile['stns/prcp_90d_stns'])
-        prcp = np.copy(h5infile['grid_prcp'])
+        prcp = read_grid(h5infile['grid_prcp'])
     #
     year = date // 10000
     month = (date - (year * 10000)) // 100
@@ -125,12 +128,8 @@ for date in dates:
     h5outfname = '%s/%d_NCEI_grids_2.h5' % (path, date)
     message('saving grids to %s' % h5outfname)
     with hdf.File(h5outfname, 'r+') as h5outfile:
-        del h5outfile['meta/last_updated']
-        h5outfile.create_dataset('meta/last_updated',
-                                 data=datetime.datetime.now().isoformat())
-        del h5outfile['meta/at']
         outstr = 'prcp_90d_nd0'
-        h5outfile.create_dataset('meta/at', data=outstr)
+        set_provenance(h5outfile, outstr)
         write_to_file(h5outfile, 'prcp_90d_nd0_sum', grid_prcp_90d_nd0,
                       'prcp_90d_nd0_stns', prcp_90d_stns)
     message(' ')
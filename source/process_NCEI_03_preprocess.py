@@ -11,16 +11,23 @@ Send questions, bug reports, any related requests to matt.e.garcia@gmail.com
 See also 'README.md', 'DISCLAIMER.txt', 'CITATION.txt', 'ACKNOWLEDGEMENTS.txt'
 Treat others as you would be treated. Pay it forward. Valar dohaeris.
 
-PURPOSE: Copy *_grids_1.h5 files to *_grids_2.h5
+PURPOSE: Set up *_grids_2.h5 files, linked to *_grids_1.h5 files
 
 DEPENDENCIES: h5py, numpy
+              'Provenance' module has its own requirements
 
 USAGE: '$ python process_NCEI_03_preprocess.py NCEI_WLS_1983 1983 ./grids'
 
 INPUT: '.h5' output files from process_NCEI_02.py
        (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_1.h5')
 
-OUTPUT: Copied '.h5' files (1 / day)
+NOTES: Instead of a full copy, each new file has its own copy of the small
+       'meta/' items and HDF5 external links to the grids, grid definition,
+       and station lists of the '_grids_1.h5' file (which must stay in the
+       same directory), so the process_NCEI_03 scripts write only their new
+       indicators to it and the daily input grids are not duplicated
+
+OUTPUT: Linked '.h5' files (1 / day)
         (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_2.h5')
 """
 
@@ -30,6 +37,7 @@ import sys
 import datetime
 import h5py as hdf
 import numpy as np
+from Provenance import set_provenance, set_text_attr, text_sizes
 
 
 def message(char_string):
@@ -41,6 +49,31 @@ def message(char_string):
     return
 
 
+def link_grid_file(h5infname, h5outfname):
+    """
+    makes a new daily file with the metadata of the input file and links to
+    all of its other items; station lists are linked one at a time, since
+    the 'stns' group gets the new station lists of the indicators
+    """
+    h5inlink = os.path.basename(h5infname)
+    with hdf.File(h5infname, 'r') as h5infile:
+        with hdf.File(h5outfname, 'w') as h5outfile:
+            for key in h5infile.keys():
+                if key == 'meta':
+                    h5infile.copy('meta', h5outfile)
+                    set_text_attr(h5outfile['meta'].attrs, 'filename',
+                                  h5outfile.filename, text_sizes['filename'])
+                elif key == 'stns':
+                    for stnkey in h5infile['stns'].keys():
+                        stnpath = 'stns/%s' % stnkey
+                        h5outfile[stnpath] = hdf.ExternalLink(h5inlink,
+                                                              stnpath)
+                else:
+                    h5outfile[key] = hdf.ExternalLink(h5inlink, key)
+            set_provenance(h5outfile, 'process_NCEI_03_preprocess.py')
+    return
+
+
 message(' ')
 message('process_NCEI_03_preprocess.py started at %s' %
         datetime.datetime.now().isoformat())
@@ -73,13 +106,12 @@ dates = sorted([j for j in all_dates if int(j // 1E4) == this_year])
 message('- processing %d dates in %d' % (len(dates), this_year))
 message(' ')
 #
-message('copying grid files')
+message('linking grid files')
 for date in dates:
     h5infname = '%s/%d_NCEI_grids_1.h5' % (path, date)
     message('%s' % h5infname)
     h5outfname = '%s/%d_NCEI_grids_2.h5' % (path, date)
-    cmdstring = 'cp %s %s' % (h5infname, h5outfname)
-    os.system(cmdstring)
+    link_grid_file(h5infname, h5outfname)
     message('--> %s' % h5outfname)
 #
 message(' ')
@@ -14,7 +14,8 @@ Treat others as you would be treated. Pay it forward. Valar dohaeris.
 PURPOSE: Temporal calculation of VPD 30-day mean and variance
 
 DEPENDENCIES: h5py, numpy
-              'process_NCEI_03_aux' module has its own requirements
+              'process_NCEI_03_aux', 'Storage_Policy', and 'Provenance'
+                modules have their own requirements
 
 USAGE: 'python process_NCEI_03_vpd_30d.py NCEI_WLS_1983 1983 ./grids'
 
@@ -33,6 +34,8 @@ import glob
 import h5py as hdf
 import numpy as np
 from process_NCEI_03_aux import write_to_file_2g, cube_mean_var_ns
+from Storage_Policy import read_grid
+from Provenance import set_provenance
 
 
 def message(char_string):
@@ -108,7 +111,7 @@ for date in dates:
     h5infname = '%s/%d_NCEI_grids_2.h5' % (path, date)
     message('extracting VPD grid from %s' % h5infname)
     with hdf.File(h5infname, 'r') as h5infile:
-        vpd = np.copy(h5infile['grid_vpd'])
+        vpd = read_grid(h5infile['grid_vpd'])
     #
     year = date // 10000
     month = (date - (year * 10000)) // 100
@@ -122,11 +125,7 @@ for date in dates:
     h5outfname = '%s/%d_NCEI_grids_2.h5' % (path, date)
     message('saving grids to %s' % h5outfname)
     with hdf.File(h5outfname, 'r+') as h5outfile:
-        del h5outfile['meta/last_updated']
-        h5outfile.create_dataset('meta/last_updated',
-                                 data=datetime.datetime.now().isoformat())
-        del h5outfile['meta/at']
-        h5outfile.create_dataset('meta/at', data='vpd_30d')
+        set_provenance(h5outfile, 'vpd_30d')
         write_to_file_2g(h5outfile, 'vpd_30d_avg', grid_vpd_30d_mean,
                          'vpd_30d_var', grid_vpd_30d_var)
     message(' ')
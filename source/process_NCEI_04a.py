@@ -19,12 +19,15 @@ PURPOSE: Aggregating grids for specific dates and time periods over the
 
 DEPENDENCIES: h5py, numpy
               'Date_Convert' module has no external requirements
+              'Grid_Store' and 'Storage_Policy' modules have their own
+                requirements
 
 USAGE: '$ python process_NCEI_04a.py 1984 2013 ./grids'
 
 INPUT: '.h5' output files from process_NCEI_03.py
        (with the naming convention
-        'grids/[YYYYMMDD]_NCEI_grids_2.h5')
+        'grids/[YYYYMMDD]_NCEI_grids_2.h5',
+        or the annual grid stores 'grids/[YYYY]_NCEI_grid_store.h5')
 
 OUTPUT: '.h5' file with aggregated grid datacubes
         (with the naming convention
@@ -34,10 +37,11 @@ OUTPUT: '.h5' file with aggregated grid datacubes
 
 import sys
 import datetime
-import glob
 import h5py as hdf
 import numpy as np
-from Date_Convert import date_to_doy
+from Date_Convert import date_to_doy, doy_to_date
+from Grid_Store import find_grid_files, read_day_grids
+from Storage_Policy import grid_kwargs
 
 
 def message(char_string):
@@ -49,22 +53,21 @@ def message(char_string):
     return
 
 
-def getgrids(fname, nr, nc, invars, n=0):
+def getgrids(date, nr, nc, invars, n=0):
     if n == 0:
         nvars = len(invars)
     else:
         nvars = n
     grids = np.zeros((nvars, nr, nc))
-    with hdf.File(fname, 'r') as h5file:
-        for k, var in enumerate(invars):
-            grids[k, :, :] = np.copy(h5file[var])
+    day_grids = read_day_grids(path, date, invars[:nvars])
+    for k, var in enumerate(invars[:nvars]):
+        grids[k, :, :] = day_grids[var]
     return grids
 
 
-def getpgrid(fname, nr, nc):
+def getpgrid(date, nr, nc):
     grid = np.zeros((nr, nc))
-    with hdf.File(fname, 'r') as h5file:
-        grid[:, :] = np.copy(h5file['prcp_365d_sum'])
+    grid[:, :] = read_day_grids(path, date, ['prcp_365d_sum'])['prcp_365d_sum']
     return grid
 
 
@@ -72,7 +75,7 @@ def write_to_file(h5file, gvar, gdata):
     if gvar in h5file.keys():
         del h5file[gvar]
     h5file.create_dataset(gvar, data=gdata, dtype=np.float32,
-                          compression='gzip')
+                          **grid_kwargs(np.shape(gdata)))
     message('- %s %s' % (gvar, str(gdata.shape)))
     return
 
@@ -103,7 +106,7 @@ date_aequinox = 922
 date_wsolstice = 1221
 date_eoy = 1231
 #
-wxlist = glob.glob('%s/*_NCEI_grids_2.h5' % path)
+wxlist = find_grid_files(path)
 message('found %d weather derivative grid files' % len(wxlist))
 message(' ')
 #
@@ -207,10 +210,9 @@ for j, year in enumerate(years):
     #
     # winter grids ending at spring equinox (VEQ)
     doy_vequinox = date_to_doy(year, date_vequinox)
-    filename = '%s/%d%d_NCEI_grids_2.h5' % \
-        (path, year, str(doy_vequinox).zfill(4))
-    message('- vernal equinox (%s)' % filename)
-    grids_at_veq = getgrids(filename, nrows, ncols, inputgridvars)
+    date = year * 10000 + date_vequinox
+    message('- vernal equinox (%d)' % date)
+    grids_at_veq = getgrids(date, nrows, ncols, inputgridvars)
     for i, var in enumerate(inputgridvars):
         inputgrids_at_veq[i, j, :, :] = grids_at_veq[i, :, :]
         message('-- %d %s mean %.1f' %
@@ -218,10 +220,9 @@ for j, year in enumerate(years):
     #
     # spring grids ending at summer solstice (SSOL)
     doy_ssolstice = date_to_doy(year, date_ssolstice)
-    filename = '%s/%d%d_NCEI_grids_2.h5' % \
-        (path, year, str(doy_ssolstice).zfill(4))
-    message('- summer solstice (%s)' % filename)
-    grids_at_ssol = getgrids(filename, nrows, ncols, inputgridvars)
+    date = year * 10000 + date_ssolstice
+    message('- summer solstice (%d)' % date)
+    grids_at_ssol = getgrids(date, nrows, ncols, inputgridvars)
     for i, var in enumerate(inputgridvars):
         inputgrids_at_ssol[i, j, :, :] = grids_at_ssol[i, :, :]
         message('-- %d %s mean %.1f' %
@@ -229,10 +230,9 @@ for j, year in enumerate(years):
     #
     # summer grids ending at autumnal equinox (AEQ)
     doy_aequinox = date_to_doy(year, date_aequinox)
-    filename = '%s/%d%d_NCEI_grids_2.h5' % \
-        (path, year, str(doy_aequinox).zfill(4))
-    message('- autumnal equinox (%s)' % filename)
-    grids_at_aeq = getgrids(filename, nrows, ncols, inputgridvars)
+    date = year * 10000 + date_aequinox
+    message('- autumnal equinox (%d)' % date)
+    grids_at_aeq = getgrids(date, nrows, ncols, inputgridvars)
     for i, var in enumerate(inputgridvars):
         inputgrids_at_aeq[i, j, :, :] = grids_at_aeq[i, :, :]
         message('-- %d %s mean %.1f' %
@@ -240,10 +240,9 @@ for j, year in enumerate(years):
     #
     # autumn grids ending at winter solstice (WSOL)
     doy_wsolstice = date_to_doy(year, date_wsolstice)
-    filename = '%s/%d%d_NCEI_grids_2.h5' % \
-        (path, year, str(doy_wsolstice).zfill(4))
-    message('- winter solstice (%s)' % filename)
-    grids_at_wsol = getgrids(filename, nrows, ncols, inputgridvars)
+    date = year * 10000 + date_wsolstice
+    message('- winter solstice (%d)' % date)
+    grids_at_wsol = getgrids(date, nrows, ncols, inputgridvars)
     for i, var in enumerate(inputgridvars):
         inputgrids_at_wsol[i, j, :, :] = grids_at_wsol[i, :, :]
         message('-- %d %s mean %.1f' %
@@ -337,9 +336,9 @@ for j, year in enumerate(years):
     #
     # full-year precip ending with calendar year (EOY)
     doy_eoy = date_to_doy(year, date_eoy)
-    filename = '%s/%d%d_NCEI_grids_2.h5' % (path, year, str(doy_eoy).zfill(4))
-    message('- end of year (%s)' % filename)
-    grids_prcp_365d_at_eoy[j, :, :] = getpgrid(filename, nrows, ncols)
+    date = year * 10000 + date_eoy
+    message('- end of year (%d)' % date)
+    grids_prcp_365d_at_eoy[j, :, :] = getpgrid(date, nrows, ncols)
     message('-- %d prcp_365d_at_eoy mean %.1f' %
             (year, np.mean(grids_prcp_365d_at_eoy[j, :, :])))
     message(' ')
@@ -464,8 +463,8 @@ for j in range(0, nyears):
     last_grid_cd = np.zeros((nrows, ncols))
     # search through a specific 90-day window
     for doy in range(doy_vequinox, doy_ssolstice):
-        filename = '%s/%d%d_NCEI_grids_2.h5' % (path, year, str(doy).zfill(4))
-        grids_at_doy = getgrids(filename, nrows, ncols, inputgridvars, 5)
+        date = year * 10000 + doy_to_date(year, doy)
+        grids_at_doy = getgrids(date, nrows, ncols, inputgridvars, 5)
         grid_cd = grids_at_doy[0, :, :]
         grid_cdd = grids_at_doy[1, :, :]
         grid_gdd = grids_at_doy[2, :, :]
@@ -518,8 +517,8 @@ for j in range(0, nyears):
     last_grid_tmin_frz = np.zeros((nrows, ncols))
     # search through a specific 90-day window
     for doy in range(doy_wsolstice - 30, doy_aequinox - 30, -1):
-        filename = '%s/%d%d_NCEI_grids_2.h5' % (path, year, str(doy).zfill(4))
-        grids_at_doy = getgrids(filename, nrows, ncols, inputgridvars, 5)
+        date = year * 10000 + doy_to_date(year, doy)
+        grids_at_doy = getgrids(date, nrows, ncols, inputgridvars, 5)
         grid_cd = grids_at_doy[0, :, :]
         grid_cdd = grids_at_doy[1, :, :]
         grid_gdd = grids_at_doy[2, :, :]
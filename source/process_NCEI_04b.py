@@ -15,6 +15,7 @@ PURPOSE: Calculating statistics (mean/stdev/trend/p-value over analysis period)
          for aggregated climatological grids. Numerous variables are addressed.
 
 DEPENDENCIES: h5py, numpy, scipy.stats
+              'Storage_Policy' module has its own requirements
 
 USAGE: '$ python process_NCEI_04b.py 1984 2013 ./analyses'
 
@@ -31,6 +32,7 @@ import datetime
 import h5py as hdf
 import numpy as np
 from scipy.stats import pearsonr
+from Storage_Policy import grid_kwargs
 
 
 def message(char_string):
@@ -53,7 +55,7 @@ def write_to_file(h5file, gvar, gdata):
     if gvar in h5file.keys():
         del h5file[gvar]
     h5file.create_dataset(gvar, data=gdata, dtype=np.float32,
-                          compression='gzip')
+                          **grid_kwargs(np.shape(gdata)))
     message('- saved %s %s' % (gvar, str(gdata.shape)))
     return
 
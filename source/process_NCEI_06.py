@@ -15,11 +15,14 @@ PURPOSE: Summarizing key meteorological variables on a daily basis
 
 DEPENDENCIES: h5py, numpy
               'Date_Convert' module has no external requirements
+              'Grid_Store' and 'Storage_Policy' modules have their own
+                requirements
 
 USAGE: '$ python process_NCEI_06.py 1984 2013 ./grids'
 
 INPUT: '.h5' output from process_NCEI_03.py
-       (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_2.h5')
+       (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_2.h5',
+        or the annual grid stores 'grids/[YYYY]_NCEI_grid_store.h5')
 
 OUTPUT: New '.csv' files with daily time series (7 variables)
         (not sure if we need these any longer)
@@ -31,10 +34,11 @@ OUTPUT: New '.csv' files with daily time series (7 variables)
 
 import sys
 import datetime
-import glob
 import h5py as hdf
 import numpy as np
 from Date_Convert import doy_to_date
+from Grid_Store import find_grid_files, read_day_grids
+from Storage_Policy import grid_kwargs
 
 
 def message(char_string):
@@ -50,7 +54,7 @@ def write_to_file(h5file, gvar, gdata):
     if gvar in h5file.keys():
         del h5file[gvar]
     h5file.create_dataset(gvar, data=gdata, dtype=np.float32,
-                          compression='gzip')
+                          **grid_kwargs(np.shape(gdata)))
     message('- %s %s' % (gvar, str(gdata.shape)))
     return
 
@@ -80,7 +84,7 @@ doy_end = 365
 doys = np.arange(doy_begin, doy_end + 1).astype(int)
 ndoys = len(doys)
 #
-wxlist = glob.glob('%s/*_NCEI_grids_2.h5' % path)
+wxlist = find_grid_files(path)
 message('found %d weather derivative grid files' % len(wxlist))
 message(' ')
 #
@@ -103,22 +107,18 @@ for j, year in enumerate(years):
     message('processing grids for %d' % year)
     for i, doy in enumerate(doys):
         mmdd = doy_to_date(year, doy)
-        filename = '%s/%d%d_NCEI_grids_2.h5' % (path, year, str(mmdd).zfill(4))
-        with hdf.File(filename, 'r') as h5infile:
-            grid_prcp = np.copy(h5infile['grid_prcp'])
-            prcp_by_year_doy[j, i] = np.mean(grid_prcp)
-            grid_tmin = np.copy(h5infile['grid_tmin'])
-            tmin_by_year_doy[j, i] = np.mean(grid_tmin)
-            grid_tmax = np.copy(h5infile['grid_tmax'])
-            tmax_by_year_doy[j, i] = np.mean(grid_tmax)
-            grid_tavg = np.copy(h5infile['grid_tavg'])
-            tavg_by_year_doy[j, i] = np.mean(grid_tavg)
-            grid_cd = np.copy(h5infile['chill_d'])
-            cd_by_year_doy[j, i] = np.mean(grid_cd)
-            grid_cdd = np.copy(h5infile['chill_dd'])
-            cdd_by_year_doy[j, i] = np.mean(grid_cdd)
-            grid_gdd = np.copy(h5infile['grow_dd'])
-            gdd_by_year_doy[j, i] = np.mean(grid_gdd)
+        date = int('%d%s' % (year, str(mmdd).zfill(4)))
+        day_grids = read_day_grids(path, date,
+                                   ['grid_prcp', 'grid_tmin', 'grid_tmax',
+                                    'grid_tavg', 'chill_d', 'chill_dd',
+                                    'grow_dd'])
+        prcp_by_year_doy[j, i] = np.mean(day_grids['grid_prcp'])
+        tmin_by_year_doy[j, i] = np.mean(day_grids['grid_tmin'])
+        tmax_by_year_doy[j, i] = np.mean(day_grids['grid_tmax'])
+        tavg_by_year_doy[j, i] = np.mean(day_grids['grid_tavg'])
+        cd_by_year_doy[j, i] = np.mean(day_grids['chill_d'])
+        cdd_by_year_doy[j, i] = np.mean(day_grids['chill_dd'])
+        gdd_by_year_doy[j, i] = np.mean(day_grids['grow_dd'])
 message(' ')
 #
 outfile = '%s/../analyses/%d-%d_clim_values_by_doy.h5' % \
@@ -21,7 +21,8 @@ USAGE: '$ python process_NCEI_08.py EPA_L4_Ecoregions_WLS_UTM15N ./data'
 
 INPUT: '.bil' raster map of ecoregions with corresponding '.hdr' header
        At least one '.h5' output file from process_NCEI_03.py
-       (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_2.h5')
+       (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_2.h5',
+        or the annual grid stores 'grids/[YYYY]_NCEI_grid_store.h5')
 
 OUTPUT: 'clipped_ecoregions.h5' in data folder
 """
@@ -29,12 +30,12 @@ OUTPUT: 'clipped_ecoregions.h5' in data folder
 
 import sys
 import datetime
-import glob
 import h5py as hdf
 import numpy as np
 import scipy.ndimage.interpolation
 from Read_Header_Files import get_bil_hdr_info
 from Plots import masked_map_plot_geo
+from Grid_Store import find_grid_files
 
 
 def message(char_string):
@@ -66,7 +67,7 @@ EPAhdrfile = '%s/%s.hdr' % (path, EPAfile)
 EPAbilfile = '%s/%s.bil' % (path, EPAfile)
 #
 # get working area size/shape/location from a weather derivatives files
-wxlist = glob.glob('%s/../grids/*_NCEI_grids_2.h5' % path)
+wxlist = find_grid_files('%s/../grids' % path)
 message('found %d weather derivative grid files' % len(wxlist))
 message(' ')
 UTM_bounds = []
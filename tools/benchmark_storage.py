@@ -0,0 +1,182 @@
+"""
+Python script 'benchmark_storage.py'
+by Matthew Garcia, PhD student
+Dept. of Forest and Wildlife Ecology
+University of Wisconsin - Madison
+matt.e.garcia@gmail.com
+
+Copyright (C) 2015-2016 by Matthew Garcia
+Licensed Gnu GPL v3; see 'LICENSE_GnuGPLv3.txt' for complete terms
+Send questions, bug reports, any related requests to matt.e.garcia@gmail.com
+See also 'README.md', 'DISCLAIMER.txt', 'CITATION.txt', 'ACKNOWLEDGEMENTS.txt'
+Treat others as you would be treated. Pay it forward. Valar dohaeris.
+
+PURPOSE: Compare the storage codecs and chunk layouts of 'Storage_Policy' on
+         a sample of daily grids: write and read throughput and compression
+         ratio
+
+DEPENDENCIES: Some standard libraries/modules
+              The h5py module is required for handling of HDF5 files
+              The 'Grid_Store' and 'Storage_Policy' modules have their own
+                requirements
+
+USAGE: '$ python benchmark_storage.py ./grids 19840101 60 /tmp'
+       '$ python benchmark_storage.py ./grids 19840101 60 /tmp gzip,lzf'
+
+NOTES: Each codec is tried with the 'map' and 'series' chunk layouts; the
+       sample is written as one (ndays, nrows, ncols) dataset per variable
+       Read throughput is reported for whole daily grids ('map MB/s') and
+       for the full time series of 64 random grid cells ('series ms/cell')
+       With NCEI_STORAGE_QUANTIZE=1 set, the grids are written as scaled
+       int16 (see Storage_Policy.py) and unpacked as they are read; the
+       ratio is always relative to float32
+       Repeated reads of a small sample come from the operating system's
+       file cache, so use a sample larger than memory for disk-bound timing
+
+INPUT: Output files from process_NCEI_03.py script in '.h5' format
+       (daily grid files 'grids/[YYYYMMDD]_NCEI_grids_2.h5' or annual grid
+        stores 'grids/[YYYY]_NCEI_grid_store.h5')
+       Optional comma-separated list of codecs (default: all available)
+
+OUTPUT: Table of results to the terminal
+        Scratch file '[scratch]/benchmark_storage.h5' (deleted when done)
+"""
+
+
+import os
+import sys
+import time
+import datetime
+import h5py as hdf
+import numpy as np
+from Grid_Store import have_day_grids, read_day_grids
+from Storage_Policy import storage_codecs, create_grid, decode_grid
+
+
+def message(char_string):
+    """
+    prints a string to the terminal and flushes the buffer
+    """
+    print char_string
+    sys.stdout.flush()
+    return
+
+
+def get_sample(path, start, ndays, names):
+    """
+    returns a dict of (ndays, nrows, ncols) cubes of the named grids for
+    the dates with grids from start onward
+    """
+    start_date = datetime.datetime.strptime(str(start), '%Y%m%d')
+    dates = []
+    for i in range(ndays):
+        date = int((start_date +
+                    datetime.timedelta(days=i)).strftime('%Y%m%d'))
+        if have_day_grids(path, date):
+            dates.append(date)
+    sample = {}
+    for name in names:
+        sample[name] = np.array([read_day_grids(path, date, [name])[name]
+                                 for date in dates], dtype=np.float32)
+    return dates, sample
+
+
+def benchmark(fname, sample, layout, codec, cells):
+    """
+    writes and reads back the sample with one codec and layout, returning
+    the write and whole-grid read throughput [MB/s], the time series read
+    time [ms/cell], and the compression ratio
+    """
+    nbytes = sum([cube.nbytes for cube in sample.values()])
+    t0 = time.time()
+    with hdf.File(fname, 'w') as h5file:
+        for name in sorted(sample.keys()):
+            create_grid(h5file, name, sample[name], layout=layout,
+                        codec=codec)
+    t_write = time.time() - t0
+    ratio = nbytes / float(os.path.getsize(fname))
+    t0 = time.time()
+    with hdf.File(fname, 'r') as h5file:
+        for name in sorted(sample.keys()):
+            dset = h5file[name]
+            for i in range(dset.shape[0]):
+                decode_grid(dset, dset[i, :, :])
+    t_map = time.time() - t0
+    t0 = time.time()
+    with hdf.File(fname, 'r') as h5file:
+        for name in sorted(sample.keys()):
+            dset = h5file[name]
+            for row, col in cells:
+                decode_grid(dset, dset[:, row, col])
+    t_series = time.time() - t0
+    os.remove(fname)
+    mb = nbytes / 1048576.0
+    return (mb / max(t_write, 1.0e-6), mb / max(t_map, 1.0e-6),
+            1000.0 * t_series / (len(cells) * len(sample)), ratio)
+
+
+message(' ')
+message('benchmark_storage.py started at %s' %
+        datetime.datetime.now().isoformat())
+message(' ')
+#
+if len(sys.argv) < 6:
+    codecs = storage_codecs()
+else:
+    codecs = sys.argv[5].split(',')
+#
+if len(sys.argv) < 5:
+    message('input warning: no scratch directory indicated, using ./')
+    scratch = '.'
+else:
+    scratch = sys.argv[4]
+#
+if len(sys.argv) < 4:
+    message('input warning: no sample length indicated, using 30 days')
+    ndays = 30
+else:
+    ndays = int(sys.argv[3])
+#
+if len(sys.argv) < 3:
+    message('need grids directory and first date of sample')
+    sys.exit(1)
+else:
+    path = sys.argv[1]
+    start = int(sys.argv[2])
+#
+names = ['grid_prcp', 'grid_tmax', 'grid_tmin', 'grid_tavg', 'grid_vpd']
+message('reading %s from up to %d days of grids from %d in %s' %
+        (str(names), ndays, start, path))
+dates, sample = get_sample(path, start, ndays, names)
+if len(dates) == 0:
+    message('no grids found for that sample')
+    sys.exit(1)
+nrows, ncols = sample[names[0]].shape[1:]
+nbytes = sum([cube.nbytes for cube in sample.values()])
+message('- %d dates of %d x %d grids (%.1f MB uncompressed)' %
+        (len(dates), nrows, ncols, nbytes / 1048576.0))
+message(' ')
+#
+np.random.seed(0)
+cells = zip(np.random.randint(0, nrows, 64), np.random.randint(0, ncols, 64))
+fname = '%s/benchmark_storage.h5' % scratch
+message('%-12s %-7s %10s %10s %15s %7s' %
+        ('codec', 'layout', 'write MB/s', 'map MB/s', 'series ms/cell',
+         'ratio'))
+for codec in codecs:
+    for layout in ['map', 'series']:
+        try:
+            results = benchmark(fname, sample, layout, codec, cells)
+        except (ImportError, ValueError) as err:
+            message('%-12s %-7s %s' % (codec, layout, str(err)))
+            continue
+        message('%-12s %-7s %10.1f %10.1f %15.2f %7.2f' %
+                ((codec, layout) + results))
+#
+message(' ')
+message('benchmark_storage.py completed at %s' %
+        datetime.datetime.now().isoformat())
+message(' ')
+sys.exit(0)
+
+# end benchmark_storage.py
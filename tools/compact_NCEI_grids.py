@@ -0,0 +1,177 @@
+"""
+Python script 'compact_NCEI_grids.py'
+by Matthew Garcia, PhD student
+Dept. of Forest and Wildlife Ecology
+University of Wisconsin - Madison
+matt.e.garcia@gmail.com
+
+Copyright (C) 2015-2016 by Matthew Garcia
+Licensed Gnu GPL v3; see 'LICENSE_GnuGPLv3.txt' for complete terms
+Send questions, bug reports, any related requests to matt.e.garcia@gmail.com
+See also 'README.md', 'DISCLAIMER.txt', 'CITATION.txt', 'ACKNOWLEDGEMENTS.txt'
+Treat others as you would be treated. Pay it forward. Valar dohaeris.
+
+PURPOSE: Compact existing '.h5' grid files (the equivalent of h5repack),
+         recovering the free space left by deleted and recreated datasets
+
+DEPENDENCIES: Some standard libraries/modules
+              The h5py module is required for handling of HDF5 files
+              The 'Storage_Policy' and 'Provenance' modules have their own
+                requirements
+
+USAGE: '$ python compact_NCEI_grids.py ./grids'
+       '$ python compact_NCEI_grids.py ./grids "1984*_NCEI_grids_2.h5"'
+       '$ python compact_NCEI_grids.py ./grids all 1'
+
+NOTES: The optional 2nd argument is a file name pattern within the grids
+       directory (default or 'all': every '.h5' file)
+       The optional 3rd argument '1' also rewrites every grid and grid
+       datacube (datasets of 2 or more dimensions) with the codec and chunk
+       layout of the current storage policy (see Storage_Policy.py); data
+       types, including quantized int16 grids, are kept as they are
+       HDF5 external links (as in the linked '_grids_2.h5' files of
+       process_NCEI_03_preprocess.py) are kept as links, and each file is
+       replaced only after its compacted copy has been written completely,
+       under the same name, so links to it stay valid
+       Do not run this while another script is writing to the same files
+
+INPUT: '.h5' files in the grids directory
+
+OUTPUT: The same '.h5' files, compacted
+"""
+
+
+import os
+import sys
+import glob
+import datetime
+import h5py as hdf
+from Storage_Policy import grid_kwargs, storage_settings
+from Provenance import set_provenance
+
+
+def message(char_string):
+    """
+    prints a string to the terminal and flushes the buffer
+    """
+    print char_string
+    sys.stdout.flush()
+    return
+
+
+def copy_attrs(inobj, outobj):
+    for name in inobj.attrs:
+        outobj.attrs.create(name, inobj.attrs[name],
+                            dtype=inobj.attrs.get_id(name).dtype)
+    return
+
+
+def repack_dataset(dset, outgroup, name):
+    """
+    rewrites a grid or grid datacube with the current storage policy, one
+    grid at a time
+    """
+    if dset.maxshape == dset.shape:
+        maxshape = None
+        chunk_shape = dset.shape
+    else:
+        maxshape = dset.maxshape
+        chunk_shape = [366 if n is None else n for n in maxshape]
+    outdset = outgroup.create_dataset(name, shape=dset.shape,
+                                      maxshape=maxshape, dtype=dset.dtype,
+                                      fillvalue=dset.fillvalue,
+                                      **grid_kwargs(chunk_shape))
+    copy_attrs(dset, outdset)
+    if dset.ndim == 2:
+        outdset[...] = dset[...]
+    else:
+        for i in range(dset.shape[0]):
+            outdset[i] = dset[i]
+    return
+
+
+def copy_group(ingroup, outgroup, repack):
+    """
+    copies the contents of a group, keeping soft and external links as links
+    """
+    copy_attrs(ingroup, outgroup)
+    for key in ingroup.keys():
+        link = ingroup.get(key, getlink=True)
+        if isinstance(link, hdf.ExternalLink):
+            outgroup[key] = hdf.ExternalLink(link.filename, link.path)
+        elif isinstance(link, hdf.SoftLink):
+            outgroup[key] = hdf.SoftLink(link.path)
+        elif isinstance(ingroup[key], hdf.Group):
+            copy_group(ingroup[key], outgroup.create_group(key), repack)
+        elif repack and ingroup[key].ndim >= 2:
+            repack_dataset(ingroup[key], outgroup, key)
+        else:
+            ingroup.copy(key, outgroup, name=key)
+    return
+
+
+def compact_file(fname, repack):
+    """
+    writes a compacted copy of a '.h5' file and puts it in place of the
+    original, returning the sizes [bytes] before and after
+    """
+    size_before = os.path.getsize(fname)
+    tmpfname = '%s.compact' % fname
+    with hdf.File(fname, 'r') as h5infile:
+        with hdf.File(tmpfname, 'w') as h5outfile:
+            copy_group(h5infile, h5outfile, repack)
+            if repack:
+                params = storage_settings()
+                del params['quantize']
+                set_provenance(h5outfile, 'compact_NCEI_grids.py', params)
+    os.rename(tmpfname, fname)
+    return size_before, os.path.getsize(fname)
+
+
+message(' ')
+message('compact_NCEI_grids.py started at %s' %
+        datetime.datetime.now().isoformat())
+message(' ')
+#
+if len(sys.argv) < 4:
+    repack = 0
+else:
+    repack = int(sys.argv[3])
+#
+if len(sys.argv) < 3 or sys.argv[2] == 'all':
+    pattern = '*.h5'
+else:
+    pattern = sys.argv[2]
+#
+if len(sys.argv) < 2:
+    message('input warning: no grids directory indicated, using ./grids')
+    path = './grids'
+else:
+    path = sys.argv[1]
+#
+fnames = sorted(glob.glob('%s/%s' % (path, pattern)))
+message('compacting %d files matching %s/%s' % (len(fnames), path, pattern))
+if repack:
+    message('- rewriting grids with codec %s and layout %s' %
+            (storage_settings()['codec'], storage_settings()['layout']))
+message(' ')
+#
+total_before = 0
+total_after = 0
+for fname in fnames:
+    size_before, size_after = compact_file(fname, repack)
+    total_before += size_before
+    total_after += size_after
+    message('%s: %.2f MB --> %.2f MB' %
+            (fname, size_before / 1048576.0, size_after / 1048576.0))
+#
+message(' ')
+message('%d files: %.1f MB --> %.1f MB' %
+        (len(fnames), total_before / 1048576.0, total_after / 1048576.0))
+message(' ')
+message('compact_NCEI_grids.py completed at %s' %
+        datetime.datetime.now().isoformat())
+message(' ')
+sys.exit(0)
+
+# end compact_NCEI_grids.py
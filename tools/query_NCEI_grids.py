@@ -15,13 +15,16 @@ PURPOSE: Query grids of climatological derivatives at given locations and dates
 
 DEPENDENCIES: Some standard libraries/modules
               The h5py module is required for handling of HDF5 files
-              The 'UTM_Geo_Convert' module has its own requirements
+              The 'UTM_Geo_Convert' and 'Grid_Store' modules have their own
+                requirements
 
 USAGE: '$ python query_NCEI_grids.py locations_dates.csv'
 
 INPUT: A '.csv' file containing lat/lon/date of each query
        Output files from process_NCEI_03.py script in '.h5' format
-       (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_2.h5')
+       (with the naming convention 'grids/[YYYYMMDD]_NCEI_grids_2.h5',
+        or the annual grid stores 'grids/[YYYY]_NCEI_grid_store.h5', from
+        which only the queried grid cells are read)
 
 OUTPUT: New '.csv' file with original location/date input + several new columns
 
@@ -31,11 +34,11 @@ TO DO: add more returned variables
 
 import sys
 import datetime
-import glob
 import h5py as hdf
 import numpy as np
 import pandas as pd
-from UTM_Geo_Convert import geographic_to_utm
+from UTM_Geo_Convert import geographic_to_utm_array
+from Grid_Store import find_grid_files, have_day_grids, read_day_grids
 
 
 def message(char_string):
@@ -66,10 +69,20 @@ if len(sys.argv) < 2:
 else:
     csvfile = sys.argv[1]
 #
-wxlist = glob.glob('grids/*_NCEI_grids_2.h5')
+wxlist = find_grid_files('grids')
 message('found %d weather derivatives files' % len(wxlist))
 message(' ')
 #
+message('extracting grid info from weather derivatives file %s' % wxlist[0])
+with hdf.File(wxlist[0], 'r') as h5file:
+    wx_SEnorthing = np.copy(h5file['grid/min_y'])
+    wx_dy = np.copy(h5file['grid/dy'])
+    wx_nrows = np.copy(h5file['grid/nrows'])
+    wx_NWeasting = np.copy(h5file['grid/min_x'])
+    wx_dx = np.copy(h5file['grid/dx'])
+    wx_ncols = np.copy(h5file['grid/ncols'])
+message(' ')
+#
 message('reading %s' % csvfile)
 arr_df = pd.read_csv(csvfile)
 query_lats = arr_df['LAT'].tolist()
@@ -90,15 +103,15 @@ for i in range(0, len(query_dates)):
     datestr = '%d%s%s' % (yyyy, str(mm).zfill(2), str(dd).zfill(2))
     query_D.append(datestr)
 #
-query_E = []
-query_N = []
 UTMzone = 15
-for i in range(0, len(query_lats)):
-    UTM_coords = geographic_to_utm(query_lons[i].astype(np.float64),
-                                   query_lats[i].astype(np.float64),
-                                   UTMzone)
-    query_E.append(int(round(UTM_coords[1], 0)))
-    query_N.append(int(round(UTM_coords[2], 0)))
+# project each distinct query location only once
+query_locs, query_loc_idxs = \
+    np.unique(np.array(query_lons) + 1j * np.array(query_lats),
+              return_inverse=True)
+locs_E, locs_N = geographic_to_utm_array(query_locs.real, query_locs.imag,
+                                         UTMzone)
+query_E = [int(round(e, 0)) for e in locs_E[query_loc_idxs]]
+query_N = [int(round(n, 0)) for n in locs_N[query_loc_idxs]]
 #
 cd = []
 cdd = []
@@ -113,60 +126,43 @@ for i in range(0, len(query_D)):
     message('lat %.3f lon %.3f date %s  --> UTM zone %d E %d N %d date %s' %
             (query_lats[i], query_lons[i], query_dates[i], UTMzone, query_E[i],
              query_N[i], datestr))
-    wx_fname = 'grids/%s_NCEI_grids_2.h5' % datestr
-    if wx_fname in wxlist:
-        message('- extracting grid info from weather derivatives file %s' %
-                wx_fname)
-        with hdf.File(wx_fname, 'r') as h5file:
-            wx_SEnorthing = np.copy(h5file['grid/min_y'])
-            wx_dy = np.copy(h5file['grid/dy'])
-            wx_nrows = np.copy(h5file['grid/nrows'])
-            wx_NWeasting = np.copy(h5file['grid/min_x'])
-            wx_dx = np.copy(h5file['grid/dx'])
-            wx_ncols = np.copy(h5file['grid/ncols'])
-            #
-            query_row = ((query_N[i] - wx_SEnorthing) // wx_dy)
-            if query_row < 0:
-                message('- location is south of available grid limits')
-                continue
-            if query_row > wx_nrows:
-                message('- location is north of available grid limits')
-                continue
-            query_col = ((query_E[i] - wx_NWeasting) // wx_dx)
-            if query_col < 0:
-                message('- location is west of available grid limits')
-                continue
-            if query_col > wx_ncols:
-                message('- location is east of available grid limits')
-                continue
-            #
-            chill_d = np.copy(h5file['chill_d'])
-            chill_dd = np.copy(h5file['chill_dd'])
-            grow_dd = np.copy(h5file['grow_dd'])
-            grow_dd_base0 = np.copy(h5file['grow_dd_base0'])
-            prcp_30d = np.copy(h5file['prcp_30d_sum'])
-            prcp_90d = np.copy(h5file['prcp_90d_sum'])
-            prcp_180d = np.copy(h5file['prcp_180d_sum'])
-            prcp_365d = np.copy(h5file['prcp_365d_sum'])
+    if have_day_grids('grids', int(datestr)):
+        message('- extracting grid values for %s' % datestr)
+        query_row = ((query_N[i] - wx_SEnorthing) // wx_dy)
+        if query_row < 0:
+            message('- location is south of available grid limits')
+            continue
+        if query_row > wx_nrows:
+            message('- location is north of available grid limits')
+            continue
+        query_col = ((query_E[i] - wx_NWeasting) // wx_dx)
+        if query_col < 0:
+            message('- location is west of available grid limits')
+            continue
+        if query_col > wx_ncols:
+            message('- location is east of available grid limits')
+            continue
+        query_cell = (int(query_row), int(query_col))
+        #
+        wx = read_day_grids('grids', int(datestr),
+                            ['chill_d', 'chill_dd', 'grow_dd',
+                             'grow_dd_base0', 'prcp_30d_sum', 'prcp_90d_sum',
+                             'prcp_180d_sum', 'prcp_365d_sum'], query_cell)
         #
         if int(datestr[4:8] < 701):
-            cd.append(chill_d[query_row, query_col])
-            cdd.append(chill_dd[query_row, query_col])
+            cd.append(wx['chill_d'])
+            cdd.append(wx['chill_dd'])
         else:
-            wx_fname = 'grids/%s%s_NCEI_grids_2.h5' % (datestr[0:4], '0630')
-            with hdf.File(wx_fname, 'r') as h5file:
-                chill_d_0630 = np.copy(h5file['chill_d'])
-                chill_dd_0630 = np.copy(h5file['chill_dd'])
-            cd.append(chill_d_0630[query_row, query_col]
-                      + chill_d[query_row, query_col])
-            cdd.append(chill_dd_0630[query_row, query_col]
-                       + chill_dd[query_row, query_col])
-        gdd.append(grow_dd[query_row, query_col])
-        gdd_base0.append(grow_dd_base0[query_row, query_col])
-        p_30.append(prcp_30d[query_row, query_col])
-        p_90.append(prcp_90d[query_row, query_col])
-        p_180.append(prcp_180d[query_row, query_col])
-        p_365.append(prcp_365d[query_row, query_col])
+            wx_0630 = read_day_grids('grids', int(datestr[0:4] + '0630'),
+                                     ['chill_d', 'chill_dd'], query_cell)
+            cd.append(wx_0630['chill_d'] + wx['chill_d'])
+            cdd.append(wx_0630['chill_dd'] + wx['chill_dd'])
+        gdd.append(wx['grow_dd'])
+        gdd_base0.append(wx['grow_dd_base0'])
+        p_30.append(wx['prcp_30d_sum'])
+        p_90.append(wx['prcp_90d_sum'])
+        p_180.append(wx['prcp_180d_sum'])
+        p_365.append(wx['prcp_365d_sum'])
     else:
         cd.append('NA')
         cdd.append('NA')